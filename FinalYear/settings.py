@@ -97,6 +97,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Tests run on a file too: an in-memory database fails concurrent
+        # writers at once ("table is locked") instead of waiting for the lock
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    }
+}
+
+# Per-process memory cache. With several worker processes, point this at a
+# shared backend (Redis, Memcached) so that start/stop invalidations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -178,3 +189,30 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Kolkata'
 
+
+# Provider prediction models (mess_app/ml)
+PROVIDER_MODEL_MODE = 'provider'  # 'provider' (one model per provider) or 'global' (one model for all, see GlobalDishModel)
+PROVIDER_MODEL_CACHE_SIZE = 64  # models kept in memory per worker process
+PROVIDER_MODEL_CACHE_MAX_BYTES = 256 * 1024 * 1024  # approximate memory budget for cached models
+PROVIDER_MODEL_MMAP = os.name != 'nt'  # memory-map model files so worker processes share their pages (Windows cannot replace a mapped file)
+PROVIDER_MODEL_HISTORY_DAYS = 60  # training window read by get_historical_data_from_db
+PROVIDER_MODEL_RETRAIN_WORKERS = None  # processes used for bulk retraining (None = CPU count)
+PROVIDER_MODEL_RETRAIN_TIMEOUT = 300  # seconds per provider before bulk retraining gives up on it (Celery soft time limit / worker terminated)
+PROVIDER_MODEL_MAX_AGE_DAYS = 30  # retrain models older than this
+PROVIDER_DRIFT_MIN_SAMPLES = 4  # new meals a weekday/meal/dish-type segment needs before it is tested for drift
+PROVIDER_DRIFT_THRESHOLD = 3.0  # z-score above which a segment counts as drifted (triggers retraining)
+PROVIDER_MODEL_TUNING_FOLDS = 4  # rolling-origin folds when backtesting forest settings
+PROVIDER_MODEL_PARAM_GRID = None  # forest settings searched by tune_provider_models (None = tuning.DEFAULT_PARAM_GRID)
+PROVIDER_PREDICTION_INTERVAL_COVERAGE = 0.8  # share of tree predictions inside the reported interval
+PROVIDER_FORECAST_DAYS = 7  # days ahead precomputed by the nightly forecast task
+PROVIDER_FORECAST_TOP_DISHES = 3  # dishes ranked per forecast meal
+PROVIDER_ACCURACY_CACHE_TIMEOUT = 60 * 60  # seconds; also cleared when actuals are filled in or a model is retrained
+
+
+# QR scans (student/services.py)
+SCAN_ACTIVE_MEAL_CACHE_TIMEOUT = 60  # seconds a provider QR lookup stays cached; bounds staleness under a per-process cache
+SCAN_INGESTION_MODE = 'sync'  # 'sync' (write each scan) or 'buffered' (provisional result, batched writes; see student/scan_buffer.py)
+SCAN_BUFFER_FLUSH_MS = 200  # buffered mode: longest a scan waits before it is written
+SCAN_BUFFER_MAX_SCANS = 200  # buffered mode: flush early once this many scans are waiting
+SCAN_BATCH_MAX_SCANS = 2000  # largest offline batch a provider device may upload at once
+SCAN_BATCH_MAX_AGE = 1  # days back an offline scan may be dated (1 = today and yesterday, local time)
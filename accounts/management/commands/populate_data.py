@@ -8,6 +8,7 @@ from django.utils import timezone
 from accounts.models import User, StudentProfile, MessProviderProfile
 from provider.models import MessPlan, MenuItem, DailyMenu, MessHoliday
 from student.models import ActiveSubscription, Attendance
+from student.services import rebuild_attendance_summary
 
 # --- Configuration ---
 # You can adjust these values to change the generated data.
@@ -184,5 +185,6 @@ class Command(BaseCommand):
                         status=final_status
                     )
         
+        rebuild_attendance_summary(provider_id=provider.id)
         self.stdout.write(self.style.SUCCESS('Successfully populated the database with fake data!'))
 
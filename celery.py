@@ -14,4 +14,8 @@ app.conf.beat_schedule = {
         'task': 'mess_app.tasks.auto_retrain_provider_models',
         'schedule': crontab(hour=2, minute=0),  # Run at 2 AM daily
     },
+    'generate-attendance-forecasts-nightly': {
+        'task': 'mess_app.tasks.generate_attendance_forecasts',
+        'schedule': crontab(hour=3, minute=30),  # After the retraining run
+    },
 }
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from mess_app.management.commands.benchmark_predictions import best_of
+from mess_app.ml.dqn_recommender import WEEK_DAYS, get_dqn_recommender
+
+
+class Command(BaseCommand):
+    help = 'Benchmark DQN recommendation latency: per-dish scoring vs batched inference'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        recommender = get_dqn_recommender().load()
+        provider_dishes = [('Paneer', 'veg'), ('Biryani', 'nonveg')]
+
+        def per_dish(day, holiday, meal):
+            # One forward pass per candidate and a separate forest call, as before batching
+            scores = [recommender.q_value(day, holiday, meal, dish_type) for _, dish_type in recommender.dishes]
+            name, _ = recommender.dishes[max(range(len(scores)), key=scores.__getitem__)]
+            return recommender.predict_attendance_for_dish(day, holiday, meal, name, provider_dishes)
+
+        week = [(day, 'None', meal) for day in WEEK_DAYS for meal in ('Lunch', 'Dinner')]
+
+        self.stdout.write(f'Best of {repeat} runs:')
+        self.report('one context, per dish', best_of(lambda: per_dish('Mon', 'None', 'Lunch'), repeat))
+        self.report('one context, batched', best_of(
+            lambda: recommender.predict_best_dish('Mon', 'None', 'Lunch', provider_dishes), repeat))
+        self.report('week, per dish', best_of(lambda: [per_dish(*context) for context in week], repeat))
+        self.report('week, per context', best_of(
+            lambda: [recommender.predict_best_dish(*context, provider_dishes) for context in week], repeat))
+        self.report('week, single call', best_of(lambda: recommender.predict_week(provider_dishes), repeat))
+
+    def report(self, label, seconds):
+        self.stdout.write(f'  {label:<24} {seconds * 1000:9.2f} ms')
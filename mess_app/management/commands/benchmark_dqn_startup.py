@@ -0,0 +1,92 @@
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mess_app.ml.dqn_recommender import DQNRecommender
+
+IMPORT_SNIPPET = '''
+import sys, time
+start = time.perf_counter()
+import mess_app.ml.dqn_model
+elapsed = time.perf_counter() - start
+print(elapsed, int('torch' in sys.modules), int('sklearn' in sys.modules))
+'''
+
+# Cost of a worker's first recommendation with the given Q-network backend
+BACKEND_SNIPPET = '''
+import sys, time
+from mess_app.ml.dqn_recommender import DQNRecommender
+
+def rss_kb():
+    # Current resident set size (Linux); ru_maxrss would include the parent's peak
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+
+before = rss_kb()
+start = time.perf_counter()
+DQNRecommender(backend=sys.argv[1]).load().predict_best_dish('Mon', 'None', 'Lunch', [])
+elapsed = time.perf_counter() - start
+after = rss_kb()
+print(elapsed, after - before, after, int('torch' in sys.modules))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure import, first-use and memory cost of the DQN recommender'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        imports = [self.cold_import() for _ in range(repeat)]
+        seconds, torch_loaded, sklearn_loaded = min(imports)
+        self.stdout.write(f'  {"import dqn_model (fresh process)":<36} {seconds * 1000:9.1f} ms')
+        self.stdout.write(f'    torch imported: {bool(torch_loaded)}, sklearn imported: {bool(sklearn_loaded)}')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            fit = self.first_use(DQNRecommender(artifact_dir=tmp))
+            self.report('first use, fitting from CSV', fit)
+            load = min(self.first_use(DQNRecommender(artifact_dir=tmp)) for _ in range(repeat))
+            self.report('first use, loading artifacts', load)
+
+        for backend in ('numpy', 'torch'):
+            runs = [self.run_snippet(BACKEND_SNIPPET, backend) for _ in range(repeat)]
+            seconds, added_kb, total_kb, torch_loaded = min(runs)
+            self.report(f'first recommendation ({backend})', seconds)
+            self.stdout.write(
+                f'    resident memory: +{added_kb / 1024:.0f} MB (total {total_kb / 1024:.0f} MB), '
+                f'torch imported: {bool(int(torch_loaded))}'
+            )
+
+        recommender = DQNRecommender().load()
+        warm = min(self.timed(lambda: recommender.predict_best_dish('Mon', 'None', 'Lunch', [])) for _ in range(repeat))
+        self.report('predict_best_dish (warm)', warm)
+
+    def run_snippet(self, code, *args):
+        """Run code in a fresh interpreter and return its whitespace-separated numbers."""
+        result = subprocess.run(
+            [sys.executable, '-c', code, *args],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        return tuple(float(value) for value in result.stdout.split())
+
+    def cold_import(self):
+        seconds, torch_loaded, sklearn_loaded = self.run_snippet(IMPORT_SNIPPET)
+        return seconds, int(torch_loaded), int(sklearn_loaded)
+
+    def first_use(self, recommender):
+        return self.timed(recommender.load)
+
+    def timed(self, fn):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    def report(self, label, seconds):
+        self.stdout.write(f'  {label:<36} {seconds * 1000:9.1f} ms')
@@ -0,0 +1,95 @@
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from mess_app.ml.provider_model import ProviderDishModel
+
+SYNTHETIC_DATA = Path(__file__).resolve().parents[2] / 'ml' / 'synthetic_attendance_dataset_large_with_mealtime.csv'
+
+
+def load_synthetic_history():
+    """Synthetic attendance history in the shape returned by get_historical_data_from_db."""
+    df = pd.read_csv(SYNTHETIC_DATA, keep_default_na=False)
+    return pd.DataFrame({
+        'day_of_week': df['day_of_week'],
+        'dish_name': df['dish'],
+        'dish_type': df['dish_type'],
+        'holiday': df['holiday'].astype(str).str.capitalize(),
+        'meal_type': df['meal_time'],
+        'attended_students': df['attended_students'],
+    })
+
+
+def best_of(fn, repeat):
+    """Best wall-clock time of ``repeat`` runs, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-dish prediction cost of provider models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, help='Benchmark an existing provider model instead of a synthetic one')
+        parser.add_argument('--dishes', type=int, default=60, help='Number of candidate dishes to score')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            model = self.get_model(options['provider'], tmp)
+            rows = [
+                ('Mon', 'nonveg' if i % 3 == 0 else 'veg', 'None', 'Lunch')
+                for i in range(options['dishes'])
+            ]
+            self.run_benchmarks(model, rows, options['repeat'])
+
+    def get_model(self, provider_id, tmp):
+        if provider_id is not None:
+            model = ProviderDishModel(provider_id)
+            if model.rf_model is None:
+                raise SystemExit(f'Provider {provider_id} has no trained model')
+            return model
+
+        self.stdout.write('Training throwaway model on synthetic data...')
+        model = ProviderDishModel(0, model_dir=tmp)
+        model.train(load_synthetic_history())
+        return model
+
+    def report(self, label, seconds, n):
+        self.stdout.write(f'  {label:<32} {seconds * 1000:9.2f} ms total  {seconds / n * 1e6:9.1f} us/dish')
+
+    def run_benchmarks(self, model, rows, repeat):
+        n = len(rows)
+        self.stdout.write(f'Scoring {n} dishes (best of {repeat}):')
+
+        per_dish = best_of(lambda: [model.predict(*row) for row in rows], repeat)
+        self.report('predict() per dish', per_dish, n)
+
+        batched = best_of(lambda: model.predict_many(rows), repeat)
+        self.report('predict_many()', batched, n)
+
+        encode = best_of(lambda: [model._encode([row]) for row in rows], repeat)
+        self.report('feature encoding per dish', encode, n)
+
+        forest = best_of(lambda: model._predict_forest(rows), repeat)
+        self.report('forest batch (grid bypassed)', forest, n)
+
+        intervals = best_of(lambda: model.predict_intervals(rows), repeat)
+        self.report('predict_intervals()', intervals, n)
+
+        # A coverage outside the precomputed grid forces per-tree predictions
+        forest_intervals = best_of(lambda: model._forest_intervals(rows, 0.9), repeat)
+        self.report('forest intervals (grid bypassed)', forest_intervals, n)
+
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {per_dish / batched:.1f}x'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Interval cost: {intervals / batched:.1f}x predict_many(), '
+            f'{forest_intervals / forest:.1f}x a forest point prediction'
+        ))
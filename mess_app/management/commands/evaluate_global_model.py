@@ -0,0 +1,85 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from mess_app.management.commands.benchmark_predictions import load_synthetic_history
+from mess_app.ml.evaluation import evaluate_global_model
+from mess_app.ml.provider_model import PLAN_MEAL_TYPES, MESS_TYPES, historical_frame, provider_features
+
+
+def synthetic_providers(n_providers, seed=0):
+    """
+    Histories and features of `n_providers` made-up providers: slices of the
+    synthetic dataset of varying length, scaled to each provider's subscriber count.
+    """
+    history = load_synthetic_history()
+    rng = np.random.default_rng(seed)
+    frames, features = {}, {}
+    for provider_id in range(1, n_providers + 1):
+        subscribers = int(rng.integers(20, 300))
+        length = int(rng.integers(5, 120))
+        start = int(rng.integers(0, len(history) - length))
+        frame = history.iloc[start:start + length].reset_index(drop=True)
+        frame['attended_students'] = np.rint(frame['attended_students'] * subscribers / 250).astype(int)
+        frames[provider_id] = frame
+        mix = rng.dirichlet(np.ones(len(PLAN_MEAL_TYPES)))
+        features[provider_id] = {
+            'active_subscribers': subscribers,
+            'plan_mix': dict(zip(PLAN_MEAL_TYPES, mix.tolist())),
+            'mess_type': MESS_TYPES[int(rng.integers(len(MESS_TYPES)))],
+        }
+    return frames, features
+
+
+class Command(BaseCommand):
+    help = 'Compare accuracy, memory and latency of the global model with per-provider models'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, action='append', help='Only evaluate this provider (repeatable)')
+        parser.add_argument('--synthetic', type=int, metavar='N', help='Use N synthetic providers instead of the database')
+        parser.add_argument('--days', type=int, help='History window (default: PROVIDER_MODEL_HISTORY_DAYS)')
+        parser.add_argument('--test-fraction', type=float, default=0.2, help='Latest share of each history held out')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--jobs', type=int, default=-1, help='Parallel tree fits (default: all cores)')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            frames, features = synthetic_providers(options['synthetic'])
+        else:
+            providers = User.objects.filter(role='PROVIDER')
+            if options['provider']:
+                providers = providers.filter(id__in=options['provider'])
+            provider_ids = list(providers.values_list('id', flat=True))
+            frames = {provider_id: historical_frame(provider_id, options['days']) for provider_id in provider_ids}
+            features = provider_features(provider_ids)
+
+        report = evaluate_global_model(
+            frames, features, test_fraction=options['test_fraction'], n_jobs=options['jobs'], repeat=options['repeat']
+        )
+        if not report['test_rows']:
+            raise SystemExit('No held-out meals to evaluate; record more attendance first')
+
+        self.stdout.write(
+            f"{report['providers']} providers, {report['test_rows']} held-out meals; per-provider models "
+            f"cover {report['covered_providers']} providers ({report['covered_rows']} meals)"
+        )
+        self.stdout.write(f'  {"":<28} {"per-provider":>14} {"global":>14}')
+        provider, shared = report['provider'], report['global']
+        self.row('MAE (covered meals)', self.metric(provider, 'mae'), self.metric(shared, 'mae'))
+        self.row('RMSE (covered meals)', self.metric(provider, 'rmse'), self.metric(shared, 'rmse'))
+        self.row('MAE (all meals)', 'n/a', self.metric(shared, 'mae', 'all_metrics'))
+        self.row('training', f'{provider["train_seconds"]:.2f} s', f'{shared["train_seconds"]:.2f} s')
+        self.row('artifacts on disk', self.size(provider['disk_bytes']), self.size(shared['disk_bytes']))
+        self.row('loaded models', self.size(provider['loaded_bytes']), self.size(shared['loaded_bytes']))
+        self.row('predict_many()', f'{provider["grid_us_per_row"]:.1f} us/row', f'{shared["grid_us_per_row"]:.1f} us/row')
+        self.row('forest (grid bypassed)', f'{provider["forest_us_per_row"]:.1f} us/row', f'{shared["forest_us_per_row"]:.1f} us/row')
+
+    def row(self, label, provider, shared):
+        self.stdout.write(f'  {label:<28} {provider:>14} {shared:>14}')
+
+    def metric(self, result, name, key='metrics'):
+        metrics = result[key]
+        return f'{metrics[name]:.2f}' if metrics and metrics[name] is not None else 'n/a'
+
+    def size(self, n_bytes):
+        return f'{n_bytes / 1024:.0f} KiB'
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from mess_app.services import generate_all_forecasts
+
+
+class Command(BaseCommand):
+    help = "Precompute next week's attendance forecasts and dish rankings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, action='append', help='Only forecast this provider (repeatable)')
+
+    def handle(self, *args, **options):
+        summary = generate_all_forecasts(provider_ids=options['provider'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {summary["forecasts"]} meal forecasts for {summary["providers"]} providers '
+            f'({summary["skipped"]} without a model, {summary["failed"]} failed) '
+            f'in {summary["elapsed_seconds"]}s'
+        ))
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from mess_app.ml.model_file import FORMAT_VERSION, read_model_file
+from mess_app.ml.provider_model import ProviderDishModel, use_mmap
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = 'Report artifact size, forest size and load time of every provider model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, action='append', help='Only report this provider (repeatable)')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        providers = User.objects.filter(role='PROVIDER')
+        if options['provider']:
+            providers = providers.filter(id__in=options['provider'])
+        repeat = options['repeat']
+
+        self.stdout.write(
+            f'Model file format v{FORMAT_VERSION}, loaded with {"mmap" if use_mmap() else "private copies"} '
+            f'(best of {repeat})'
+        )
+        self.stdout.write(
+            f'  {"provider":<20} {"format":<8} {"trees":>6} {"nodes":>8} {"disk":>10} {"forest":>10} '
+            f'{"load":>9} {"mmap read":>10} {"copy read":>10}'
+        )
+        totals = {'models': 0, 'disk': 0, 'forest': 0, 'load': 0.0}
+        for provider_id, username in providers.values_list('id', 'username'):
+            model = ProviderDishModel(provider_id)
+            if model.rf_model is None:
+                continue
+            legacy = not model.model_file.exists()
+            load = best_of(lambda: ProviderDishModel(provider_id), repeat)
+            if legacy:
+                mapped = copied = '-'
+            else:
+                mapped = self.ms(best_of(lambda: read_model_file(model.model_file, use_mmap=True), repeat))
+                copied = self.ms(best_of(lambda: read_model_file(model.model_file, use_mmap=False), repeat))
+
+            forest = model.rf_model
+            self.stdout.write(
+                f'  {username[:20]:<20} {"legacy" if legacy else "compact":<8} {forest.n_estimators:>6} '
+                f'{forest.node_count:>8} {self.size(model.artifact_size()):>10} {self.size(forest.nbytes):>10} '
+                f'{self.ms(load):>9} {mapped:>10} {copied:>10}'
+            )
+            totals['models'] += 1
+            totals['disk'] += model.artifact_size()
+            totals['forest'] += forest.nbytes
+            totals['load'] += load
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{totals["models"]} models: {self.size(totals["disk"])} on disk, '
+            f'{self.size(totals["forest"])} of forest arrays, {self.ms(totals["load"])} to load all'
+        ))
+
+    def ms(self, seconds):
+        return f'{seconds * 1000:.2f} ms'
+
+    def size(self, n_bytes):
+        return f'{n_bytes / 1024:.1f} KiB'
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from accounts.models import User
-from mess_app.ml.provider_model import retrain_provider_model
+from mess_app.ml.provider_model import model_mode, train_global_model
+from mess_app.ml.retraining import retrain_providers
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,30 +10,50 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Retrain models for all providers with sufficient data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Number of worker processes (default: CPU count, 1 = inline)')
+        parser.add_argument('--only-needed', action='store_true', help='Skip providers whose model is up to date')
+        parser.add_argument('--timeout', type=int, help='Seconds one provider may take before its worker is terminated (default: PROVIDER_MODEL_RETRAIN_TIMEOUT)')
+
     def handle(self, *args, **options):
         providers = User.objects.filter(role='PROVIDER')
+        usernames = dict(providers.values_list('id', 'username'))
         
-        self.stdout.write(f'Found {providers.count()} providers')
+        self.stdout.write(f'Found {len(usernames)} providers')
         
-        success_count = 0
-        failed_count = 0
+        if model_mode() == 'global':
+            # One model serves every provider; retrain it on everyone's history
+            model = train_global_model(list(usernames))
+            self.stdout.write(self.style.SUCCESS(
+                f'\nCompleted: global model trained on {model.stats["total_samples"]} samples '
+                f'from {model.stats["providers"]} providers'
+            ))
+            return
         
-        for provider in providers:
-            try:
-                self.stdout.write(f'Training model for {provider.username}...')
-                metadata = retrain_provider_model(provider.id)
+        def report(result):
+            username = usernames.get(result['provider_id'], result['provider_id'])
+            if result['status'] == 'retrained':
+                metadata = result['metadata']
                 self.stdout.write(self.style.SUCCESS(
-                    f'  ✓ Success: {metadata["n_samples"]} samples, '
-                    f'Avg: {metadata["avg_attendance"]:.1f}'
+                    f'  ✓ {username}: {metadata["n_samples"]} samples, '
+                    f'Avg: {metadata["avg_attendance"]:.1f} ({result["seconds"]:.1f}s)'
                 ))
-                success_count += 1
-            except ValueError as e:
-                self.stdout.write(self.style.WARNING(f'  ⊘ Skipped: {str(e)}'))
-                failed_count += 1
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'  ✗ Error: {str(e)}'))
-                failed_count += 1
+            elif result['status'] == 'skipped':
+                self.stdout.write(self.style.WARNING(f'  ⊘ {username} skipped: {result["reason"]}'))
+            else:
+                self.stdout.write(self.style.ERROR(f'  ✗ {username} {result["status"]}: {result["reason"]}'))
+        
+        summary = retrain_providers(
+            list(usernames),
+            workers=options['workers'],
+            only_needed=options['only_needed'],
+            on_result=report,
+            timeout=options['timeout'],
+        )
         
         self.stdout.write(self.style.SUCCESS(
-            f'\nCompleted: {success_count} successful, {failed_count} failed/skipped'
+            f'\nCompleted: {summary["retrained"]} successful, '
+            f'{summary["skipped"]} skipped, {summary["failed"]} failed '
+            f'({summary["timed_out"]} timed out) '
+            f'in {summary["elapsed_seconds"]}s using {summary["workers"]} worker(s)'
         ))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from mess_app.ml.provider_model import ProviderDishModel, retrain_provider_model
+from mess_app.ml.tuning import DEFAULT_FOREST_PARAMS
+
+
+class Command(BaseCommand):
+    help = 'Choose forest settings per provider by rolling-origin backtesting, then retrain'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, action='append', help='Only tune this provider (repeatable)')
+        parser.add_argument('--jobs', type=int, default=-1, help='Parallel backtest fits (default: all cores)')
+
+    def handle(self, *args, **options):
+        providers = User.objects.filter(role='PROVIDER')
+        if options['provider']:
+            providers = providers.filter(id__in=options['provider'])
+        
+        for provider_id, username in providers.values_list('id', 'username'):
+            try:
+                metadata = retrain_provider_model(provider_id, n_jobs=options['jobs'], tune=True)
+            except ValueError as e:
+                self.stdout.write(self.style.WARNING(f'  ⊘ {username} skipped: {e}'))
+                continue
+            
+            validation = metadata['validation']
+            mape = f'{validation["mape"]:.1f}%' if validation['mape'] is not None else 'n/a'
+            self.stdout.write(self.style.SUCCESS(
+                f'  ✓ {username}: {metadata["forest_params"]} '
+                f'MAE {validation["mae"]:.2f}, RMSE {validation["rmse"]:.2f}, MAPE {mape}'
+            ))
+            baseline = self.baseline(provider_id)
+            if baseline is not None:
+                self.stdout.write(f'    default forest {DEFAULT_FOREST_PARAMS}: MAE {baseline:.2f}')
+
+    def baseline(self, provider_id):
+        """Backtest MAE of the untuned settings, if they were part of the grid."""
+        for result in ProviderDishModel(provider_id).stats['tuning']['results']:
+            if result['params'] == DEFAULT_FOREST_PARAMS:
+                return result['mae']
+        return None
@@ -5,15 +5,21 @@ from mess_app.ml.provider_model import update_prediction_actuals
 class Command(BaseCommand):
     help = 'Update prediction logs with actual attendance data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, help='Only update logs of this provider')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per bulk update')
+
     def handle(self, *args, **options):
         self.stdout.write('Updating prediction logs...')
         
         try:
-            count = update_prediction_actuals()
+            # update_prediction_actuals logs its own timing and throughput
+            count = update_prediction_actuals(
+                provider_id=options['provider'],
+                batch_size=options['batch_size'],
+            )
             self.stdout.write(
-                self.style.SUCCESS(
-                    f'✓ Successfully updated {count} prediction logs'
-                )
+                self.style.SUCCESS(f'✓ Successfully updated {count} prediction logs')
             )
         except Exception as e:
             self.stdout.write(
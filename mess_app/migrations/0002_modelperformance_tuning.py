@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mess_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='modelperformance',
+            name='forest_params',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modelperformance',
+            name='validation_folds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modelperformance',
+            name='validation_mae',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modelperformance',
+            name='validation_mape',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='modelperformance',
+            name='validation_rmse',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:06
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mess_app', '0002_modelperformance_tuning'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal_type', models.CharField(max_length=20)),
+                ('is_mess_holiday', models.BooleanField(default=False)),
+                ('students_on_leave', models.IntegerField(default=0)),
+                ('expected_students', models.IntegerField(default=0)),
+                ('dish_name', models.CharField(blank=True, max_length=100)),
+                ('dish_type', models.CharField(blank=True, max_length=20)),
+                ('predicted_attendance', models.IntegerField()),
+                ('recommendations', models.JSONField(blank=True, default=list)),
+                ('generated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_forecasts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date', '-meal_type'],
+                'unique_together': {('provider', 'date', 'meal_type')},
+            },
+        ),
+    ]
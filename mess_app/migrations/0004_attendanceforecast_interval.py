@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mess_app', '0003_attendanceforecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceforecast',
+            name='predicted_lower',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attendanceforecast',
+            name='predicted_upper',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
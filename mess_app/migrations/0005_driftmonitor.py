@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mess_app', '0004_attendanceforecast_interval'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriftMonitor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('artifact_version', models.CharField(blank=True, max_length=64)),
+                ('model_trained_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_through', models.DateField(blank=True, null=True)),
+                ('segments', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='drift_monitor', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
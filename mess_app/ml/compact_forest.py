@@ -0,0 +1,112 @@
+"""
+Flat, compact-dtype copy of a fitted RandomForestRegressor for inference.
+
+sklearn stores every node as a 64-byte record plus a float64 value. Here the
+nodes of all trees are concatenated into a handful of arrays in the
+smallest dtypes that hold them (typically 13 bytes per node), which can be
+saved to and memory-mapped from a model file (see model_file). Predictions
+walk all trees of a batch at once: leaves point to themselves, so every row
+reaches its leaf after max_depth vectorised steps.
+"""
+import numpy as np
+
+ARRAY_NAMES = ('roots', 'left', 'right', 'feature', 'threshold', 'value')
+
+
+def _smallest_uint(max_value):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_value <= np.iinfo(dtype).max:
+            return dtype
+    return np.uint64
+
+
+def _float32_at_most(values):
+    """float32 copies of float64 values, rounded down where rounding to nearest would go up.
+
+    sklearn compares float32 features with float64 thresholds; for a float32
+    x, x <= t holds exactly when x <= the largest float32 not above t.
+    """
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompactForest:
+    """Inference-only regression forest over flat node arrays."""
+
+    def __init__(self, arrays, n_features_in, max_depth):
+        self.roots = arrays['roots']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.value = arrays['value']
+        self.n_features_in_ = n_features_in
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        counts = [tree.node_count for tree in trees]
+        total = sum(counts)
+        index_dtype = _smallest_uint(max(total - 1, 0))
+
+        roots = np.zeros(len(trees), dtype=np.uint32)
+        left = np.empty(total, dtype=index_dtype)
+        right = np.empty(total, dtype=index_dtype)
+        feature = np.empty(total, dtype=_smallest_uint(max(forest.n_features_in_ - 1, 0)))
+        threshold = np.empty(total, dtype=np.float32)
+        value = np.empty(total, dtype=np.float32)
+
+        offset = 0
+        for i, tree in enumerate(trees):
+            n = tree.node_count
+            nodes = slice(offset, offset + n)
+            is_leaf = tree.children_left < 0
+            own = np.arange(n)
+            roots[i] = offset
+            left[nodes] = np.where(is_leaf, own, tree.children_left) + offset
+            right[nodes] = np.where(is_leaf, own, tree.children_right) + offset
+            feature[nodes] = np.where(is_leaf, 0, tree.feature)
+            threshold[nodes] = _float32_at_most(np.where(is_leaf, 0.0, tree.threshold))
+            value[nodes] = tree.value[:, 0, 0]
+            offset += n
+
+        arrays = dict(zip(ARRAY_NAMES, (roots, left, right, feature, threshold, value)))
+        return cls(arrays, int(forest.n_features_in_), max(tree.max_depth for tree in trees))
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in ARRAY_NAMES}
+
+    def meta(self):
+        return {'n_features_in': self.n_features_in_, 'max_depth': self.max_depth}
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def node_count(self):
+        return len(self.value)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.to_arrays().values())
+
+    def apply(self, X):
+        """(n_rows, n_trees) index of the leaf each row reaches in each tree."""
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.repeat(self.roots.astype(np.intp)[None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes]).astype(np.intp)
+        return nodes
+
+    def tree_predictions(self, X):
+        """(n_rows, n_trees) prediction of every tree."""
+        return self.value[self.apply(X)].astype(np.float64)
+
+    def predict(self, X):
+        return self.tree_predictions(X).mean(axis=1)
@@ -0,0 +1,170 @@
+import random
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from .qnetwork_numpy import LAYERS, checkpoint_fingerprint
+
+
+# =========================
+# DQN Network
+# =========================
+class QNetwork(nn.Module):
+    def __init__(self, input_dim, output_dim):
+        super(QNetwork, self).__init__()
+        self.fc1 = nn.Linear(input_dim, 128)
+        self.fc2 = nn.Linear(128, 128)
+        self.fc3 = nn.Linear(128, output_dim)
+
+    def forward(self, x):
+        x = torch.relu(self.fc1(x))
+        x = torch.relu(self.fc2(x))
+        return self.fc3(x)
+
+    def export_numpy(self, path, source=None):
+        """
+        Write the layer weights to an .npz file for qnetwork_numpy.NumpyQNetwork.
+        `source` is the checkpoint the weights were saved to; its fingerprint is
+        recorded so that a stale export is never preferred over the checkpoint.
+        """
+        arrays = {}
+        for layer in LAYERS:
+            linear = getattr(self, layer)
+            arrays[f'{layer}_weight'] = linear.weight.detach().numpy().astype(np.float32)
+            arrays[f'{layer}_bias'] = linear.bias.detach().numpy().astype(np.float32)
+        arrays['source_fingerprint'] = np.array(checkpoint_fingerprint(source) if source else '')
+        np.savez(path, **arrays)
+
+
+# =========================
+# Replay Memory
+# =========================
+class ReplayMemory:
+    """
+    Fixed-capacity ring buffer of transitions stored in preallocated arrays.
+
+    push() writes one row in place (the oldest transition is overwritten once
+    the buffer is full) and sample() draws a minibatch with one vectorized
+    index per array, returning tensors ready for DQNAgent.learn().
+    """
+
+    def __init__(self, capacity, state_dim):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_dim), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_dim), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)
+        self.position = 0
+        self.size = 0
+
+    def push(self, state, action, reward, next_state, done):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """(states, actions, rewards, next_states, dones) tensors for a random minibatch."""
+        idx = np.random.randint(0, self.size, size=batch_size)
+        return (
+            torch.from_numpy(self.states[idx]),
+            torch.from_numpy(self.actions[idx]),
+            torch.from_numpy(self.rewards[idx]),
+            torch.from_numpy(self.next_states[idx]),
+            torch.from_numpy(self.dones[idx]),
+        )
+
+    def save(self, path):
+        """Write the filled part of the buffer to an .npz file, oldest transition first."""
+        order = np.arange(self.position - self.size, self.position) % self.capacity
+        np.savez(
+            path,
+            states=self.states[order],
+            actions=self.actions[order],
+            rewards=self.rewards[order],
+            next_states=self.next_states[order],
+            dones=self.dones[order],
+        )
+
+    def load(self, path):
+        """Append the transitions of a file written by save(); the newest win if they do not fit."""
+        with np.load(path) as data:
+            columns = [data[name] for name in ('states', 'actions', 'rewards', 'next_states', 'dones')]
+        n = min(len(columns[0]), self.capacity)
+        # Copy the last n rows in at most two slices: up to the end of the ring, then from its start
+        head = min(n, self.capacity - self.position)
+        for storage, column in zip((self.states, self.actions, self.rewards, self.next_states, self.dones), columns):
+            column = column[len(column) - n:]
+            storage[self.position:self.position + head] = column[:head]
+            storage[:n - head] = column[head:]
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def __len__(self):
+        return self.size
+
+
+# =========================
+# DQN Agent
+# =========================
+class DQNAgent:
+    def __init__(self, state_dim, action_dim, lr=1e-3, gamma=0.99, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.1):
+        self.q_network = QNetwork(state_dim, action_dim)
+        self.target_network = QNetwork(state_dim, action_dim)
+        self.optimizer = optim.Adam(self.q_network.parameters(), lr=lr)
+        self.memory = ReplayMemory(10000, state_dim)
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.epsilon_decay = epsilon_decay
+        self.epsilon_min = epsilon_min
+        self.update_target()
+
+    def update_target(self):
+        self.target_network.load_state_dict(self.q_network.state_dict())
+
+    def act(self, state):
+        if random.random() < self.epsilon:
+            return random.randint(0, self.q_network.fc3.out_features - 1)
+        with torch.no_grad():
+            q_values = self.q_network(torch.FloatTensor(state).unsqueeze(0))
+        return q_values.argmax().item()
+
+    def learn(self, batch):
+        """
+        One gradient step on a minibatch as returned by ReplayMemory.sample(),
+        with Q-values and TD targets computed for the whole batch at once.
+        Returns the loss.
+        """
+        states, actions, rewards, next_states, dones = batch
+
+        q_value = self.q_network(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        with torch.no_grad():
+            max_next = self.target_network(next_states).max(dim=1).values
+        target = rewards + self.gamma * max_next * (1 - dones)
+
+        loss = ((q_value - target) ** 2).mean()
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        return loss.item()
+
+    def load(self, path):
+        """Load q/target network weights saved by train_dqn_model.py and switch to greedy play."""
+        checkpoint = torch.load(path, map_location=torch.device('cpu'))
+        self.q_network.load_state_dict(checkpoint['q_network_state_dict'])
+        self.target_network.load_state_dict(checkpoint['target_network_state_dict'])
+        self.q_network.eval()
+        self.epsilon = 0.0
+
+    def save(self, path):
+        torch.save({
+            "q_network_state_dict": self.q_network.state_dict(),
+            "target_network_state_dict": self.target_network.state_dict(),
+        }, path)
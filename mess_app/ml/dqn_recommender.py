@@ -0,0 +1,335 @@
+import logging
+import pickle
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .encoding import FeatureEncoder
+from .qnetwork_numpy import NumpyQNetwork, checkpoint_fingerprint
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+DATA_PATH = BASE_DIR / 'synthetic_attendance_dataset_large_with_mealtime.csv'
+MODEL_PATH = BASE_DIR / 'dqn_mess_model.pth'
+ARTIFACT_DIR = BASE_DIR / 'dqn_artifacts'
+QNETWORK_EXPORT_PATH = ARTIFACT_DIR / 'qnetwork.npz'
+BACKENDS = ('auto', 'numpy', 'torch')
+
+# Column order of the one-hot state vector
+FEATURE_COLUMNS = ('day_of_week', 'dish_type', 'holiday', 'meal_time')
+
+WEEK_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+# The DQN's action space: recommendations are always drawn from this list.
+ORIGINAL_TRAINING_DISHES = [
+    ("DalRice", "veg"), ("Poha", "veg"), ("Paneer", "veg"),
+    ("Biryani", "nonveg"), ("Chicken Curry", "nonveg"), ("Pulao", "veg"),
+    ("Idli", "veg"), ("Special Sweet", "veg"),
+]
+
+
+def load_training_frame(data_path=DATA_PATH):
+    """Synthetic attendance data the DQN recommender is trained on."""
+    import pandas as pd
+
+    df = pd.read_csv(data_path)
+    df['holiday'] = df['holiday'].astype(str).str.capitalize()
+    return df
+
+
+def fit_preprocessing(df):
+    """
+    Fit the state encoders, the attendance scaler and the attendance forest.
+    Returns a dict with 'encoders' (in FEATURE_COLUMNS order), 'scaler' and 'rf_model'.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    encoders = []
+    for column in FEATURE_COLUMNS:
+        encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+        encoder.fit(df[[column]])
+        encoders.append(encoder)
+    X = np.hstack([encoder.transform(df[[column]]) for encoder, column in zip(encoders, FEATURE_COLUMNS)])
+
+    scaler = StandardScaler()
+    y = scaler.fit_transform(df[['attended_students']])
+
+    X_train, _, y_train, _ = train_test_split(X, y, test_size=0.3, random_state=42)
+    rf_model = RandomForestRegressor(n_estimators=100, random_state=42)
+    rf_model.fit(X_train, y_train.ravel())
+
+    return {'encoders': encoders, 'scaler': scaler, 'rf_model': rf_model}
+
+
+def save_preprocessing(artifacts, artifact_dir=ARTIFACT_DIR):
+    artifact_dir = Path(artifact_dir)
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    for name in ('encoders', 'scaler', 'rf_model'):
+        with open(artifact_dir / f'{name}.pkl', 'wb') as f:
+            pickle.dump(artifacts[name], f)
+
+
+def load_preprocessing(artifact_dir=ARTIFACT_DIR):
+    artifact_dir = Path(artifact_dir)
+    artifacts = {}
+    for name in ('encoders', 'scaler', 'rf_model'):
+        with open(artifact_dir / f'{name}.pkl', 'rb') as f:
+            artifacts[name] = pickle.load(f)
+    return artifacts
+
+
+class DQNRecommender:
+    """
+    DQN dish recommender with attendance prediction.
+
+    Nothing is loaded at construction time: the fitted encoders, scaler and
+    forest (written by train_dqn_model.py) and the Q-network are read on
+    first use. If the preprocessing artifacts are missing they are fitted
+    from the synthetic CSV once and saved for the next process.
+
+    backend: 'auto' runs the Q-network with NumPy (no torch import) when an
+    up-to-date qnetwork.npz export of the checkpoint exists and with torch
+    otherwise; 'numpy' and 'torch' force one or the other.
+    """
+
+    def __init__(self, artifact_dir=ARTIFACT_DIR, model_path=MODEL_PATH, data_path=DATA_PATH, backend='auto'):
+        if backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {BACKENDS}")
+        self.artifact_dir = Path(artifact_dir)
+        self.model_path = Path(model_path)
+        self.data_path = Path(data_path)
+        self.backend = backend
+        self.dishes = list(ORIGINAL_TRAINING_DISHES)
+
+        self._lock = threading.Lock()
+        self._buffers = threading.local()
+        self._loaded = False
+        self.feature_encoder = None
+        self.scaler = None
+        self.rf_model = None
+        self.agent = None
+        self.q_network = None
+        self.uses_torch = False
+        self.model_loaded = False
+
+    # =========================
+    # Lazy loading
+    # =========================
+    def load(self):
+        """Load every component now (idempotent and thread-safe)."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if not self._loaded:
+                self._load_preprocessing()
+                self._load_agent()
+                self._loaded = True
+        return self
+
+    def _load_preprocessing(self):
+        try:
+            artifacts = load_preprocessing(self.artifact_dir)
+        except FileNotFoundError:
+            logger.warning(f"DQN preprocessing artifacts not found in {self.artifact_dir}, fitting from {self.data_path}")
+            artifacts = fit_preprocessing(load_training_frame(self.data_path))
+            try:
+                save_preprocessing(artifacts, self.artifact_dir)
+            except OSError as e:
+                logger.warning(f"Could not save DQN preprocessing artifacts: {e}")
+
+        self.feature_encoder = FeatureEncoder(artifacts['encoders'])
+        self.scaler = artifacts['scaler']
+        self.rf_model = artifacts['rf_model']
+        self.rf_model.n_jobs = 1
+
+    def _load_agent(self):
+        if self.backend != 'torch' and self._load_numpy_network():
+            return
+        if self.backend == 'numpy':
+            raise FileNotFoundError(f"No up-to-date Q-network export in {self.artifact_dir}")
+
+        # torch is only imported by processes that actually need it
+        from .dqn_network import DQNAgent
+
+        self.agent = DQNAgent(self.feature_encoder.width, len(self.dishes))
+        self.q_network = self.agent.q_network
+        self.uses_torch = True
+        if not self.model_path.exists():
+            logger.warning(f"DQN checkpoint not found at {self.model_path}")
+            return
+        try:
+            self.agent.load(self.model_path)
+            self.model_loaded = True
+        except Exception as e:
+            logger.warning(f"DQN checkpoint load failed: {e}")
+
+    def _load_numpy_network(self):
+        """Use the NumPy export if it exists and matches the current checkpoint."""
+        export_path = self.artifact_dir / QNETWORK_EXPORT_PATH.name
+        if not export_path.exists():
+            return False
+        network = NumpyQNetwork.load(export_path)
+        if self.model_path.exists() and network.source_fingerprint != checkpoint_fingerprint(self.model_path):
+            logger.warning(f"{export_path} is older than {self.model_path}, using torch")
+            return False
+        self.q_network = network
+        self.model_loaded = True
+        return True
+
+    # =========================
+    # Inference
+    # =========================
+    def prepare_input(self, day_of_week, holiday, meal_time, dish_type):
+        self.load()
+        return self.feature_encoder.transform_one((day_of_week, dish_type, holiday, meal_time))
+
+    def _state_buffer(self, n_rows):
+        """
+        The first n_rows of this thread's float32 input matrix (and, with
+        torch, of the tensor sharing its memory). The matrix is grown when a
+        call needs more rows, so repeated calls allocate nothing.
+        """
+        buffer = getattr(self._buffers, 'states', None)
+        if buffer is None or len(buffer[0]) < n_rows:
+            array = np.zeros((n_rows, self.feature_encoder.width), dtype=np.float32)
+            tensor = None
+            if self.uses_torch:
+                import torch
+                tensor = torch.from_numpy(array)
+            buffer = self._buffers.states = (array, tensor)
+        array, tensor = buffer
+        return array[:n_rows], (tensor[:n_rows] if tensor is not None else None)
+
+    def q_values_for_states(self, rows):
+        """
+        Best Q-value for each (day_of_week, dish_type, holiday, meal_time) state,
+        computed with a single forward pass.
+        """
+        self.load()
+        array, tensor = self._state_buffer(len(rows))
+        self.feature_encoder.transform(rows, out=array)
+        if not self.uses_torch:
+            return self.q_network(array).max(axis=1).astype(np.float64)
+
+        import torch
+        with torch.inference_mode():
+            q = self.q_network(tensor)
+        return q.max(dim=1).values.numpy().astype(np.float64)
+
+    def q_values(self, day_of_week, holiday, meal_time):
+        """Best Q-value of every candidate dish for one context, in self.dishes order."""
+        return self.q_values_for_states([
+            (day_of_week, dish_type, holiday, meal_time) for _, dish_type in self.dishes
+        ])
+
+    def q_value(self, day_of_week, holiday, meal_time, dish_type):
+        """Best Q-value the network assigns to the state describing this dish."""
+        return float(self.q_values_for_states([(day_of_week, dish_type, holiday, meal_time)])[0])
+
+    def predict_best_dish(self, day_of_week, holiday, meal_time, provider_dishes, temperature=1.0, repeat_penalty=0.5):
+        """
+        Predict best dish for a given day, meal_time, holiday
+        provider_dishes: list of tuples (dish_name, dish_type)
+        """
+        return self.predict_best_dishes(
+            [(day_of_week, holiday, meal_time)], provider_dishes,
+            temperature=temperature, repeat_penalty=repeat_penalty
+        )[0]
+
+    def predict_best_dishes(self, contexts, provider_dishes, temperature=1.0, repeat_penalty=0.5):
+        """
+        predict_best_dish for many (day_of_week, holiday, meal_time) contexts at once:
+        one forward pass scores every candidate dish in every context and one
+        forest call predicts attendance for all the selected dishes.
+        """
+        if not contexts:
+            return []
+        self.load()
+        contexts = [(day, str(holiday).capitalize(), meal) for day, holiday, meal in contexts]
+        n_dishes = len(self.dishes)
+
+        states = [
+            (day, dish_type, holiday, meal)
+            for day, holiday, meal in contexts
+            for _, dish_type in self.dishes
+        ]
+        q = self.q_values_for_states(states).reshape(len(contexts), n_dishes)
+
+        # Apply repeat penalty for dishes that are already offered by provider
+        provider_dish_names = {d[0] for d in provider_dishes}
+        penalty = np.array([repeat_penalty if name in provider_dish_names else 0 for name, _ in self.dishes])
+        q = q - penalty
+
+        # Softmax selection, one draw per context (shifted by the row max to avoid overflow)
+        exp_q = np.exp((q - q.max(axis=1, keepdims=True)) / temperature)
+        probs = exp_q / exp_q.sum(axis=1, keepdims=True)
+        draws = np.random.random_sample((len(contexts), 1))
+        selected = np.minimum((probs.cumsum(axis=1) < draws).sum(axis=1), n_dishes - 1)
+
+        # Predict attendance
+        choices = [self.dishes[i] for i in selected]
+        attendance = self.predict_attendance_many([
+            (day, holiday, meal, self.dish_type_for(name, provider_dishes))
+            for (day, holiday, meal), (name, _) in zip(contexts, choices)
+        ])
+
+        return [
+            (name, dish_type, meal, round(predicted, 2))
+            for (name, dish_type), (_, _, meal), predicted in zip(choices, contexts, attendance)
+        ]
+
+    def predict_week(self, provider_dishes, meals=('Lunch', 'Dinner'), holidays=None, **kwargs):
+        """
+        Recommend a dish for every day of the week and meal in one call.
+        holidays: optional {day_of_week: holiday name}; other days use 'None'.
+        Returns {(day_of_week, meal_time): (dish_name, dish_type, meal_time, attendance)}.
+        """
+        holidays = holidays or {}
+        contexts = [(day, holidays.get(day, 'None'), meal) for day in WEEK_DAYS for meal in meals]
+        results = self.predict_best_dishes(contexts, provider_dishes, **kwargs)
+        return {(day, meal): result for (day, _, meal), result in zip(contexts, results)}
+
+    def dish_type_for(self, dish_name, provider_dishes):
+        """Dish type from the provider's menu, falling back to the training dishes."""
+        dish_type = next((t for d, t in provider_dishes if d == dish_name), None)
+        if dish_type is None:
+            dish_type = next((t for d, t in self.dishes if d == dish_name), None)
+        return dish_type
+
+    def predict_attendance_many(self, rows):
+        """Attendance for (day_of_week, holiday, meal_time, dish_type) rows with one forest call."""
+        self.load()
+        known = [i for i, row in enumerate(rows) if row[3] is not None]
+        predicted = [0] * len(rows)
+        if known:
+            X = self.feature_encoder.transform([
+                (rows[i][0], rows[i][3], rows[i][1], rows[i][2]) for i in known
+            ])
+            pred_scaled = self.rf_model.predict(X)
+            attendance = self.scaler.inverse_transform(pred_scaled.reshape(-1, 1)).ravel()
+            for i, value in zip(known, attendance):
+                predicted[i] = round(float(value), 2)
+        return predicted
+
+    def predict_attendance_for_dish(self, day_of_week, holiday, meal_time, dish_name, provider_dishes):
+        holiday = str(holiday).capitalize()
+        dish_type = self.dish_type_for(dish_name, provider_dishes)
+        return self.predict_attendance_many([(day_of_week, holiday, meal_time, dish_type)])[0]
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+
+def get_dqn_recommender():
+    """Process-wide recommender; its models are loaded on first use."""
+    global _recommender
+    if _recommender is None:
+        with _recommender_lock:
+            if _recommender is None:
+                _recommender = DQNRecommender()
+    return _recommender
@@ -0,0 +1,169 @@
+"""
+Incremental attendance drift monitoring for provider models.
+
+Attendance is split into segments (weekday × meal × dish type). Each segment
+keeps three running statistics (Welford's algorithm): the attendance seen
+at training time (the baseline), the attendance seen since, and the model's
+residuals (actual - predicted) since. New meals are folded in as they
+arrive, and the retraining decision only reads the per-segment statistics,
+so it costs O(segments) however long the history is.
+"""
+import math
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+
+class RunningStats:
+    """Count, mean and sum of squared deviations, updated one value at a time."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def push(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """Sample variance (0 until there are two values)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values) if values else cls()
+
+
+def segment_key(day_of_week, meal_type, dish_type):
+    return f"{day_of_week}|{meal_type.upper()}|{dish_type}"
+
+
+def baseline_segments(df):
+    """Per-segment [count, mean, m2] of attended_students in a training frame."""
+    grouped = df.groupby(['day_of_week', 'meal_type', 'dish_type'])['attended_students']
+    stats = grouped.agg(['count', 'mean', 'var']).fillna(0.0)
+    return {
+        segment_key(day, meal, dish_type): [int(row['count']), float(row['mean']), float(row['var'] * (row['count'] - 1))]
+        for (day, meal, dish_type), row in stats.iterrows()
+    }
+
+
+def detect_drift(segments, min_samples=None, threshold=None):
+    """
+    Segments whose behaviour changed since training, most significant first.
+
+    A segment drifts when, with at least `min_samples` new meals, either its
+    mean attendance moved away from the baseline (Welch z-score) or the
+    model's residuals are biased (mean residual over its standard error)
+    by more than `threshold`. Segments unseen at training time drift as soon
+    as they have `min_samples` meals.
+    Returns (key, score, kind) tuples.
+    """
+    min_samples = min_samples or getattr(settings, 'PROVIDER_DRIFT_MIN_SAMPLES', 4)
+    threshold = threshold or getattr(settings, 'PROVIDER_DRIFT_THRESHOLD', 3.0)
+
+    drifted = []
+    for key, segment in segments.items():
+        recent = RunningStats.from_list(segment.get('attendance'))
+        if recent.count < min_samples:
+            continue
+        baseline = RunningStats.from_list(segment.get('baseline'))
+        residual = RunningStats.from_list(segment.get('residual'))
+
+        if baseline.count < 2:
+            drifted.append((key, math.inf, 'unseen'))
+            continue
+        # Attendance is a small integer count; a variance floor of one student
+        # keeps perfectly regular segments from producing infinite scores.
+        shift = abs(recent.mean - baseline.mean) / math.sqrt(
+            max(baseline.variance, 1.0) / baseline.count + max(recent.variance, 1.0) / recent.count
+        )
+        bias = abs(residual.mean) / math.sqrt(max(residual.variance, 1.0) / residual.count)
+        score, kind = max((shift, 'shift'), (bias, 'bias'))
+        if score > threshold:
+            drifted.append((key, score, kind))
+
+    drifted.sort(key=lambda item: item[1], reverse=True)
+    return drifted
+
+
+def update_drift_monitor(provider_id, until=None, model=None):
+    """
+    Fold the meals recorded since the last update (up to `until`, default
+    yesterday) into the provider's DriftMonitor and return it, or None if
+    the provider has no trained model.
+
+    When the model's artifacts changed since the last update the monitor is
+    restarted from the new model's training baseline. Uses a constant number
+    of queries; predictions come from the cached model's grid.
+    """
+    from mess_app.models import DriftMonitor
+    from student.models import AttendanceSummary
+    from .provider_model import ProviderDishModel, get_provider_model, main_dishes, mess_holiday_meals, trained_at
+
+    version = ProviderDishModel.artifact_version(provider_id)
+    if version is None:
+        return None
+    version = f'{version[0]}:{version[1]}'
+    model = model or get_provider_model(provider_id)
+    until = until or timezone.now().date() - timedelta(days=1)
+
+    monitor, _ = DriftMonitor.objects.get_or_create(provider_id=provider_id)
+    if monitor.artifact_version != version:
+        model_trained_at = trained_at(model)
+        monitor.artifact_version = version
+        monitor.model_trained_at = model_trained_at
+        # Attendance dates are stored as timezone.now().date(), i.e. in UTC
+        monitor.processed_through = model_trained_at.astimezone(dt_timezone.utc).date()
+        monitor.segments = {
+            key: {'baseline': baseline}
+            for key, baseline in model.stats.get('segment_baseline', {}).items()
+        }
+
+    if monitor.processed_through is None or monitor.processed_through < until:
+        start = monitor.processed_through + timedelta(days=1) if monitor.processed_through else None
+        records = AttendanceSummary.objects.filter(
+            provider_id=provider_id, date__lte=until, present_count__gt=0
+        )
+        if start:
+            records = records.filter(date__gte=start)
+        records = list(records.values_list('date', 'meal_type', 'present_count').order_by('date', 'meal_type'))
+
+        if records:
+            first = records[0][0]
+            holidays = mess_holiday_meals(provider_id, first, until)
+            dishes = main_dishes(provider_id, first, until)
+            rows = []
+            for date, meal_type, _ in records:
+                key = (date, meal_type.upper())
+                dish_type = dishes.get(key, (None, None))[1]
+                rows.append((
+                    date.strftime('%a'),
+                    dish_type.lower() if dish_type else 'veg',
+                    'Yes' if key in holidays else 'None',
+                    meal_type.capitalize(),
+                ))
+            predictions = model.predict_many(rows)
+
+            for (day, dish_type, _, meal), (_, _, attended), predicted in zip(rows, records, predictions):
+                segment = monitor.segments.setdefault(segment_key(day, meal, dish_type), {})
+                attendance = RunningStats.from_list(segment.get('attendance'))
+                residual = RunningStats.from_list(segment.get('residual'))
+                attendance.push(attended)
+                residual.push(attended - predicted)
+                segment['attendance'] = attendance.to_list()
+                segment['residual'] = residual.to_list()
+        monitor.processed_through = until
+
+    monitor.save()
+    return monitor
@@ -0,0 +1,75 @@
+import numpy as np
+
+_MISSING = object()
+
+
+class FeatureEncoder:
+    """
+    Compiled form of a list of fitted single-column OneHotEncoders.
+
+    The fitted categories are captured once as {category: column} lookup
+    tables, so encoding a row is a few dict lookups and index writes into a
+    float64 matrix instead of building a DataFrame per feature and calling
+    ``transform``; hot paths pass a reusable matrix as ``out``. The output is identical to
+    ``np.hstack([enc.transform(...) for enc in encoders])`` with
+    ``handle_unknown='ignore'``: unknown values leave their block all zeros.
+    """
+
+    def __init__(self, encoders):
+        self.lookups = []
+        offset = 0
+        for encoder in encoders:
+            categories = encoder.categories_[0]
+            self.lookups.append({
+                self._key(category): offset + i for i, category in enumerate(categories)
+            })
+            offset += len(categories)
+        self.n_features = len(self.lookups)
+        self.width = offset
+
+    @classmethod
+    def from_encoders(cls, encoders, keys):
+        """Build from a {key: encoder} mapping, concatenating in ``keys`` order."""
+        return cls([encoders[key] for key in keys])
+
+    @staticmethod
+    def _key(value):
+        # NaN never equals itself, so it would never be found in a dict;
+        # sklearn treats every NaN as the same category.
+        if isinstance(value, float) and value != value:
+            return _MISSING
+        return value
+
+    def columns(self, row):
+        """Indices of the hot columns for one row (unknown values are skipped)."""
+        hot = []
+        for lookup, value in zip(self.lookups, row):
+            column = lookup.get(self._key(value))
+            if column is not None:
+                hot.append(column)
+        return hot
+
+    def transform_one(self, row, out=None):
+        """Encode one row into a (1, width) matrix, reusing ``out`` if given."""
+        if out is None:
+            out = np.zeros((1, self.width))
+        else:
+            out.fill(0.0)
+        out[0, self.columns(row)] = 1.0
+        return out
+
+    def transform(self, rows, out=None):
+        """Encode a sequence of rows into an (n, width) matrix, reusing ``out`` if given."""
+        n = len(rows)
+        if out is None:
+            out = np.zeros((n, self.width))
+        else:
+            out.fill(0.0)
+        row_index = []
+        col_index = []
+        for i, row in enumerate(rows):
+            hot = self.columns(row)
+            row_index.extend([i] * len(hot))
+            col_index.extend(hot)
+        out[row_index, col_index] = 1.0
+        return out
@@ -0,0 +1,139 @@
+"""
+Compare the global cross-provider model with per-provider models.
+
+Every provider's history is split in time: the last `test_fraction` of its
+meals is held out and both kinds of model are trained on the rest, into a
+temporary directory so that serving artifacts are untouched. The report
+covers accuracy on the held-out meals, memory (artifact bytes on disk and
+heap allocations of the loaded models; memory-mapped model files are shared
+page cache and not counted) and prediction latency.
+"""
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from .provider_model import GlobalDishModel, GlobalProviderModel, ProviderDishModel
+from .tuning import error_metrics
+
+FEATURE_COLUMNS = ['day_of_week', 'dish_type', 'holiday', 'meal_type']
+
+
+def holdout_split(df, test_fraction):
+    """(train, test) of a date-ordered history; the test part is its last meals."""
+    n_test = int(round(len(df) * test_fraction))
+    return df.iloc[:len(df) - n_test], df.iloc[len(df) - n_test:]
+
+
+def _loaded_bytes(load):
+    """Bytes allocated by load() that are still alive afterwards, and its result."""
+    tracemalloc.start()
+    try:
+        result = load()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+def _best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _latency(models, rows, repeat):
+    """Microseconds per row of grid-served (predict_many) and forest predictions."""
+    n_rows = sum(len(rows[provider_id]) for provider_id in models) or 1
+    grid = _best_time(lambda: [models[pid].predict_many(rows[pid]) for pid in models], repeat)
+    forest = _best_time(lambda: [models[pid]._predict_forest(rows[pid]) for pid in models if rows[pid]], repeat)
+    return grid / n_rows * 1e6, forest / n_rows * 1e6
+
+
+def evaluate_global_model(frames, features, test_fraction=0.2, n_jobs=-1, repeat=3):
+    """
+    Hold out the latest meals of every history in `frames` (provider id ->
+    historical_frame) and compare per-provider models with a global model
+    trained on `features` (provider id -> provider_features).
+
+    Per-provider models need 20 training meals, so they only cover some
+    providers; the global model predicts for all of them. Accuracy is
+    reported on the rows both cover as well as on every held-out row.
+    """
+    splits = {provider_id: holdout_split(df, test_fraction) for provider_id, df in frames.items() if not df.empty}
+    rows = {
+        provider_id: list(test[FEATURE_COLUMNS].itertuples(index=False, name=None))
+        for provider_id, (_, test) in splits.items()
+    }
+    actual = {provider_id: test['attended_students'].to_numpy(dtype=float) for provider_id, (_, test) in splits.items()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+
+        started = time.perf_counter()
+        covered = []
+        for provider_id, (train, _) in splits.items():
+            if len(train) >= 20:
+                ProviderDishModel(provider_id, model_dir=root / f'provider_{provider_id}').train(train, n_jobs=n_jobs)
+                covered.append(provider_id)
+        provider_train_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        GlobalDishModel(path=root / 'global_model.bin').train(
+            {provider_id: train for provider_id, (train, _) in splits.items()}, features, n_jobs=n_jobs
+        )
+        global_train_seconds = time.perf_counter() - started
+
+        # Load fresh copies, as a serving process would
+        provider_bytes, provider_models = _loaded_bytes(lambda: {
+            provider_id: ProviderDishModel(provider_id, model_dir=root / f'provider_{provider_id}')
+            for provider_id in covered
+        })
+
+        def load_global():
+            shared = GlobalDishModel(path=root / 'global_model.bin')
+            return shared, {provider_id: GlobalProviderModel(provider_id, shared) for provider_id in splits}
+        global_bytes, (shared, global_models) = _loaded_bytes(load_global)
+
+        provider_disk = sum(model.artifact_size() for model in provider_models.values())
+        global_disk = shared.artifact_size()
+
+    def predictions(models, provider_ids):
+        predicted = [np.asarray(models[pid].predict_many(rows[pid]), dtype=float) for pid in provider_ids]
+        observed = [actual[pid] for pid in provider_ids]
+        return np.concatenate(predicted or [np.empty(0)]), np.concatenate(observed or [np.empty(0)])
+
+    def metrics(models, provider_ids):
+        predicted, observed = predictions(models, provider_ids)
+        return error_metrics(predicted, observed) if len(observed) else None
+
+    provider_grid_us, provider_forest_us = _latency(provider_models, rows, repeat)
+    global_grid_us, global_forest_us = _latency(global_models, rows, repeat)
+
+    return {
+        'providers': len(splits),
+        'test_rows': sum(len(r) for r in rows.values()),
+        'covered_providers': len(covered),
+        'covered_rows': sum(len(rows[pid]) for pid in covered),
+        'provider': {
+            'metrics': metrics(provider_models, covered),
+            'train_seconds': provider_train_seconds,
+            'disk_bytes': provider_disk,
+            'loaded_bytes': provider_bytes,
+            'grid_us_per_row': provider_grid_us,
+            'forest_us_per_row': provider_forest_us,
+        },
+        'global': {
+            'metrics': metrics(global_models, covered),
+            'all_metrics': metrics(global_models, list(splits)),
+            'train_seconds': global_train_seconds,
+            'disk_bytes': global_disk,
+            'loaded_bytes': global_bytes,
+            'grid_us_per_row': global_grid_us,
+            'forest_us_per_row': global_forest_us,
+        },
+    }
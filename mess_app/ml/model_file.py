@@ -0,0 +1,107 @@
+"""
+Single-file, versioned storage for provider models.
+
+Layout (little-endian):
+
+    magic b'MESSMODL' | uint32 format version | uint32 header length
+    JSON header: dtype, shape and offset of every array, offset and length of the metadata
+    arrays, each aligned to 64 bytes
+    pickled metadata (encoders, scaler, statistics, prediction grid, ...)
+
+Arrays are read with np.frombuffer over a read-only memory map, so worker
+processes loading the same model share its pages through the OS page cache.
+Files are written to a temporary name and renamed into place: a process
+that still maps the previous file keeps reading it intact. Windows refuses
+to replace a file that any process maps, so maps are closed once their
+model is dropped (see close_mapping) and PROVIDER_MODEL_MMAP is off there
+by default.
+"""
+import json
+import mmap
+import os
+import pickle
+import struct
+
+import numpy as np
+
+MAGIC = b'MESSMODL'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREFIX = struct.Struct('<8sII')
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_model_file(path, arrays, meta):
+    """Atomically write named NumPy arrays and picklable metadata to path."""
+    entries = {}
+    blobs = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        offset = _align(offset)
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        blobs.append((offset, array.tobytes()))
+        offset += array.nbytes
+
+    meta_bytes = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+    meta_offset = _align(offset)
+    header = json.dumps({'arrays': entries, 'meta': [meta_offset, len(meta_bytes)]}).encode()
+    data_start = _align(_PREFIX.size + len(header))
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for blob_offset, blob in blobs:
+            f.seek(data_start + blob_offset)
+            f.write(blob)
+        f.seek(data_start + meta_offset)
+        f.write(meta_bytes)
+    os.replace(tmp_path, path)
+
+
+def read_model_file(path, use_mmap=True):
+    """
+    Return (arrays, meta, mapping) from a model file. Arrays are read-only;
+    with `use_mmap` they are views of `mapping`, a shared memory map,
+    otherwise of a private copy and `mapping` is None.
+    """
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if use_mmap else f.read()
+
+    magic, version, header_length = _PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a model file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has model file format {version}, expected {FORMAT_VERSION}")
+    header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_length]))
+    data_start = _align(_PREFIX.size + header_length)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        array = np.frombuffer(buffer, dtype=np.dtype(entry['dtype']), count=count, offset=data_start + entry['offset'])
+        arrays[name] = array.reshape(entry['shape'])
+
+    meta_offset, meta_length = header['meta']
+    start = data_start + meta_offset
+    meta = pickle.loads(buffer[start:start + meta_length])
+    return arrays, meta, buffer if use_mmap else None
+
+
+def close_mapping(mapping):
+    """
+    Unmap a model file once its arrays are no longer referenced. Returns
+    False if some array is still alive (e.g. in a request that is still
+    predicting); the map is then released with the last of them.
+    """
+    if mapping is None or mapping.closed:
+        return True
+    try:
+        mapping.close()
+    except BufferError:
+        return False
+    return True
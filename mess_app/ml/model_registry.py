@@ -0,0 +1,144 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('model', 'version', 'size')
+
+    def __init__(self, model, version, size):
+        self.model = model
+        self.version = version
+        self.size = size
+
+
+class ModelRegistry:
+    """
+    Process-wide LRU cache of loaded provider models.
+
+    Entries are keyed by provider id and validated against the artifact
+    version (mtime/size of the files on disk) on every lookup, so a model
+    retrained by another process is picked up on the next request.
+    The cache is bounded both by number of models and by approximate
+    memory (the on-disk artifact size of each cached model).
+    Models that are evicted, invalidated or replaced are closed (if they
+    have a close() method) so their memory-mapped files are released once
+    the last request using them is done.
+    """
+
+    def __init__(self, loader, max_entries=64, max_bytes=None):
+        self.loader = loader
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, provider_id):
+        """Return a loaded model for the provider, loading it on a miss."""
+        version = self.loader.artifact_version(provider_id)
+
+        with self._lock:
+            entry = self._entries.get(provider_id)
+            if entry is not None:
+                if entry.version == version:
+                    self._entries.move_to_end(provider_id)
+                    self.hits += 1
+                    return entry.model
+                self._drop(provider_id)
+                self.invalidations += 1
+            self.misses += 1
+
+        # Unpickling happens outside the lock so that one slow load does not
+        # block lookups for other providers.
+        model = self.loader(provider_id)
+        return self.put(provider_id, model, version)
+
+    def put(self, provider_id, model, version=None):
+        """Store an already loaded model, evicting least recently used ones.
+
+        ``version`` should be the artifact version observed *before* the
+        model was loaded, so that a concurrent retrain is never masked.
+        Returns the cached model: when two cold loads of the same version
+        race, the first one stored wins and the newcomer is discarded
+        (without closing it; nothing else references it).
+        """
+        if version is None:
+            version = self.loader.artifact_version(provider_id)
+        size = model.artifact_size()
+
+        with self._lock:
+            entry = self._entries.get(provider_id)
+            if entry is not None:
+                if entry.version == version:
+                    self._entries.move_to_end(provider_id)
+                    return entry.model
+                self._drop(provider_id)
+            self._entries[provider_id] = _Entry(model, version, size)
+            self._bytes += size
+            self._evict()
+            return model
+
+    def invalidate(self, provider_id):
+        """Forget the cached model for a provider (e.g. after retraining)."""
+        with self._lock:
+            if provider_id in self._entries:
+                self._drop(provider_id)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for provider_id in list(self._entries):
+                self._drop(provider_id)
+
+    def stats(self):
+        """Return cache counters for monitoring."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def __contains__(self, provider_id):
+        with self._lock:
+            return provider_id in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _drop(self, provider_id):
+        entry = self._entries.pop(provider_id)
+        self._bytes -= entry.size
+        # Requests may still hold the model; close() only lets go of its file map
+        close = getattr(entry.model, 'close', None)
+        if close is not None:
+            close()
+
+    def _evict(self):
+        # Always keep the most recently used entry, even if it alone is
+        # larger than the memory budget.
+        while len(self._entries) > 1 and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            provider_id, _ = next(iter(self._entries.items()))
+            self._drop(provider_id)
+            self.evictions += 1
+            logger.debug(f"Evicted model for provider {provider_id} from registry")
@@ -5,14 +5,41 @@ from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 import pickle
+import json
+import itertools
+import threading
+import time
 from pathlib import Path
 import logging
-from datetime import timedelta, date
+from datetime import datetime, timedelta, date, timezone as dt_timezone
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Count, Avg
+from django.db.models import Count, Avg, F, Q
+from .compact_forest import CompactForest
+from .model_file import close_mapping, read_model_file, write_model_file
+from .model_registry import ModelRegistry
+from .encoding import FeatureEncoder
+from .drift import baseline_segments, detect_drift, update_drift_monitor
+from .tuning import DEFAULT_FOREST_PARAMS, search_forest_params
 
 logger = logging.getLogger(__name__)
 
+MODEL_ROOT = Path(__file__).parent / 'provider_models'
+MODEL_FILE_NAME = 'model.bin'
+ARTIFACT_NAMES = (MODEL_FILE_NAME, 'tuning.json')
+# Separate pickles written before the single model file; still loaded, replaced on the next save
+LEGACY_ARTIFACT_NAMES = ('rf_model.pkl', 'encoders.pkl', 'scaler.pkl', 'prediction_grid.json', 'stats.pkl')
+FEATURE_KEYS = ('day', 'type', 'holiday', 'meal')
+
+
+def default_interval_coverage():
+    return getattr(settings, 'PROVIDER_PREDICTION_INTERVAL_COVERAGE', 0.8)
+
+
+def use_mmap():
+    # Windows cannot replace a model file that another process still maps
+    return getattr(settings, 'PROVIDER_MODEL_MMAP', os.name != 'nt')
+
 
 def convert_to_json_safe(stats):
     """Convert NumPy types to Python native types for JSON serialization."""
@@ -33,99 +60,454 @@ def convert_to_json_safe(stats):
     return safe_stats
 
 
-class ProviderDishModel:
-    """Provider-specific dish recommendation and prediction model."""
+def untrained_stats():
+    """Statistics of a model that has not been trained yet."""
+    return {
+        'avg_attendance': 50,
+        'min_attendance': 10,
+        'max_attendance': 100,
+        'total_samples': 0,
+        'dish_performance': {},
+        'best_dishes': [],
+        'worst_dishes': [],
+        'day_patterns': {},
+        'meal_patterns': {}
+    }
+
+
+def fit_feature_encoders(df):
+    """Fit one one-hot encoder per feature on df; returns (encoders, encoded feature matrix)."""
+    encoders = {}
+    feature_columns = {
+        'day': ['day_of_week'],
+        'type': ['dish_type'],
+        'holiday': ['holiday'],
+        'meal': ['meal_type']
+    }
+    
+    for key, cols in feature_columns.items():
+        encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+        encoder.fit(df[cols])
+        encoders[key] = encoder
+    
+    # Encode features
+    encoded_parts = []
+    for key in FEATURE_KEYS:
+        encoded = encoders[key].transform(df[[encoders[key].feature_names_in_[0]]])
+        encoded_parts.append(encoded)
+    
+    return encoders, np.hstack(encoded_parts)
+
+
+def describe_history(df):
+    """Attendance statistics and dish/day/meal patterns of a training history."""
+    stats = {
+        'avg_attendance': float(df['attended_students'].mean()),
+        'min_attendance': int(df['attended_students'].min()),
+        'max_attendance': int(df['attended_students'].max()),
+        'total_samples': int(len(df)),
+    }
+    _analyze_dish_performance(df, stats)
+    _analyze_day_patterns(df, stats)
+    _analyze_meal_patterns(df, stats)
+    # Per-segment attendance the drift monitor compares new meals with
+    stats['segment_baseline'] = baseline_segments(df)
+    return stats
+
+
+def _analyze_dish_performance(df, stats):
+    """Analyze which dishes perform best."""
+    # Group by dish_type and calculate average attendance
+    if 'dish_name' in df.columns:
+        dish_stats = df.groupby('dish_name')['attended_students'].agg(['mean', 'count']).reset_index()
+        dish_stats.columns = ['dish_name', 'avg_attendance', 'count']
+        dish_stats = dish_stats[dish_stats['count'] >= 3]  # At least 3 occurrences
+        dish_stats = dish_stats.sort_values('avg_attendance', ascending=False)
+        
+        stats['dish_performance'] = {
+            row['dish_name']: {
+                'avg_attendance': float(row['avg_attendance']),
+                'count': int(row['count'])
+            }
+            for _, row in dish_stats.iterrows()
+        }
+        
+        # Best and worst performing dishes
+        if len(dish_stats) > 0:
+            stats['best_dishes'] = dish_stats.head(3)['dish_name'].tolist()
+            stats['worst_dishes'] = dish_stats.tail(3)['dish_name'].tolist()
+    
+    # By dish type (veg/nonveg)
+    type_stats = df.groupby('dish_type')['attended_students'].agg(['mean', 'count']).reset_index()
+    stats['type_performance'] = {
+        row['dish_type']: {
+            'avg_attendance': float(row['mean']),
+            'count': int(row['count'])
+        }
+        for _, row in type_stats.iterrows()
+    }
+
+
+def _analyze_day_patterns(df, stats):
+    """Analyze attendance patterns by day of week."""
+    day_stats = df.groupby('day_of_week')['attended_students'].agg(['mean', 'count']).reset_index()
+    stats['day_patterns'] = {
+        row['day_of_week']: {
+            'avg_attendance': float(row['mean']),
+            'count': int(row['count'])
+        }
+        for _, row in day_stats.iterrows()
+    }
+    
+    # Best and worst days
+    day_stats = day_stats.sort_values('mean', ascending=False)
+    if len(day_stats) > 0:
+        stats['best_days'] = day_stats.head(3)['day_of_week'].tolist()
+        stats['worst_days'] = day_stats.tail(3)['day_of_week'].tolist()
+
+
+def _analyze_meal_patterns(df, stats):
+    """Analyze attendance patterns by meal time."""
+    meal_stats = df.groupby('meal_type')['attended_students'].agg(['mean', 'count']).reset_index()
+    stats['meal_patterns'] = {
+        row['meal_type']: {
+            'avg_attendance': float(row['mean']),
+            'count': int(row['count'])
+        }
+        for _, row in meal_stats.iterrows()
+    }
+
+
+class DishPredictor:
+    """
+    Prediction half of a dish model: the precomputed grids, point and
+    interval predictions and recommendations for one provider.
+
+    Subclasses set provider_id, rf_model, encoders, feature_encoder, scaler,
+    stats, prediction_grid, interval_grid, interval_coverage and _buffers.
+    """
+    
+    def _grid_axes(self):
+        """Fitted categories of each feature, in FEATURE_KEYS order."""
+        return [self.encoders[key].categories_[0].tolist() for key in FEATURE_KEYS]
+    
+    def _build_prediction_grid(self):
+        """
+        Score every combination of the fitted categories once, so that
+        request-time predictions are table lookups instead of forest calls.
+        """
+        rows = list(itertools.product(*self._grid_axes()))
+        self.prediction_grid = dict(zip(rows, self._predict_forest(rows)))
+        self._build_interval_grid(rows)
+    
+    def _build_interval_grid(self, rows=None):
+        rows = rows if rows is not None else list(itertools.product(*self._grid_axes()))
+        self.interval_coverage = default_interval_coverage()
+        self.interval_grid = dict(zip(rows, self._forest_intervals(rows, self.interval_coverage)))
+    
+    def _grid_artifact(self):
+        """Compact JSON form of the grid: the axes plus row-major value and interval lists."""
+        axes = self._grid_axes()
+        rows = list(itertools.product(*axes))
+        return {
+            'axes': dict(zip(FEATURE_KEYS, axes)),
+            'values': [self.prediction_grid[row] for row in rows],
+            'coverage': self.interval_coverage,
+            'lower': [self.interval_grid[row][0] for row in rows],
+            'upper': [self.interval_grid[row][1] for row in rows],
+        }
+    
+    def _use_grid_artifact(self, artifact):
+        axes = [artifact['axes'][key] for key in FEATURE_KEYS]
+        rows = list(itertools.product(*axes))
+        self.prediction_grid = dict(zip(rows, artifact['values']))
+        if artifact.get('coverage') == default_interval_coverage():
+            self.interval_coverage = artifact['coverage']
+            self.interval_grid = dict(zip(rows, zip(artifact['lower'], artifact['upper'])))
+        else:
+            # Grids saved before intervals existed, or for another coverage
+            self._build_interval_grid(rows)
+    
+    def predict(self, day_of_week, dish_type, holiday, meal_type):
+        """Predict attendance for given parameters."""
+        return self.predict_many([(day_of_week, dish_type, holiday, meal_type)])[0]
+    
+    def _input_buffer(self, n_rows, width):
+        """
+        The first n_rows of this thread's input matrix, grown when a call
+        needs more rows. Only valid until the thread's next _encode().
+        """
+        buffer = getattr(self._buffers, 'array', None)
+        if buffer is None or len(buffer) < n_rows or buffer.shape[1] != width:
+            buffer = self._buffers.array = np.zeros((n_rows, width))
+        return buffer[:n_rows]
+    
+    def _encode(self, rows):
+        """One-hot encode (day_of_week, dish_type, holiday, meal_type) rows into one matrix."""
+        return self.feature_encoder.transform(rows, out=self._input_buffer(len(rows), self.feature_encoder.width))
+    
+    def predict_many(self, rows):
+        """
+        Predict attendance for many (day_of_week, dish_type, holiday, meal_type) rows.
+        Known category combinations are answered from the precomputed grid; the
+        remaining rows are scored together with a single forest call.
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return []
+        
+        if self.rf_model is None:
+            logger.warning(f"No model available for provider {self.provider_id}, using average")
+            return [int(self.stats['avg_attendance'])] * len(rows)
+        
+        try:
+            predictions = [self.prediction_grid.get(row) for row in rows]
+            missing = [i for i, value in enumerate(predictions) if value is None]
+            if missing:
+                for i, value in zip(missing, self._predict_forest([rows[i] for i in missing])):
+                    predictions[i] = value
+            return predictions
+        
+        except Exception as e:
+            logger.error(f"Prediction error for provider {self.provider_id}: {e}")
+            return [int(self.stats['avg_attendance'])] * len(rows)
+    
+    def _predict_forest(self, rows):
+        """Score rows with the random forest, clipped to the observed attendance range."""
+        X = self._encode(rows)
+        
+        pred_scaled = self.rf_model.predict(X)
+        predicted = self.scaler.inverse_transform(pred_scaled.reshape(-1, 1)).ravel()
+        
+        # Clip to reasonable range
+        predicted = np.clip(predicted, self.stats['min_attendance'], self.stats['max_attendance'])
+        
+        return [int(v) for v in np.rint(predicted)]
+    
+    def predict_intervals(self, rows, coverage=None):
+        """
+        Point predictions with a prediction interval for many
+        (day_of_week, dish_type, holiday, meal_type) rows.
+        
+        The interval spans the central `coverage` fraction (default
+        PROVIDER_PREDICTION_INTERVAL_COVERAGE) of the individual trees'
+        predictions. Returns one {'predicted', 'lower', 'upper'} dict per row;
+        bounds are None when no model is trained.
+        """
+        rows = [tuple(row) for row in rows]
+        predictions = self.predict_many(rows)
+        if self.rf_model is None or not rows:
+            return [{'predicted': value, 'lower': None, 'upper': None} for value in predictions]
+        
+        coverage = coverage or default_interval_coverage()
+        try:
+            if coverage == self.interval_coverage:
+                bounds = [self.interval_grid.get(row) for row in rows]
+            else:
+                bounds = [None] * len(rows)
+            missing = [i for i, value in enumerate(bounds) if value is None]
+            if missing:
+                for i, value in zip(missing, self._forest_intervals([rows[i] for i in missing], coverage)):
+                    bounds[i] = value
+        except Exception as e:
+            logger.error(f"Interval prediction error for provider {self.provider_id}: {e}")
+            bounds = [(None, None)] * len(rows)
+        
+        return [
+            {
+                'predicted': value,
+                'lower': min(lower, value) if lower is not None else None,
+                'upper': max(upper, value) if upper is not None else None,
+            }
+            for value, (lower, upper) in zip(predictions, bounds)
+        ]
+    
+    def predict_interval(self, day_of_week, dish_type, holiday, meal_type, coverage=None):
+        return self.predict_intervals([(day_of_week, dish_type, holiday, meal_type)], coverage)[0]
+    
+    def _per_tree_predictions(self, rows):
+        """(n_rows, n_trees) array of every tree's prediction, in students."""
+        scaled = self.rf_model.tree_predictions(self._encode(rows))
+        return scaled * self.scaler.scale_[0] + self.scaler.mean_[0]
+    
+    def _forest_intervals(self, rows, coverage):
+        """(lower, upper) quantiles of the per-tree predictions, clipped like _predict_forest."""
+        alpha = (1 - coverage) / 2
+        bounds = np.quantile(self._per_tree_predictions(rows), [alpha, 1 - alpha], axis=1)
+        bounds = np.rint(np.clip(bounds, self.stats['min_attendance'], self.stats['max_attendance']))
+        return [(int(lower), int(upper)) for lower, upper in bounds.T]
+    
+    def get_recommendations(self, day_of_week, meal_type, holiday='None', limit=3):
+        """Get top dish recommendations for given parameters."""
+        from provider.models import MenuItem
+        
+        # Get provider's dishes
+        dishes = list(
+            MenuItem.objects.filter(provider_id=self.provider_id)
+            .values_list('dish_name', 'dish_type', 'is_special')
+        )
+        
+        dish_types = [dish_type.lower() if dish_type else 'veg' for _, dish_type, _ in dishes]
+        predictions = self.predict_intervals(
+            (day_of_week, dish_type, holiday, meal_type) for dish_type in dish_types
+        )
+        
+        recommendations = [
+            {
+                'dish_name': dish_name,
+                'dish_type': dish_type,
+                'predicted_attendance': predicted['predicted'],
+                'lower': predicted['lower'],
+                'upper': predicted['upper'],
+                'is_special': is_special
+            }
+            for (dish_name, _, is_special), dish_type, predicted in zip(dishes, dish_types, predictions)
+        ]
+        
+        # Sort by predicted attendance
+        recommendations.sort(key=lambda x: x['predicted_attendance'], reverse=True)
+        
+        return recommendations[:limit]
+    
+    def count_historical_records(self, days=None):
+        """Number of (date, meal) training records available, in a single query."""
+        from student.models import AttendanceSummary
+        
+        start_date, end_date = history_window(days)
+        return AttendanceSummary.objects.filter(
+            provider_id=self.provider_id,
+            date__range=[start_date, end_date],
+            present_count__gt=0
+        ).count()
+    
+    def get_historical_data_from_db(self, days=None):
+        """Fetch historical data from database (see historical_frame)."""
+        return historical_frame(self.provider_id, days)
+
+
+class ProviderDishModel(DishPredictor):
+    """Provider-specific dish recommendation and prediction model, trained on its own history."""
     
-    def __init__(self, provider_id):
+    def __init__(self, provider_id, model_dir=None):
         self.provider_id = provider_id
-        self.model_dir = Path(__file__).parent / 'provider_models' / f'provider_{provider_id}'
-        self.model_dir.mkdir(parents=True, exist_ok=True)
+        self.model_dir = Path(model_dir) if model_dir else self.get_model_dir(provider_id)
         
+        self.model_file = self.model_dir / MODEL_FILE_NAME
         self.model_path = self.model_dir / 'rf_model.pkl'
         self.encoders_path = self.model_dir / 'encoders.pkl'
         self.scaler_path = self.model_dir / 'scaler.pkl'
         self.stats_path = self.model_dir / 'stats.pkl'
+        self.grid_path = self.model_dir / 'prediction_grid.json'
+        self.tuning_path = self.model_dir / 'tuning.json'
         
         self.rf_model = None
         self.encoders = {}
+        self.feature_encoder = None
         self.scaler = None
-        self.stats = {
-            'avg_attendance': 50,
-            'min_attendance': 10,
-            'max_attendance': 100,
-            'total_samples': 0,
-            'dish_performance': {},
-            'best_dishes': [],
-            'worst_dishes': [],
-            'day_patterns': {},
-            'meal_patterns': {}
-        }
+        self.prediction_grid = {}
+        self.interval_grid = {}
+        self.interval_coverage = None
+        self._buffers = threading.local()
+        self._mapping = None
+        self.stats = untrained_stats()
         
         self._load_model()
     
+    @staticmethod
+    def get_model_dir(provider_id):
+        return MODEL_ROOT / f'provider_{provider_id}'
+    
+    @classmethod
+    def artifact_version(cls, provider_id):
+        """Return a cheap fingerprint of the saved artifacts, or None if untrained.
+
+        The model file is renamed into place by _save_model, so its mtime/size
+        changes whenever a new model has been saved. Legacy models are
+        fingerprinted by stats.pkl, the last pickle they wrote.
+        """
+        model_dir = cls.get_model_dir(provider_id)
+        for name in (MODEL_FILE_NAME, 'stats.pkl'):
+            try:
+                st = (model_dir / name).stat()
+            except OSError:
+                continue
+            return (st.st_mtime_ns, st.st_size)
+        return None
+    
+    def artifact_size(self):
+        """Total size of the saved artifacts in bytes (approximate memory footprint)."""
+        total = 0
+        for name in ARTIFACT_NAMES + LEGACY_ARTIFACT_NAMES:
+            try:
+                total += (self.model_dir / name).stat().st_size
+            except OSError:
+                pass
+        return total
+    
+    def close(self):
+        """
+        Release the model file's memory map. The model keeps predicting: while
+        its forest still references the arrays the map stays open and is
+        freed together with the model. ModelRegistry calls this when it evicts or replaces the model.
+        """
+        if self._mapping is not None:
+            close_mapping(self._mapping)
+            self._mapping = None
+    
     def _load_model(self):
         """Load existing model if available."""
         try:
+            if self.model_file.exists():
+                arrays, meta, self._mapping = read_model_file(self.model_file, use_mmap=use_mmap())
+                self.rf_model = CompactForest(arrays, **meta['forest'])
+                self.encoders = meta['encoders']
+                self.scaler = meta['scaler']
+                self.stats = meta['stats']
+                self.feature_encoder = FeatureEncoder.from_encoders(self.encoders, FEATURE_KEYS)
+                self._use_grid_artifact(meta['grid'])
+                logger.info(f"Model loaded for provider {self.provider_id}")
+                return True
             if self.model_path.exists():
                 with open(self.model_path, 'rb') as f:
-                    self.rf_model = pickle.load(f)
+                    self.rf_model = CompactForest.from_sklearn(pickle.load(f))
                 with open(self.encoders_path, 'rb') as f:
                     self.encoders = pickle.load(f)
                 with open(self.scaler_path, 'rb') as f:
                     self.scaler = pickle.load(f)
                 with open(self.stats_path, 'rb') as f:
                     self.stats = pickle.load(f)
-                logger.info(f"Model loaded for provider {self.provider_id}")
+                self.feature_encoder = FeatureEncoder.from_encoders(self.encoders, FEATURE_KEYS)
+                self._load_prediction_grid()
+                logger.info(f"Legacy model loaded for provider {self.provider_id}")
                 return True
         except Exception as e:
             logger.warning(f"Could not load model for provider {self.provider_id}: {e}")
         return False
     
-    def train(self, df):
-        """Train provider-specific model with enhanced analytics."""
+    def _check_training_data(self, df):
         if df.empty or len(df) < 20:
             raise ValueError("Insufficient data for training. Need at least 20 records.")
+    
+    def train(self, df, n_jobs=-1, params=None, tuning=None):
+        """
+        Train provider-specific model with enhanced analytics.
+        `params` override the forest settings (DEFAULT_FOREST_PARAMS); `tuning`
+        is the search summary that chose them and is saved with the artifacts.
+        """
+        self._check_training_data(df)
         
         logger.info(f"Training model for provider {self.provider_id} with {len(df)} samples")
         
-        # Calculate basic statistics
-        self.stats = {
-            'avg_attendance': float(df['attended_students'].mean()),
-            'min_attendance': int(df['attended_students'].min()),
-            'max_attendance': int(df['attended_students'].max()),
-            'total_samples': int(len(df))
-        }
-        
-        # Analyze dish performance
-        self._analyze_dish_performance(df)
-        
-        # Analyze day patterns
-        self._analyze_day_patterns(df)
+        forest_params = {**DEFAULT_FOREST_PARAMS, **(params or {})}
         
-        # Analyze meal patterns
-        self._analyze_meal_patterns(df)
-        
-        # Prepare encoders
-        self.encoders = {}
-        feature_columns = {
-            'day': ['day_of_week'],
-            'type': ['dish_type'],
-            'holiday': ['holiday'],
-            'meal': ['meal_type']
+        self.stats = {
+            **describe_history(df),
+            'trained_at': timezone.now().isoformat(),
+            'forest_params': forest_params,
+            'tuning': tuning,
         }
         
-        for key, cols in feature_columns.items():
-            encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
-            encoder.fit(df[cols])
-            self.encoders[key] = encoder
-        
-        # Encode features
-        encoded_parts = []
-        for key in ['day', 'type', 'holiday', 'meal']:
-            encoded = self.encoders[key].transform(df[[self.encoders[key].feature_names_in_[0]]])
-            encoded_parts.append(encoded)
-        
-        X = np.hstack(encoded_parts)
+        X = self._fit_encoders(df)
         y = df['attended_students'].values
         
         # Scale target
@@ -133,12 +515,10 @@ class ProviderDishModel:
         y_scaled = self.scaler.fit_transform(y.reshape(-1, 1)).ravel()
         
         # Train Random Forest
-        self.rf_model = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            min_samples_split=5,
+        forest = RandomForestRegressor(
             random_state=42,
-            n_jobs=-1
+            n_jobs=n_jobs,
+            **forest_params
         )
         
         # Split if enough data
@@ -146,14 +526,18 @@ class ProviderDishModel:
             X_train, X_test, y_train, y_test = train_test_split(
                 X, y_scaled, test_size=0.2, random_state=42
             )
-            self.rf_model.fit(X_train, y_train)
-            score = float(self.rf_model.score(X_test, y_test))
+            forest.fit(X_train, y_train)
+            score = float(forest.score(X_test, y_test))
             self.stats['model_score'] = score
             logger.info(f"Model R² score: {score:.4f}")
         else:
-            self.rf_model.fit(X, y_scaled)
+            forest.fit(X, y_scaled)
             self.stats['model_score'] = None
         
+        # Served (and saved) as compact node arrays; sklearn's forest is dropped
+        self.rf_model = CompactForest.from_sklearn(forest)
+        self._build_prediction_grid()
+        
         # Save model
         self._save_model()
         
@@ -162,216 +546,661 @@ class ProviderDishModel:
         
         return True
     
-    def _analyze_dish_performance(self, df):
-        """Analyze which dishes perform best."""
-        # Group by dish_type and calculate average attendance
-        if 'dish_name' in df.columns:
-            dish_stats = df.groupby('dish_name')['attended_students'].agg(['mean', 'count']).reset_index()
-            dish_stats.columns = ['dish_name', 'avg_attendance', 'count']
-            dish_stats = dish_stats[dish_stats['count'] >= 3]  # At least 3 occurrences
-            dish_stats = dish_stats.sort_values('avg_attendance', ascending=False)
-            
-            self.stats['dish_performance'] = {
-                row['dish_name']: {
-                    'avg_attendance': float(row['avg_attendance']),
-                    'count': int(row['count'])
-                }
-                for _, row in dish_stats.iterrows()
-            }
-            
-            # Best and worst performing dishes
-            if len(dish_stats) > 0:
-                self.stats['best_dishes'] = dish_stats.head(3)['dish_name'].tolist()
-                self.stats['worst_dishes'] = dish_stats.tail(3)['dish_name'].tolist()
-        
-        # By dish type (veg/nonveg)
-        type_stats = df.groupby('dish_type')['attended_students'].agg(['mean', 'count']).reset_index()
-        self.stats['type_performance'] = {
-            row['dish_type']: {
-                'avg_attendance': float(row['mean']),
-                'count': int(row['count'])
-            }
-            for _, row in type_stats.iterrows()
-        }
-    
-    def _analyze_day_patterns(self, df):
-        """Analyze attendance patterns by day of week."""
-        day_stats = df.groupby('day_of_week')['attended_students'].agg(['mean', 'count']).reset_index()
-        self.stats['day_patterns'] = {
-            row['day_of_week']: {
-                'avg_attendance': float(row['mean']),
-                'count': int(row['count'])
-            }
-            for _, row in day_stats.iterrows()
-        }
+    def tune(self, df, param_grid=None, n_folds=None, n_jobs=-1):
+        """
+        Backtest a grid of forest settings on the time-ordered history `df`
+        (see tuning.search_forest_params), then train on all of it with the
+        best one. Returns the search summary.
+        """
+        self._check_training_data(df)
         
-        # Best and worst days
-        day_stats = day_stats.sort_values('mean', ascending=False)
-        if len(day_stats) > 0:
-            self.stats['best_days'] = day_stats.head(3)['day_of_week'].tolist()
-            self.stats['worst_days'] = day_stats.tail(3)['day_of_week'].tolist()
-    
-    def _analyze_meal_patterns(self, df):
-        """Analyze attendance patterns by meal time."""
-        meal_stats = df.groupby('meal_type')['attended_students'].agg(['mean', 'count']).reset_index()
-        self.stats['meal_patterns'] = {
-            row['meal_type']: {
-                'avg_attendance': float(row['mean']),
-                'count': int(row['count'])
-            }
-            for _, row in meal_stats.iterrows()
-        }
+        X = self._fit_encoders(df)
+        tuning = search_forest_params(
+            X, df['attended_students'].values, param_grid=param_grid, n_folds=n_folds, n_jobs=n_jobs
+        )
+        logger.info(
+            f"Best forest for provider {self.provider_id}: {tuning['best_params']} "
+            f"(backtest MAE {tuning['metrics']['mae']:.2f})"
+        )
+        self.train(df, n_jobs=n_jobs, params=tuning['best_params'], tuning=tuning)
+        return tuning
     
-    def _save_model(self):
-        """Save model and preprocessors."""
-        with open(self.model_path, 'wb') as f:
-            pickle.dump(self.rf_model, f)
-        with open(self.encoders_path, 'wb') as f:
-            pickle.dump(self.encoders, f)
-        with open(self.scaler_path, 'wb') as f:
-            pickle.dump(self.scaler, f)
-        with open(self.stats_path, 'wb') as f:
-            pickle.dump(self.stats, f)
+    def _fit_encoders(self, df):
+        """Fit the one-hot encoders on df and return its encoded feature matrix."""
+        self.encoders, X = fit_feature_encoders(df)
+        self.feature_encoder = FeatureEncoder.from_encoders(self.encoders, FEATURE_KEYS)
+        return X
     
-    def predict(self, day_of_week, dish_type, holiday, meal_type):
-        """Predict attendance for given parameters."""
-        if self.rf_model is None:
-            logger.warning(f"No model available for provider {self.provider_id}, using average")
-            return int(self.stats['avg_attendance'])
+    def _save_model(self):
+        """Save the forest, preprocessors, statistics and grid as one model file (see model_file)."""
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        # tuning.json is a human-readable copy of stats['tuning']
+        if self.stats.get('tuning'):
+            with open(self.tuning_path, 'w') as f:
+                json.dump(self.stats['tuning'], f, indent=2)
+        else:
+            self.tuning_path.unlink(missing_ok=True)
+        write_model_file(self.model_file, self.rf_model.to_arrays(), {
+            'forest': self.rf_model.meta(),
+            'encoders': self.encoders,
+            'scaler': self.scaler,
+            'stats': self.stats,
+            'grid': self._grid_artifact(),
+        })
+        for name in LEGACY_ARTIFACT_NAMES:
+            (self.model_dir / name).unlink(missing_ok=True)
         
+        # Drop any stale copy cached in this process; other processes notice
+        # the new artifact version on their next lookup. Models saved elsewhere
+        # (e.g. evaluation's temporary directories) are not the served ones.
+        if self.model_dir == self.get_model_dir(self.provider_id):
+            model_registry.invalidate(self.provider_id)
+    
+    def _load_prediction_grid(self):
+        """Grid of a legacy model, saved next to its pickles."""
         try:
-            # Prepare input
-            features = {
-                'day': pd.DataFrame([[day_of_week]], columns=['day_of_week']),
-                'type': pd.DataFrame([[dish_type]], columns=['dish_type']),
-                'holiday': pd.DataFrame([[holiday]], columns=['holiday']),
-                'meal': pd.DataFrame([[meal_type]], columns=['meal_type'])
-            }
-            
-            # Encode
-            encoded_parts = []
-            for key in ['day', 'type', 'holiday', 'meal']:
-                encoded = self.encoders[key].transform(features[key])
-                encoded_parts.append(encoded)
-            
-            X = np.hstack(encoded_parts)
-            
-            # Predict
-            pred_scaled = self.rf_model.predict(X)[0]
-            predicted = self.scaler.inverse_transform([[pred_scaled]])[0][0]
-            
-            # Clip to reasonable range
-            predicted = np.clip(predicted, self.stats['min_attendance'], self.stats['max_attendance'])
-            
-            return int(round(predicted))
+            with open(self.grid_path) as f:
+                self._use_grid_artifact(json.load(f))
+        except FileNotFoundError:
+            # Models trained before the grid existed: materialize it in memory.
+            self._build_prediction_grid()
+
+
+def history_window(days=None):
+    days = days or getattr(settings, 'PROVIDER_MODEL_HISTORY_DAYS', 60)
+    end_date = timezone.now().date()
+    return end_date - timedelta(days=days), end_date
+
+
+def historical_frame(provider_id, days=None):
+    """
+    A provider's training history, one row per attended meal.
+    Uses three queries regardless of window length: the daily attendance
+    summary, mess holidays and the first menu item of every daily menu.
+    """
+    from student.models import AttendanceSummary
+    
+    # Default to the last PROVIDER_MODEL_HISTORY_DAYS (60) days of data
+    start_date, end_date = history_window(days)
+    
+    # Get attendance records (one pre-aggregated row per meal)
+    attendance_records = AttendanceSummary.objects.filter(
+        provider_id=provider_id,
+        date__range=[start_date, end_date],
+        present_count__gt=0
+    ).values('date', 'meal_type', attended_students=F('present_count')).order_by('date', 'meal_type')
+    
+    holidays = mess_holiday_meals(provider_id, start_date, end_date)
+    dishes = main_dishes(provider_id, start_date, end_date)
+    
+    data = []
+    for record in attendance_records:
+        date = record['date']
+        meal_type = record['meal_type']
+        key = (date, meal_type.upper())
+        
+        dish_name, dish_type = dishes.get(key, (None, None))
+        
+        data.append({
+            'day_of_week': date.strftime('%a'),
+            'dish_name': dish_name,
+            'dish_type': dish_type.lower() if dish_type else 'veg',
+            'holiday': 'Yes' if key in holidays else 'None',
+            'meal_type': meal_type.capitalize(),
+            'attended_students': record['attended_students']
+        })
+    
+    return pd.DataFrame(data)
+
+
+def meals_of(meal_type):
+    """The meals ('LUNCH', 'DINNER') covered by a meal type; BOTH covers lunch and dinner."""
+    meal_type = meal_type.upper()
+    return ('LUNCH', 'DINNER') if meal_type == 'BOTH' else (meal_type,)
+
+
+def mess_holiday_meals(provider_id, start_date, end_date):
+    """Set of (date, meal) the mess is closed on, in one query."""
+    from provider.models import MessHoliday
+    
+    holidays = set()
+    for date, meal_type in MessHoliday.objects.filter(
+        provider_id=provider_id,
+        date__range=[start_date, end_date]
+    ).values_list('date', 'meal_type'):
+        holidays.update((date, meal) for meal in meals_of(meal_type))
+    return holidays
+
+
+def main_dishes(provider_id, start_date, end_date):
+    """(dish_name, dish_type) of the main (first) item of every daily menu, keyed by (date, meal)."""
+    from provider.models import DailyMenu
+    
+    dishes = {}
+    menu_links = DailyMenu.menu_items.through.objects.filter(
+        dailymenu__provider_id=provider_id,
+        dailymenu__date__range=[start_date, end_date]
+    ).order_by('dailymenu_id', 'menuitem_id').values_list(
+        'dailymenu__date', 'dailymenu__meal_type', 'menuitem__dish_name', 'menuitem__dish_type'
+    )
+    for date, meal_type, dish_name, dish_type in menu_links:
+        dishes.setdefault((date, meal_type.upper()), (dish_name, dish_type))
+    return dishes
+
+
+# Global model mode (PROVIDER_MODEL_MODE = 'global'): one forest over every
+# provider's history, with provider-level features appended to the usual four.
+
+GLOBAL_MODEL_NAME = 'global_model.bin'
+PLAN_MEAL_TYPES = ('LUNCH', 'DINNER', 'BOTH')  # MessPlan.MealType values
+MESS_TYPES = ('VEG', 'NON-VEG', 'BOTH')  # MessPlan.MessType values
+
+
+def model_mode():
+    """'provider' (one model per provider, the default) or 'global'."""
+    return getattr(settings, 'PROVIDER_MODEL_MODE', 'provider')
+
+
+def provider_features(provider_ids):
+    """
+    Provider-level features of the global model, keyed by provider id, in one query:
+    active subscriber count, plan mix (share of active subscribers per plan
+    meal type, or of plans while nobody is subscribed) and mess type
+    (VEG/NON-VEG, or BOTH when the plans offer both).
+    """
+    from provider.models import MessPlan
+    
+    provider_ids = list(provider_ids)
+    plans = MessPlan.objects.filter(provider_id__in=provider_ids).values(
+        'provider_id', 'meal_type', 'mess_type'
+    ).annotate(
+        plans=Count('id', distinct=True),
+        subscribers=Count('active_subscriptions', filter=Q(active_subscriptions__is_active=True)),
+    )
+    
+    grouped = {provider_id: [] for provider_id in provider_ids}
+    for plan in plans:
+        grouped[plan['provider_id']].append(plan)
+    
+    features = {}
+    for provider_id, rows in grouped.items():
+        subscribers = sum(row['subscribers'] for row in rows)
+        weight = 'subscribers' if subscribers else 'plans'
+        total = sum(row[weight] for row in rows)
+        mix = dict.fromkeys(PLAN_MEAL_TYPES, 0.0)
+        for row in rows:
+            if row['meal_type'] in mix:
+                mix[row['meal_type']] += row[weight] / total
+        offered = {row['mess_type'] for row in rows}
+        if 'BOTH' in offered or {'VEG', 'NON-VEG'} <= offered:
+            mess_type = 'BOTH'
+        else:
+            mess_type = next(iter(offered), None)
+        features[provider_id] = {'active_subscribers': subscribers, 'plan_mix': mix, 'mess_type': mess_type}
+    return features
+
+
+def provider_vector(features):
+    """Numeric encoding of provider_features() appended to every row of the global model."""
+    features = features or {}
+    mix = features.get('plan_mix') or {}
+    return np.array(
+        [float(features.get('active_subscribers', 0))]
+        + [float(mix.get(meal_type, 0.0)) for meal_type in PLAN_MEAL_TYPES]
+        + [1.0 if features.get('mess_type') == mess_type else 0.0 for mess_type in MESS_TYPES]
+    )
+
+
+class GlobalDishModel:
+    """
+    One dish attendance model shared by every provider, saved as a single
+    model file with the forest, encoders, scaler, the provider features it
+    was trained with and each provider's statistics and prediction grid.
+    Providers are served through GlobalProviderModel views, so providers
+    with little or no history still get predictions.
+    """
+    
+    def __init__(self, path=None):
+        self.path = Path(path) if path else self.get_path()
+        self.version = self.artifact_version(self.path)
         
+        self.rf_model = None
+        self.encoders = {}
+        self.feature_encoder = None
+        self.scaler = None
+        self.features = {}
+        self.provider_stats = {}
+        self.grids = {}
+        self._mapping = None
+        self.stats = untrained_stats()
+        
+        self._load_model()
+    
+    @staticmethod
+    def get_path():
+        return MODEL_ROOT / 'global' / GLOBAL_MODEL_NAME
+    
+    @classmethod
+    def artifact_version(cls, path=None):
+        """Fingerprint (mtime, size) of the saved artifact, or None if untrained."""
+        try:
+            st = Path(path or cls.get_path()).stat()
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
+    def artifact_size(self):
+        try:
+            return self.path.stat().st_size
+        except OSError:
+            return 0
+    
+    def close(self):
+        """
+        Release the model file's memory map. The model keeps predicting: while
+        its forest still references the arrays the map stays open and is
+        freed together with the model. get_global_model() calls this once a newer artifact replaces it.
+        """
+        if self._mapping is not None:
+            close_mapping(self._mapping)
+            self._mapping = None
+    
+    def _load_model(self):
+        try:
+            if self.path.exists():
+                arrays, meta, self._mapping = read_model_file(self.path, use_mmap=use_mmap())
+                self.rf_model = CompactForest(arrays, **meta['forest'])
+                self.encoders = meta['encoders']
+                self.scaler = meta['scaler']
+                self.features = meta['features']
+                self.provider_stats = meta['provider_stats']
+                self.grids = meta['grids']
+                self.stats = meta['stats']
+                self.feature_encoder = FeatureEncoder.from_encoders(self.encoders, FEATURE_KEYS)
+                logger.info(f"Global model loaded ({len(self.features)} providers)")
+                return True
         except Exception as e:
-            logger.error(f"Prediction error for provider {self.provider_id}: {e}")
-            return int(self.stats['avg_attendance'])
+            logger.warning(f"Could not load global model: {e}")
+        return False
     
-    def get_recommendations(self, day_of_week, meal_type, holiday='None'):
-        """Get top 3 dish recommendations for given parameters."""
-        from provider.models import MenuItem
+    def train(self, frames, features, n_jobs=-1, params=None):
+        """
+        Train on the histories of many providers.
+        `frames` maps provider id to its history (historical_frame) and
+        `features` maps provider id to its provider_features(); grids are
+        built for every provider in `features`, with or without history.
+        """
+        histories = [frame.assign(provider_id=provider_id) for provider_id, frame in frames.items() if not frame.empty]
+        df = pd.concat(histories, ignore_index=True) if histories else pd.DataFrame()
+        if len(df) < 20:
+            raise ValueError("Insufficient data for training. Need at least 20 records across all providers.")
         
-        # Get provider's dishes
-        dishes = MenuItem.objects.filter(provider_id=self.provider_id)
-        
-        recommendations = []
-        for dish in dishes:
-            dish_type = dish.dish_type.lower() if dish.dish_type else 'veg'
-            predicted = self.predict(day_of_week, dish_type, holiday, meal_type)
-            
-            recommendations.append({
-                'dish_name': dish.dish_name,
-                'dish_type': dish_type,
-                'predicted_attendance': predicted,
-                'is_special': dish.is_special
-            })
+        logger.info(f"Training global model with {len(df)} samples from {len(histories)} providers")
         
-        # Sort by predicted attendance
-        recommendations.sort(key=lambda x: x['predicted_attendance'], reverse=True)
+        forest_params = {**DEFAULT_FOREST_PARAMS, **(params or {})}
+        self.features = dict(features)
+        self.stats = {
+            **describe_history(df),
+            'trained_at': timezone.now().isoformat(),
+            'forest_params': forest_params,
+            'providers': len(histories),
+        }
+        self.provider_stats = {
+            provider_id: describe_history(frame) for provider_id, frame in frames.items() if not frame.empty
+        }
         
-        return recommendations[:3]
-    
-    def get_historical_data_from_db(self):
-        """Fetch historical data from database."""
-        from student.models import Attendance
-        from provider.models import DailyMenu, MessHoliday, MenuItem
+        self.encoders, X = fit_feature_encoders(df)
+        self.feature_encoder = FeatureEncoder.from_encoders(self.encoders, FEATURE_KEYS)
+        vectors = {provider_id: provider_vector(self.features.get(provider_id)) for provider_id in frames}
+        X = np.hstack([X, np.array([vectors[provider_id] for provider_id in df['provider_id']])])
         
-        # Get last 60 days of data
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=60)
+        y = df['attended_students'].values
+        self.scaler = StandardScaler()
+        y_scaled = self.scaler.fit_transform(y.reshape(-1, 1)).ravel()
         
-        # Get attendance records
-        attendance_records = Attendance.objects.filter(
-            provider_id=self.provider_id,
-            date__range=[start_date, end_date],
-            status=Attendance.Status.PRESENT
-        ).values('date', 'meal_type').annotate(
-            attended_students=Count('id')
-        )
+        forest = RandomForestRegressor(random_state=42, n_jobs=n_jobs, **forest_params)
+        if len(X) > 50:
+            X_train, X_test, y_train, y_test = train_test_split(X, y_scaled, test_size=0.2, random_state=42)
+            forest.fit(X_train, y_train)
+            self.stats['model_score'] = float(forest.score(X_test, y_test))
+        else:
+            forest.fit(X, y_scaled)
+            self.stats['model_score'] = None
+        self.rf_model = CompactForest.from_sklearn(forest)
         
-        # Get menu info
-        daily_menus = DailyMenu.objects.filter(
-            provider_id=self.provider_id,
-            date__range=[start_date, end_date]
-        ).prefetch_related('menu_items')
-        
-        menu_lookup = {(menu.date, menu.meal_type.upper()): menu for menu in daily_menus}
-        
-        data = []
-        for record in attendance_records:
-            date = record['date']
-            meal_type = record['meal_type']
-            
-            menu = menu_lookup.get((date, meal_type))
-            dish_name = None
-            dish_type = 'veg'
-            
-            if menu and menu.menu_items.exists():
-                main_dish = menu.menu_items.first()
-                dish_name = main_dish.dish_name
-                dish_type = main_dish.dish_type.lower() if main_dish.dish_type else 'veg'
-            
-            # Determine if holiday
-            is_holiday = MessHoliday.objects.filter(
-                provider_id=self.provider_id,
-                date=date,
-                meal_type=meal_type
-            ).exists()
-            
-            data.append({
-                'day_of_week': date.strftime('%a'),
-                'dish_name': dish_name,
-                'dish_type': dish_type,
-                'holiday': 'Yes' if is_holiday else 'None',
-                'meal_type': meal_type.capitalize(),
-                'attended_students': record['attended_students']
-            })
+        self.grids = {}
+        for provider_id in self.features:
+            self.grids[provider_id] = GlobalProviderModel(provider_id, self)._grid_artifact()
         
-        return pd.DataFrame(data)
+        self._save_model()
+        logger.info(f"Global model trained for {len(self.features)} providers")
+        return True
+    
+    def _save_model(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_model_file(self.path, self.rf_model.to_arrays(), {
+            'forest': self.rf_model.meta(),
+            'encoders': self.encoders,
+            'scaler': self.scaler,
+            'features': self.features,
+            'provider_stats': self.provider_stats,
+            'grids': self.grids,
+            'stats': self.stats,
+        })
+        self.version = self.artifact_version(self.path)
+        if self.path == self.get_path():
+            global_model_registry.clear()
+    
+    def stats_for(self, provider_id):
+        """
+        Statistics served for a provider: its own history's patterns, the
+        global average when it has none, and the global attendance range
+        (the shared forest may predict outside the provider's own range).
+        """
+        stats = {**untrained_stats(), 'avg_attendance': self.stats['avg_attendance']}
+        stats.update(self.provider_stats.get(provider_id, {}))
+        for key in ('min_attendance', 'max_attendance', 'trained_at', 'forest_params', 'model_score'):
+            if key in self.stats:
+                stats[key] = self.stats[key]
+        stats['global_model'] = True
+        return stats
+
+
+class GlobalProviderModel(DishPredictor):
+    """
+    A provider's read-only view of a GlobalDishModel, with the DishPredictor
+    prediction API. The forest, encoders and scaler belong to the global
+    model and are shared by all views; each view only adds the provider's
+    feature vector and prediction grid. It cannot be trained: retrain the
+    global model with train_global_model().
+    """
+    
+    def __init__(self, provider_id, global_model=None):
+        self.provider_id = provider_id
+        self.global_model = global_model or get_global_model()
+        self.model_dir = self.global_model.path.parent
+        self.stats_path = self.global_model.path
+        
+        self.rf_model = self.global_model.rf_model
+        self.encoders = self.global_model.encoders
+        self.feature_encoder = self.global_model.feature_encoder
+        self.scaler = self.global_model.scaler
+        self.stats = self.global_model.stats_for(provider_id)
+        self.prediction_grid = {}
+        self.interval_grid = {}
+        self.interval_coverage = None
+        self._buffers = threading.local()
+        
+        if self.rf_model is not None:
+            features = self.global_model.features.get(provider_id)
+            if features is None:
+                # Providers that joined after training
+                features = provider_features([provider_id])[provider_id]
+            self._provider_vector = provider_vector(features)
+            self._load_prediction_grid()
+    
+    @classmethod
+    def artifact_version(cls, provider_id):
+        """Views change whenever the global artifact does."""
+        return GlobalDishModel.artifact_version()
+    
+    def artifact_size(self):
+        # The shared forest is not charged to each provider's cache entry
+        return 0
+    
+    def _load_prediction_grid(self):
+        artifact = self.global_model.grids.get(self.provider_id)
+        if artifact is None:
+            self._build_prediction_grid()
+        else:
+            self._use_grid_artifact(artifact)
+    
+    def _encode(self, rows):
+        width = self.feature_encoder.width
+        X = self._input_buffer(len(rows), width + len(self._provider_vector))
+        self.feature_encoder.transform(rows, out=X[:, :width])
+        X[:, width:] = self._provider_vector
+        return X
+
+
+_global_model = None
+
+
+def get_global_model():
+    """The process-wide GlobalDishModel, reloaded when its artifact changes."""
+    global _global_model
+    model = _global_model
+    if model is None or model.path != GlobalDishModel.get_path() or model.version != GlobalDishModel.artifact_version():
+        previous, model = model, GlobalDishModel()
+        _global_model = model
+        if previous is not None:
+            # Views still holding its forest keep the map alive until they are dropped
+            previous.close()
+    return model
+
+
+def train_global_model(provider_ids=None, n_jobs=-1, days=None):
+    """Train and save the global model on every provider's history (three queries per provider)."""
+    from accounts.models import User
+    
+    if provider_ids is None:
+        provider_ids = User.objects.filter(role='PROVIDER').values_list('id', flat=True)
+    provider_ids = list(provider_ids)
+    
+    frames = {provider_id: historical_frame(provider_id, days) for provider_id in provider_ids}
+    model = GlobalDishModel()
+    model.train(frames, provider_features(provider_ids), n_jobs=n_jobs)
+    return model
+
+
+def has_trained_model(provider_id):
+    """Whether predictions for the provider come from a trained model in the current mode."""
+    if model_mode() == 'global':
+        return GlobalDishModel.artifact_version() is not None
+    return ProviderDishModel.artifact_version(provider_id) is not None
+
+
+model_registry = ModelRegistry(
+    loader=ProviderDishModel,
+    max_entries=getattr(settings, 'PROVIDER_MODEL_CACHE_SIZE', 64),
+    max_bytes=getattr(settings, 'PROVIDER_MODEL_CACHE_MAX_BYTES', None),
+)
+
+
+global_model_registry = ModelRegistry(
+    loader=GlobalProviderModel,
+    max_entries=getattr(settings, 'PROVIDER_MODEL_CACHE_SIZE', 64),
+)
 
 
 # Helper Functions
-def train_provider_model(provider_id):
-    """Train model for a specific provider."""
+def get_provider_model(provider_id):
+    """Get a (cached) read-only model for a provider.
+
+    The returned instance is shared between requests, so callers must not
+    train it; use a fresh ProviderDishModel for training. In global mode
+    (PROVIDER_MODEL_MODE = 'global') this is the provider's view of the
+    global model.
+    """
+    if model_mode() == 'global':
+        return global_model_registry.get(provider_id)
+    return model_registry.get(provider_id)
+
+
+def train_provider_model(provider_id, n_jobs=-1, tune=False):
+    """
+    Train model for a specific provider.
+    With `tune`, the forest settings are chosen by a backtested grid search;
+    otherwise the settings chosen by the last search (if any) are reused.
+    """
     model = ProviderDishModel(provider_id)
     df = model.get_historical_data_from_db()
     
-    if df.empty or len(df) < 20:
+    if df.empty:
+        raise ValueError("No attendance data found. Start tracking attendance first.")
+    if len(df) < 20:
         raise ValueError(f"Need at least 20 attendance records. Currently have {len(df)}.")
     
-    model.train(df)
+    if tune:
+        model.tune(df, n_jobs=n_jobs)
+    else:
+        tuning = model.stats.get('tuning')
+        model.train(df, n_jobs=n_jobs, params=tuning and tuning['best_params'], tuning=tuning)
     return model
 
 
+def retrain_provider_model(provider_id, auto_retrain=False, n_jobs=-1, tune=False):
+    """Retrain a provider's model, record its performance and return training metadata."""
+    from mess_app.models import ModelPerformance
+    from mess_app.services import invalidate_accuracy_stats
+    
+    model = train_provider_model(provider_id, n_jobs=n_jobs, tune=tune)
+    # Backtest metrics are only recorded for the run that produced them
+    metrics = model.stats['tuning']['metrics'] if tune else {}
+    ModelPerformance.objects.create(
+        provider_id=provider_id,
+        training_samples=model.stats['total_samples'],
+        model_score=model.stats.get('model_score'),
+        forest_params=model.stats['forest_params'],
+        validation_folds=model.stats['tuning']['n_folds'] if tune else None,
+        validation_mae=metrics.get('mae'),
+        validation_rmse=metrics.get('rmse'),
+        validation_mape=metrics.get('mape'),
+    )
+    invalidate_accuracy_stats(provider_id)
+    
+    return {
+        'provider_id': provider_id,
+        'n_samples': model.stats['total_samples'],
+        'avg_attendance': model.stats['avg_attendance'],
+        'model_score': model.stats.get('model_score'),
+        'forest_params': model.stats['forest_params'],
+        'validation': metrics or None,
+        'trained_at': model.stats['trained_at'],
+        'auto_retrain': auto_retrain,
+    }
+
+
+def trained_at(model):
+    """When the model was trained; falls back to the artifact mtime for older models."""
+    if model.stats.get('trained_at'):
+        return datetime.fromisoformat(model.stats['trained_at'])
+    return datetime.fromtimestamp(model.stats_path.stat().st_mtime, tz=dt_timezone.utc)
+
+
+def check_retraining_needed(provider_id):
+    """
+    Decide whether a provider's model should be retrained.
+    Returns (needs_retrain, reason).
+    
+    New meals are first folded into the provider's drift monitor; the model
+    is retrained when some weekday/meal/dish-type segment drifted (see
+    drift.detect_drift) or, as a safety net, once it is older than
+    PROVIDER_MODEL_MAX_AGE_DAYS.
+    """
+    monitor = update_drift_monitor(provider_id)
+    if monitor is None:
+        return True, "No trained model"
+    
+    max_age = timedelta(days=getattr(settings, 'PROVIDER_MODEL_MAX_AGE_DAYS', 30))
+    if timezone.now() - monitor.model_trained_at > max_age:
+        return True, f"Model is older than {max_age.days} days"
+    
+    drifted = detect_drift(monitor.segments)
+    if drifted:
+        key, score, kind = drifted[0]
+        segment = key.replace('|', ' ')
+        if kind == 'unseen':
+            return True, f"Attendance recorded for {segment}, which the model was not trained on"
+        description = 'attendance shifted' if kind == 'shift' else 'predictions biased'
+        return True, f"{len(drifted)} drifted segment(s); {segment}: {description} (score {score:.1f})"
+    
+    monitored = sum(segment.get('attendance', [0])[0] for segment in monitor.segments.values())
+    return False, f"No drift detected ({monitored} meals monitored since training)"
+
+
+def update_prediction_actuals(provider_id=None, until=None, batch_size=1000):
+    """
+    Fill actual_attendance and accuracy_percentage for pending PredictionLog rows.
+    
+    Actual counts come from the AttendanceSummary rollup in a single query;
+    logs are then updated with bulk_update in chunks of `batch_size`, so the
+    job stays cheap over months of backlog. Only meals up to `until`
+    (default: yesterday) are filled; logs without any attendance recorded
+    are left pending. Returns the number of updated logs.
+    """
+    from mess_app.models import PredictionLog, prediction_accuracy
+    from mess_app.services import invalidate_accuracy_stats
+    from student.models import AttendanceSummary
+    
+    started = time.perf_counter()
+    until = until or timezone.now().date() - timedelta(days=1)
+    
+    pending = PredictionLog.objects.filter(actual_attendance__isnull=True, date__lte=until)
+    if provider_id is not None:
+        pending = pending.filter(provider_id=provider_id)
+    
+    summaries = AttendanceSummary.objects.filter(
+        provider_id__in=pending.values('provider_id'),
+        date__in=pending.values('date'),
+    ).values_list('provider_id', 'date', 'meal_type', 'present_count')
+    actuals = {
+        (provider, meal_date, meal_type): present
+        for provider, meal_date, meal_type, present in summaries
+    }
+    
+    now = timezone.now()
+    updated = 0
+    updated_providers = set()
+    last_id = 0
+    # Page through pending logs by primary key, so that rows written by one
+    # chunk never shift the window of the next one.
+    while True:
+        chunk = list(
+            pending.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'provider_id', 'date', 'meal_type', 'predicted_attendance')[:batch_size]
+        )
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+        
+        batch = []
+        for log in chunk:
+            actual = actuals.get((log.provider_id, log.date, log.meal_type.upper()))
+            if actual is None:
+                continue
+            log.actual_attendance = actual
+            log.accuracy_percentage = prediction_accuracy(log.predicted_attendance, actual)
+            log.updated_at = now
+            batch.append(log)
+            updated_providers.add(log.provider_id)
+        if batch:
+            PredictionLog.objects.bulk_update(batch, ['actual_attendance', 'accuracy_percentage', 'updated_at'])
+            updated += len(batch)
+    
+    invalidate_accuracy_stats(*updated_providers)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Updated {updated} prediction logs in {elapsed:.2f}s "
+        f"({updated / elapsed if elapsed else 0:.0f} rows/s)"
+    )
+    return updated
+
+
 def predict_for_provider(provider_id, day_of_week, dish_type, holiday, meal_type):
     """Get prediction for a provider."""
-    model = ProviderDishModel(provider_id)
+    model = get_provider_model(provider_id)
     return model.predict(day_of_week, dish_type, holiday, meal_type)
 
 
+def predict_interval_for_provider(provider_id, day_of_week, dish_type, holiday, meal_type):
+    """Get a prediction with its interval for a provider."""
+    model = get_provider_model(provider_id)
+    return model.predict_interval(day_of_week, dish_type, holiday, meal_type)
+
+
 def get_recommendations_for_provider(provider_id, day_of_week, meal_type, holiday='None'):
     """Get dish recommendations for a provider."""
-    model = ProviderDishModel(provider_id)
+    model = get_provider_model(provider_id)
     return model.get_recommendations(day_of_week, meal_type, holiday)
@@ -0,0 +1,54 @@
+import hashlib
+
+import numpy as np
+
+LAYERS = ('fc1', 'fc2', 'fc3')
+
+
+def checkpoint_fingerprint(path):
+    """SHA-1 of a torch checkpoint, recorded in exports to detect stale weights."""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class NumpyQNetwork:
+    """
+    Forward pass of dqn_network.QNetwork (three linear layers with ReLU)
+    in plain NumPy, loaded from the .npz written by QNetwork.export_numpy().
+    Lets web workers serve recommendations without importing torch.
+    """
+
+    def __init__(self, weights, biases, source_fingerprint=''):
+        # Stored transposed so that a batch is x @ W + b
+        self.weights = [np.ascontiguousarray(w.T, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.source_fingerprint = source_fingerprint
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                [data[f'{layer}_weight'] for layer in LAYERS],
+                [data[f'{layer}_bias'] for layer in LAYERS],
+                str(data['source_fingerprint']) if 'source_fingerprint' in data else '',
+            )
+
+    @property
+    def input_dim(self):
+        return self.weights[0].shape[0]
+
+    @property
+    def output_dim(self):
+        return self.weights[-1].shape[1]
+
+    def forward(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = x @ weight
+            x += bias
+            if i < len(self.weights) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+    def __call__(self, x):
+        return self.forward(x)
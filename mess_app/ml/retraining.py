@@ -0,0 +1,163 @@
+import os
+import time
+import logging
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+
+from billiard.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Make a pool process ready to use the ORM."""
+    import django
+    django.setup()
+    # Never share a database connection inherited from the parent process
+    connections.close_all()
+
+
+def retrain_one(provider_id, only_needed=False, n_jobs=-1):
+    """
+    Retrain one provider and return a result dict; never raises.
+    Run as a Celery subtask (mess_app.tasks.retrain_provider), a soft time
+    limit is reported as status 'timeout'.
+    """
+    from .provider_model import check_retraining_needed, retrain_provider_model
+
+    started = time.perf_counter()
+    result = {'provider_id': provider_id}
+    try:
+        if only_needed:
+            needs_retrain, reason = check_retraining_needed(provider_id)
+            if not needs_retrain:
+                result.update(status='skipped', reason=reason)
+                return result
+        result['metadata'] = retrain_provider_model(provider_id, auto_retrain=only_needed, n_jobs=n_jobs)
+        result['status'] = 'retrained'
+    except SoftTimeLimitExceeded:
+        result.update(status='timeout', reason="Exceeded the task's time limit")
+    except ValueError as e:
+        result.update(status='skipped', reason=str(e))
+    except Exception as e:
+        logger.error(f"Error retraining provider {provider_id}: {e}")
+        result.update(status='failed', reason=str(e))
+    finally:
+        result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def summarize(results, workers, elapsed_seconds):
+    """Per-status counts for a list of retrain_one() results."""
+    summary = {
+        'total_providers': len(results),
+        'retrained': sum(r['status'] == 'retrained' for r in results),
+        'skipped': sum(r['status'] == 'skipped' for r in results),
+        # Timeouts are failures too; timed_out breaks them out
+        'failed': sum(r['status'] in ('failed', 'timeout') for r in results),
+        'timed_out': sum(r['status'] == 'timeout' for r in results),
+        'workers': workers,
+        'elapsed_seconds': round(elapsed_seconds, 2),
+        'results': results,
+    }
+    logger.info(
+        f"Retrained {summary['retrained']}/{summary['total_providers']} providers "
+        f"with {workers} worker(s) in {summary['elapsed_seconds']}s"
+    )
+    return summary
+
+
+def _run_in_child(conn, provider_id, only_needed):
+    """Child process entry point: retrain one provider and send back the result."""
+    _init_worker()
+    try:
+        conn.send(retrain_one(provider_id, only_needed, 1))
+    finally:
+        conn.close()
+
+
+def retrain_providers(provider_ids, workers=None, only_needed=False, on_result=None, timeout=None):
+    """
+    Retrain many providers, each in its own child process, `workers` at a time.
+
+    workers: concurrent processes (PROVIDER_MODEL_RETRAIN_WORKERS, default:
+        CPU count); 1 trains inline in the current process. Daemonic
+        processes, such as Celery prefork workers, cannot start children and
+        always train inline; the scheduled task fans out with a Celery chord instead.
+    only_needed: skip providers for which check_retraining_needed() says no.
+    on_result: optional callback invoked with each provider's result as it finishes.
+    timeout: seconds one provider may take (PROVIDER_MODEL_RETRAIN_TIMEOUT);
+        a child that overruns it is terminated and reported as 'timeout'.
+        Inline training cannot be interrupted and ignores it.
+
+    Returns a summary with per-status counts and the wall-clock time.
+    """
+    provider_ids = list(provider_ids)
+    if workers is None:
+        workers = getattr(settings, 'PROVIDER_MODEL_RETRAIN_WORKERS', None) or os.cpu_count() or 1
+    if timeout is None:
+        timeout = getattr(settings, 'PROVIDER_MODEL_RETRAIN_TIMEOUT', None)
+    workers = max(1, min(workers, len(provider_ids) or 1))
+    if multiprocessing.current_process().daemon:
+        workers = 1
+
+    started = time.perf_counter()
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    if workers == 1:
+        for provider_id in provider_ids:
+            collect(retrain_one(provider_id, only_needed))
+        return summarize(results, workers, time.perf_counter() - started)
+
+    # One process per provider rather than a pool, so that a stuck fit can be
+    # terminated without taking the other providers down with it. Each child
+    # trains one forest at a time; parallelism comes from running `workers` of them.
+    connections.close_all()
+    context = multiprocessing.get_context()
+    pending = deque(provider_ids)
+    running = {}  # reader -> (provider_id, process, deadline)
+
+    def finish(reader, result):
+        provider_id, process, _ = running.pop(reader)
+        reader.close()
+        process.join()
+        collect(result)
+
+    while pending or running:
+        while pending and len(running) < workers:
+            provider_id = pending.popleft()
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=_run_in_child, args=(writer, provider_id, only_needed))
+            process.start()
+            writer.close()
+            deadline = time.monotonic() + timeout if timeout else None
+            running[reader] = (provider_id, process, deadline)
+
+        deadlines = [deadline for _, _, deadline in running.values() if deadline is not None]
+        wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else None
+        for reader in multiprocessing.connection.wait(list(running), timeout=wait_for):
+            provider_id = running[reader][0]
+            try:
+                finish(reader, reader.recv())
+            except EOFError:
+                # The child died without reporting back (e.g. out of memory)
+                finish(reader, {'provider_id': provider_id, 'status': 'failed',
+                                'reason': 'Worker process exited unexpectedly'})
+
+        now = time.monotonic()
+        for reader, (provider_id, process, deadline) in list(running.items()):
+            if deadline is not None and now >= deadline:
+                process.terminate()
+                logger.error(f"Retraining provider {provider_id} exceeded {timeout}s; worker terminated")
+                finish(reader, {'provider_id': provider_id, 'status': 'timeout',
+                                'reason': f'Exceeded the {timeout}s time limit'})
+
+    return summarize(results, workers, time.perf_counter() - started)
@@ -1,103 +1,29 @@
-import pandas as pd
+"""
+Train the DQN dish recommender on the synthetic attendance data.
+
+Run from the project root:  python -m mess_app.ml.train_dqn_model [--help]
+Add --benchmark to compare per-sample and minibatch updates instead of training.
+"""
+import argparse
+import os
+import random
+import time
+
 import numpy as np
 import torch
-import torch.nn as nn
-import torch.optim as optim
-import random
-from collections import deque
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
 from sklearn.model_selection import train_test_split
-import os
-
-# ==============================
-# Paths
-# ==============================
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_PATH = os.path.join(BASE_DIR, "synthetic_attendance_dataset_large_with_mealtime.csv")
-MODEL_PATH = os.path.join(BASE_DIR, "dqn_mess_model.pth")
-
-# ==============================
-# Load Data
-# ==============================
-df = pd.read_csv(DATA_PATH)
-
-# One-hot encode categorical variables
-day_encoder = OneHotEncoder(sparse_output=False)
-type_encoder = OneHotEncoder(sparse_output=False)
-holiday_encoder = OneHotEncoder(sparse_output=False)
-meal_encoder = OneHotEncoder(sparse_output=False)
-
-day_encoded = day_encoder.fit_transform(df[['day_of_week']])
-type_encoded = type_encoder.fit_transform(df[['dish_type']])
-holiday_encoded = holiday_encoder.fit_transform(df[['holiday']])
-meal_encoded = meal_encoder.fit_transform(df[['meal_time']])
 
-# Combine features
-X = np.hstack([day_encoded, type_encoded, holiday_encoded, meal_encoded])
-y = df[['attended_students']].values
-
-# Scale target variable
-scaler = StandardScaler()
-y_scaled = scaler.fit_transform(y)
-
-# Split dataset
-X_train, X_test, y_train, y_test = train_test_split(X, y_scaled, test_size=0.2, random_state=42)
-
-# ==============================
-# Define Q-Network
-# ==============================
-class QNetwork(nn.Module):
-    def __init__(self, input_dim, output_dim):
-        super(QNetwork, self).__init__()
-        self.fc1 = nn.Linear(input_dim, 128)
-        self.fc2 = nn.Linear(128, 128)
-        self.fc3 = nn.Linear(128, output_dim)
-
-    def forward(self, x):
-        x = torch.relu(self.fc1(x))
-        x = torch.relu(self.fc2(x))
-        return self.fc3(x)
-
-# ==============================
-# Replay Memory
-# ==============================
-class ReplayMemory:
-    def __init__(self, capacity):
-        self.memory = deque(maxlen=capacity)
-
-    def push(self, state, action, reward, next_state, done):
-        self.memory.append((state, action, reward, next_state, done))
-
-    def sample(self, batch_size):
-        return random.sample(self.memory, batch_size)
-
-    def __len__(self):
-        return len(self.memory)
-
-# ==============================
-# DQN Agent
-# ==============================
-class DQNAgent:
-    def __init__(self, state_dim, action_dim, lr=1e-3, gamma=0.99, epsilon=1.0, epsilon_decay=0.995, epsilon_min=0.1):
-        self.q_network = QNetwork(state_dim, action_dim)
-        self.target_network = QNetwork(state_dim, action_dim)
-        self.optimizer = optim.Adam(self.q_network.parameters(), lr=lr)
-        self.memory = ReplayMemory(10000)
-        self.gamma = gamma
-        self.epsilon = epsilon
-        self.epsilon_decay = epsilon_decay
-        self.epsilon_min = epsilon_min
-        self.update_target()
-
-    def update_target(self):
-        self.target_network.load_state_dict(self.q_network.state_dict())
-
-    def act(self, state):
-        if random.random() < self.epsilon:
-            return random.randint(0, self.q_network.fc3.out_features - 1)
-        with torch.no_grad():
-            q_values = self.q_network(torch.FloatTensor(state).unsqueeze(0))
-        return q_values.argmax().item()
+from mess_app.ml.dqn_network import DQNAgent, QNetwork
+from mess_app.ml.dqn_recommender import (
+    ARTIFACT_DIR,
+    FEATURE_COLUMNS,
+    MODEL_PATH,
+    QNETWORK_EXPORT_PATH,
+    fit_preprocessing,
+    load_training_frame,
+    save_preprocessing,
+)
+from mess_app.ml.encoding import FeatureEncoder
 
 # ==============================
 # Dish List (Actions)
@@ -113,64 +39,188 @@ all_dishes = [
     ("Special Sweet", "veg", True),
 ]
 
+
 # ==============================
-# Training Loop
+# Load Data
 # ==============================
-state_dim = X_train.shape[1]
-action_dim = len(all_dishes)
-agent = DQNAgent(state_dim, action_dim)
-episodes = 1000
-batch_size = 32
-
-for episode in range(episodes):
-    idx = np.random.randint(0, len(X_train))
-    state = X_train[idx]
-    total_reward = 0
-
-    for t in range(20):  # simulate steps
-        action = agent.act(state)
-        next_idx = np.random.randint(0, len(X_train))
-        next_state = X_train[next_idx]
-        reward = y_train[next_idx][0]
-        done = t == 19
-
-        agent.memory.push(state, action, reward, next_state, done)
-        state = next_state
-        total_reward += reward
-
-        if len(agent.memory) > batch_size:
-            batch = agent.memory.sample(batch_size)
-            for s, a, r, ns, d in batch:
-                s = torch.FloatTensor(s)
-                ns = torch.FloatTensor(ns)
-                q_values = agent.q_network(s)
-                q_value = q_values[a]
-
-                # ✅ FIXED detach() issue
-                with torch.no_grad():
-                    max_next = agent.target_network(ns).max().detach().item()
-
-                target = r + agent.gamma * max_next * (1 - d)
-                loss = (q_value - target) ** 2
-                agent.optimizer.zero_grad()
-                loss.backward()
-                agent.optimizer.step()
-
-        if done:
-            break
-
-    agent.epsilon = max(agent.epsilon_min, agent.epsilon * agent.epsilon_decay)
-
-    if episode % 50 == 0:
-        agent.update_target()
-        print(f"Episode {episode}/{episodes} | Epsilon: {agent.epsilon:.2f} | Reward: {total_reward:.2f}")
+def load_training_data():
+    """
+    Fit the recommender's preprocessing on the synthetic data and return it
+    with the encoded states and scaled rewards used for training.
+    """
+    df = load_training_frame()
+    artifacts = fit_preprocessing(df)
+
+    feature_encoder = FeatureEncoder(artifacts['encoders'])
+    X = feature_encoder.transform(list(df[list(FEATURE_COLUMNS)].itertuples(index=False, name=None)))
+    y_scaled = artifacts['scaler'].transform(df[['attended_students']])
+    return artifacts, X, y_scaled
+
 
 # ==============================
-# Save Model
+# Training Loop
 # ==============================
-torch.save({
-    "q_network_state_dict": agent.q_network.state_dict(),
-    "target_network_state_dict": agent.target_network.state_dict(),
-}, MODEL_PATH)
+def seed_everything(seed):
+    """Make episode sampling, exploration and network initialisation reproducible."""
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
 
-print("✅ Model retrained and saved at:", MODEL_PATH)
+def learn_per_sample(agent, batch):
+    """The original update: one forward/backward pass and optimizer step per transition."""
+    for s, a, r, ns, d in zip(*batch):
+        q_values = agent.q_network(s)
+        q_value = q_values[a]
+
+        with torch.no_grad():
+            max_next = agent.target_network(ns).max().detach().item()
+
+        target = r + agent.gamma * max_next * (1 - d)
+        loss = (q_value - target) ** 2
+        agent.optimizer.zero_grad()
+        loss.backward()
+        agent.optimizer.step()
+
+
+def train(X_train, y_train, episodes=1000, batch_size=32, steps=20, per_sample=False, verbose=True, agent=None):
+    """
+    Train a DQN agent on randomly chained training states, continuing with
+    `agent` (and its replay memory) if given.
+    Returns (agent, transitions_learned): the number of transitions used in updates.
+    """
+    if agent is None:
+        agent = DQNAgent(X_train.shape[1], len(all_dishes))
+    transitions_learned = 0
+
+    for episode in range(episodes):
+        idx = np.random.randint(0, len(X_train))
+        state = X_train[idx]
+        total_reward = 0
+
+        for t in range(steps):  # simulate steps
+            action = agent.act(state)
+            next_idx = np.random.randint(0, len(X_train))
+            next_state = X_train[next_idx]
+            reward = y_train[next_idx][0]
+            done = t == steps - 1
+
+            agent.memory.push(state, action, reward, next_state, done)
+            state = next_state
+            total_reward += reward
+
+            if len(agent.memory) > batch_size:
+                batch = agent.memory.sample(batch_size)
+                if per_sample:
+                    learn_per_sample(agent, batch)
+                else:
+                    agent.learn(batch)
+                transitions_learned += batch_size
+
+            if done:
+                break
+
+        agent.epsilon = max(agent.epsilon_min, agent.epsilon * agent.epsilon_decay)
+
+        if episode % 50 == 0:
+            agent.update_target()
+            if verbose:
+                print(f"Episode {episode}/{episodes} | Epsilon: {agent.epsilon:.2f} | Reward: {total_reward:.2f}")
+
+    return agent, transitions_learned
+
+
+def timed_train(X_train, y_train, seed, **kwargs):
+    seed_everything(seed)
+    start = time.perf_counter()
+    agent, transitions = train(X_train, y_train, verbose=False, **kwargs)
+    return agent, transitions / (time.perf_counter() - start)
+
+
+def benchmark(X_train, y_train, args):
+    """Compare per-sample updates with minibatch updates on the same seeded run."""
+    print(f"Benchmarking {args.episodes} episodes, batch size {args.batch_size}, {torch.get_num_threads()} thread(s)")
+    _, before = timed_train(X_train, y_train, args.seed, episodes=args.episodes, batch_size=args.batch_size, per_sample=True)
+    print(f"  per-sample updates: {before:10.0f} transitions/s")
+    _, after = timed_train(X_train, y_train, args.seed, episodes=args.episodes, batch_size=args.batch_size)
+    print(f"  minibatch updates:  {after:10.0f} transitions/s")
+    print(f"  speed-up: {after / before:.1f}x")
+
+
+def export_q_network(q_network):
+    """Write the NumPy copy of the Q-network used by torch-free web workers."""
+    ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+    q_network.export_numpy(QNETWORK_EXPORT_PATH, source=MODEL_PATH)
+    print("✅ Q-network exported for NumPy inference:", QNETWORK_EXPORT_PATH)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the DQN dish recommender.")
+    parser.add_argument("--episodes", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the saved checkpoint instead of a fresh network")
+    parser.add_argument("--replay-memory", metavar="PATH",
+                        help="load the replay memory from this .npz file if it exists and save it after training")
+    parser.add_argument("--export-only", action="store_true",
+                        help="only export the saved checkpoint's Q-network for NumPy inference")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="time per-sample vs minibatch updates instead of training")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    seed_everything(args.seed)
+
+    if args.export_only:
+        state_dict = torch.load(MODEL_PATH, map_location=torch.device('cpu'))['q_network_state_dict']
+        q_network = QNetwork(state_dict['fc1.weight'].shape[1], state_dict['fc3.weight'].shape[0])
+        q_network.load_state_dict(state_dict)
+        export_q_network(q_network)
+        return
+
+    artifacts, X, y_scaled = load_training_data()
+
+    # Split dataset
+    X_train, X_test, y_train, y_test = train_test_split(X, y_scaled, test_size=0.2, random_state=42)
+
+    if args.benchmark:
+        benchmark(X_train, y_train, args)
+        return
+
+    agent = DQNAgent(X_train.shape[1], len(all_dishes))
+    if args.resume and os.path.exists(MODEL_PATH):
+        agent.load(MODEL_PATH)
+        agent.q_network.train()
+        agent.epsilon = agent.epsilon_min
+        print("Resuming from", MODEL_PATH)
+    if args.replay_memory and os.path.exists(args.replay_memory):
+        agent.memory.load(args.replay_memory)
+        print(f"Loaded {len(agent.memory)} transitions from {args.replay_memory}")
+
+    start = time.perf_counter()
+    agent, transitions = train(X_train, y_train, episodes=args.episodes, batch_size=args.batch_size, agent=agent)
+    elapsed = time.perf_counter() - start
+    print(f"Trained on {transitions} transitions in {elapsed:.1f}s ({transitions / elapsed:.0f} transitions/s)")
+
+    # ==============================
+    # Save Model
+    # ==============================
+    agent.save(MODEL_PATH)
+    save_preprocessing(artifacts, ARTIFACT_DIR)
+    export_q_network(agent.q_network)
+    if args.replay_memory:
+        agent.memory.save(args.replay_memory)
+        print(f"Saved {len(agent.memory)} transitions to {args.replay_memory}")
+
+    print("✅ Model retrained and saved at:", MODEL_PATH)
+    print("✅ Encoders, scaler and attendance forest saved in:", ARTIFACT_DIR)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,13 @@ from django.conf import settings
 from django.utils import timezone
 
 
+def prediction_accuracy(predicted, actual):
+    """Accuracy of a prediction as a percentage (100 = exact, floored at 0)."""
+    diff = abs(predicted - actual)
+    accuracy = max(0, 100 - (diff / max(actual, 1) * 100))
+    return round(accuracy, 2)
+
+
 class PredictionLog(models.Model):
     """Log predictions vs actual attendance for tracking accuracy."""
     
@@ -36,14 +43,71 @@ class PredictionLog(models.Model):
     def calculate_accuracy(self):
         """Calculate prediction accuracy."""
         if self.actual_attendance is not None:
-            diff = abs(self.predicted_attendance - self.actual_attendance)
-            accuracy = max(0, 100 - (diff / max(self.actual_attendance, 1) * 100))
-            self.accuracy_percentage = round(accuracy, 2)
+            self.accuracy_percentage = prediction_accuracy(self.predicted_attendance, self.actual_attendance)
             self.save()
             return self.accuracy_percentage
         return None
 
 
+class AttendanceForecast(models.Model):
+    """Precomputed attendance forecast and dish ranking for an upcoming meal."""
+    
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='attendance_forecasts'
+    )
+    date = models.DateField()
+    meal_type = models.CharField(max_length=20)
+    
+    is_mess_holiday = models.BooleanField(default=False)
+    students_on_leave = models.IntegerField(default=0)
+    expected_students = models.IntegerField(default=0)
+    
+    # Planned dish if a daily menu exists, otherwise the top recommendation
+    dish_name = models.CharField(max_length=100, blank=True)
+    dish_type = models.CharField(max_length=20, blank=True)
+    predicted_attendance = models.IntegerField()
+    # Prediction interval from the spread of the forest's trees
+    predicted_lower = models.IntegerField(null=True, blank=True)
+    predicted_upper = models.IntegerField(null=True, blank=True)
+    recommendations = models.JSONField(default=list, blank=True)
+    
+    generated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ('provider', 'date', 'meal_type')
+        ordering = ['date', '-meal_type']
+    
+    def __str__(self):
+        return f"{self.provider.username} - {self.date} {self.meal_type}: {self.predicted_attendance}"
+
+
+class DriftMonitor(models.Model):
+    """
+    Running per-segment attendance and residual statistics of a provider's
+    current model, maintained by mess_app.ml.drift.update_drift_monitor.
+    """
+    
+    provider = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='drift_monitor'
+    )
+    # Artifacts of the model the statistics refer to (see ProviderDishModel.artifact_version)
+    artifact_version = models.CharField(max_length=64, blank=True)
+    model_trained_at = models.DateTimeField(null=True, blank=True)
+    processed_through = models.DateField(null=True, blank=True)
+    
+    # {"Mon|LUNCH|veg": {"baseline": [n, mean, m2], "attendance": [...], "residual": [...]}}
+    segments = models.JSONField(default=dict, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.provider.username} drift monitor (through {self.processed_through})"
+
+
 class ModelPerformance(models.Model):
     """Track overall model performance metrics."""
     
@@ -56,6 +120,13 @@ class ModelPerformance(models.Model):
     training_date = models.DateTimeField(default=timezone.now)
     training_samples = models.IntegerField()
     model_score = models.FloatField(null=True, blank=True)
+    forest_params = models.JSONField(null=True, blank=True)
+    
+    # Rolling-origin backtest of the chosen forest (set when the model was tuned)
+    validation_folds = models.IntegerField(null=True, blank=True)
+    validation_mae = models.FloatField(null=True, blank=True)
+    validation_rmse = models.FloatField(null=True, blank=True)
+    validation_mape = models.FloatField(null=True, blank=True)
     
     avg_prediction_accuracy = models.FloatField(null=True, blank=True)
     total_predictions = models.IntegerField(default=0)
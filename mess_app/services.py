@@ -0,0 +1,315 @@
+# mess_app/services.py
+
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, F, FloatField, Q
+from django.db.models.functions import Abs, Cast, ExtractWeekDay, Upper
+from django.utils import timezone
+
+from .models import AttendanceForecast, PredictionLog
+
+logger = logging.getLogger(__name__)
+
+ACCURACY_CACHE_KEY = 'mess_app:accuracy_stats:{provider_id}'
+ROLLING_WINDOWS = (7, 30)
+# ExtractWeekDay numbers days from 1 (Sunday) to 7 (Saturday)
+WEEKDAY_NAMES = {1: 'Sun', 2: 'Mon', 3: 'Tue', 4: 'Wed', 5: 'Thu', 6: 'Fri', 7: 'Sat'}
+FORECAST_MEALS = ('LUNCH', 'DINNER')
+FORECAST_FIELDS = (
+    'is_mess_holiday', 'students_on_leave', 'expected_students', 'dish_name', 'dish_type',
+    'predicted_attendance', 'predicted_lower', 'predicted_upper', 'recommendations', 'generated_at',
+)
+
+
+def _accuracy_aggregates(suffix='', condition=None):
+    """Aggregate expressions for count, mean accuracy, MAE and MAPE, optionally filtered."""
+    error = Abs(F('predicted_attendance') - F('actual_attendance'))
+    percentage_error = Cast(error, FloatField()) * 100.0 / F('actual_attendance')
+    # MAPE is undefined for meals nobody attended
+    mape_condition = Q(actual_attendance__gt=0) if condition is None else condition & Q(actual_attendance__gt=0)
+    return {
+        f'count{suffix}': Count('id', filter=condition),
+        f'mean_accuracy{suffix}': Avg('accuracy_percentage', filter=condition),
+        f'mae{suffix}': Avg(Cast(error, FloatField()), filter=condition),
+        f'mape{suffix}': Avg(percentage_error, filter=mape_condition),
+    }
+
+
+def _metrics(row, suffix=''):
+    metrics = {'count': row[f'count{suffix}']}
+    for name in ('mean_accuracy', 'mae', 'mape'):
+        value = row[f'{name}{suffix}']
+        metrics[name] = round(value, 2) if value is not None else None
+    return metrics
+
+
+def compute_accuracy_stats(provider_id, today=None):
+    """
+    Accuracy of a provider's predictions, computed entirely with database
+    aggregates: overall, rolling 7/30-day windows, per meal and per weekday.
+    """
+    today = today or timezone.now().date()
+    logs = PredictionLog.objects.filter(provider_id=provider_id, actual_attendance__isnull=False)
+
+    aggregates = _accuracy_aggregates()
+    for days in ROLLING_WINDOWS:
+        aggregates.update(_accuracy_aggregates(f'_{days}', Q(date__gt=today - timedelta(days=days))))
+    totals = logs.aggregate(**aggregates)
+
+    by_meal = (
+        logs.annotate(meal=Upper('meal_type'))
+        .values('meal')
+        .annotate(**_accuracy_aggregates())
+        .order_by('meal')
+    )
+    by_weekday = (
+        logs.annotate(weekday=ExtractWeekDay('date'))
+        .values('weekday')
+        .annotate(**_accuracy_aggregates())
+        .order_by('weekday')
+    )
+
+    stats = {
+        'overall': _metrics(totals),
+        'by_meal': [{'meal_type': row['meal'], **_metrics(row)} for row in by_meal],
+        'by_weekday': [{'weekday': WEEKDAY_NAMES[row['weekday']], **_metrics(row)} for row in by_weekday],
+        'computed_at': timezone.now(),
+    }
+    for days in ROLLING_WINDOWS:
+        stats[f'last_{days}_days'] = _metrics(totals, f'_{days}')
+    return stats
+
+
+def get_accuracy_stats(provider_id):
+    """Cached compute_accuracy_stats; cleared when actuals are filled in or the model is retrained."""
+    key = ACCURACY_CACHE_KEY.format(provider_id=provider_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_accuracy_stats(provider_id)
+        cache.set(key, stats, getattr(settings, 'PROVIDER_ACCURACY_CACHE_TIMEOUT', 60 * 60))
+    return stats
+
+
+def invalidate_accuracy_stats(*provider_ids):
+    cache.delete_many([ACCURACY_CACHE_KEY.format(provider_id=provider_id) for provider_id in provider_ids])
+
+
+def _expected_students(provider_id, start, end):
+    """Active subscribers per meal and students on leave per (date, meal), in two queries."""
+    from student.models import ActiveSubscription, StudentHoliday
+    from .ml.provider_model import meals_of
+
+    subscribers = Counter()
+    for plan_meal, count in (
+        ActiveSubscription.objects.filter(mess_plan__provider_id=provider_id, is_active=True)
+        .values_list('mess_plan__meal_type').annotate(count=Count('id'))
+    ):
+        for meal in meals_of(plan_meal):
+            subscribers[meal] += count
+
+    on_leave = Counter()
+    for day, leave_meal, count in (
+        StudentHoliday.objects.filter(mess_plan__provider_id=provider_id, date__range=[start, end])
+        .values_list('date', 'meal_type').annotate(count=Count('student', distinct=True))
+    ):
+        for meal in meals_of(leave_meal):
+            on_leave[day, meal] += count
+    return subscribers, on_leave
+
+
+def _cap_prediction(prediction, limit):
+    """Cap a predict_intervals() result (and its bounds) at `limit` students."""
+    return {key: min(value, limit) if value is not None else None for key, value in prediction.items()}
+
+
+def generate_forecasts(provider_id, start=None, days=None, model=None):
+    """
+    Forecast attendance and rank the provider's dishes for lunch and dinner
+    of the next `days` (PROVIDER_FORECAST_DAYS) days, with a single
+    predict_intervals call for every meal and dish type.
+
+    Mess holidays are forecast as closed. Students on leave lower the
+    expected headcount, which caps the meal's predicted attendance; the dish
+    ranking keeps the model's uncapped predictions, like the live
+    recommendations recommend_dish falls back to. The meal's dish is the
+    planned main dish if a daily menu exists, otherwise the top
+    recommendation. Forecast rows and the window's pending PredictionLog rows
+    are upserted, so the job can be re-run at any time.
+    """
+    from provider.models import MenuItem
+    from .ml.provider_model import get_provider_model, main_dishes, mess_holiday_meals
+
+    model = model or get_provider_model(provider_id)
+    # Same calendar as Attendance.date (timezone.now().date())
+    start = start or timezone.now().date()
+    days = days or getattr(settings, 'PROVIDER_FORECAST_DAYS', 7)
+    end = start + timedelta(days=days - 1)
+    limit = getattr(settings, 'PROVIDER_FORECAST_TOP_DISHES', 3)
+
+    closed = mess_holiday_meals(provider_id, start, end)
+    planned = main_dishes(provider_id, start, end)
+    subscribers, on_leave = _expected_students(provider_id, start, end)
+    dishes = [
+        (dish_name, dish_type.lower() if dish_type else 'veg', is_special)
+        for dish_name, dish_type, is_special in MenuItem.objects.filter(provider_id=provider_id)
+        .order_by('dish_name').values_list('dish_name', 'dish_type', 'is_special')
+    ]
+
+    slots = [(start + timedelta(days=i), meal) for i in range(days) for meal in FORECAST_MEALS]
+    open_slots = [slot for slot in slots if slot not in closed]
+    dish_types = sorted(
+        {dish_type for _, dish_type, _ in dishes}
+        | {dish_type.lower() for _, dish_type in planned.values() if dish_type}
+        | {'veg'}
+    )
+    predictions = model.predict_intervals(
+        (day.strftime('%a'), dish_type, 'None', meal.capitalize())
+        for day, meal in open_slots
+        for dish_type in dish_types
+    )
+    by_slot = {
+        slot: dict(zip(dish_types, predictions[i * len(dish_types):(i + 1) * len(dish_types)]))
+        for i, slot in enumerate(open_slots)
+    }
+
+    now = timezone.now()
+    forecasts = []
+    for slot in slots:
+        day, meal = slot
+        forecast = AttendanceForecast(
+            provider_id=provider_id, date=day, meal_type=meal.capitalize(),
+            students_on_leave=on_leave[slot], generated_at=now,
+        )
+        forecasts.append(forecast)
+        if slot in closed:
+            forecast.is_mess_holiday = True
+            forecast.predicted_attendance = 0
+            continue
+
+        forecast.expected_students = max(subscribers[meal] - on_leave[slot], 0)
+        predicted = by_slot[slot]
+        ranked = sorted(
+            (
+                {
+                    'dish_name': dish_name,
+                    'dish_type': dish_type,
+                    'predicted_attendance': predicted[dish_type]['predicted'],
+                    'lower': predicted[dish_type]['lower'],
+                    'upper': predicted[dish_type]['upper'],
+                    'is_special': is_special,
+                }
+                for dish_name, dish_type, is_special in dishes
+            ),
+            key=lambda recommendation: recommendation['predicted_attendance'],
+            reverse=True,
+        )
+        forecast.recommendations = ranked[:limit]
+
+        if slot in planned:
+            dish_name, dish_type = planned[slot]
+            forecast.dish_name, forecast.dish_type = dish_name, dish_type.lower() if dish_type else 'veg'
+        elif ranked:
+            forecast.dish_name, forecast.dish_type = ranked[0]['dish_name'], ranked[0]['dish_type']
+        else:
+            forecast.dish_type = 'veg'
+        chosen = _cap_prediction(predicted[forecast.dish_type], forecast.expected_students)
+        forecast.predicted_attendance = chosen['predicted']
+        forecast.predicted_lower, forecast.predicted_upper = chosen['lower'], chosen['upper']
+
+    with transaction.atomic():
+        AttendanceForecast.objects.bulk_create(
+            forecasts,
+            update_conflicts=True,
+            unique_fields=['provider', 'date', 'meal_type'],
+            update_fields=FORECAST_FIELDS,
+        )
+        _upsert_prediction_logs(provider_id, start, end, forecasts)
+    return forecasts
+
+
+def _upsert_prediction_logs(provider_id, start, end, forecasts):
+    """
+    Make this provider's pending PredictionLog rows in [start, end] match
+    `forecasts`: existing rows are updated in place, missing ones created and
+    rows for meals no longer forecast (e.g. a new mess holiday) deleted.
+    """
+    pending = {}
+    stale = []
+    for log in PredictionLog.objects.filter(
+        provider_id=provider_id, date__range=[start, end], actual_attendance__isnull=True
+    ):
+        if (log.date, log.meal_type) in pending:
+            stale.append(log.pk)
+        else:
+            pending[(log.date, log.meal_type)] = log
+
+    updated, created = [], []
+    for forecast in forecasts:
+        if forecast.is_mess_holiday or not forecast.dish_name:
+            continue
+        log = pending.pop((forecast.date, forecast.meal_type), None)
+        if log is None:
+            log = PredictionLog(provider_id=provider_id, date=forecast.date, meal_type=forecast.meal_type)
+            created.append(log)
+        else:
+            updated.append(log)
+        log.dish_name, log.dish_type = forecast.dish_name, forecast.dish_type
+        log.predicted_attendance = forecast.predicted_attendance
+
+    stale.extend(log.pk for log in pending.values())
+    if updated:
+        PredictionLog.objects.bulk_update(updated, ['dish_name', 'dish_type', 'predicted_attendance'])
+    if created:
+        PredictionLog.objects.bulk_create(created)
+    if stale:
+        PredictionLog.objects.filter(provider_id=provider_id, pk__in=stale).delete()
+
+
+def generate_all_forecasts(provider_ids=None, start=None):
+    """
+    Run generate_forecasts for every provider with a trained model
+    (every provider once the global model is trained, in global mode).
+    A failing provider is logged and skipped. Returns a summary dict.
+    """
+    from accounts.models import User
+    from .ml.provider_model import has_trained_model
+
+    started = time.perf_counter()
+    if provider_ids is None:
+        provider_ids = User.objects.filter(role='PROVIDER').values_list('id', flat=True)
+
+    summary = {'providers': 0, 'forecasts': 0, 'skipped': 0, 'failed': 0}
+    for provider_id in provider_ids:
+        if not has_trained_model(provider_id):
+            summary['skipped'] += 1
+            continue
+        try:
+            summary['forecasts'] += len(generate_forecasts(provider_id, start=start))
+            summary['providers'] += 1
+        except Exception as e:
+            summary['failed'] += 1
+            logger.error(f"Error forecasting attendance for provider {provider_id}: {e}", exc_info=True)
+
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+    logger.info(f"Attendance forecasts generated: {summary}")
+    return summary
+
+
+def get_upcoming_forecasts(provider_id, start=None):
+    """Precomputed forecasts from `start` (today) on, in serving order."""
+    start = start or timezone.now().date()
+    return AttendanceForecast.objects.filter(provider_id=provider_id, date__gte=start)
+
+
+def find_forecast(provider_id, day_of_week, meal_type, start=None):
+    """The provider's next forecast falling on a weekday ('Mon') and meal ('Lunch'), or None."""
+    for forecast in get_upcoming_forecasts(provider_id, start).filter(meal_type=meal_type.capitalize()):
+        if forecast.date.strftime('%a') == day_of_week:
+            return forecast
+    return None
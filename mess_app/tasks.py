@@ -1,53 +1,96 @@
-from celery import shared_task
+import time
+from celery import chord, shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from accounts.models import User
-from .ml.provider_model import retrain_provider_model, check_retraining_needed
+from .ml.provider_model import model_mode, retrain_provider_model, train_global_model
+from .ml.retraining import retrain_one, summarize
+from .services import generate_all_forecasts
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+# Seconds a provider's subtask gets past its soft time limit before it is killed
+RETRAIN_HARD_LIMIT_GRACE = 30
+
+# Set while a global retrain is queued or running, so repeated requests don't pile up
+GLOBAL_RETRAIN_QUEUED_KEY = 'global_model_retrain_queued'
+GLOBAL_RETRAIN_QUEUED_TIMEOUT = 60 * 60  # lets a retrain be queued again if a worker died holding the key
+
+
 @shared_task
-def auto_retrain_provider_models():
+def auto_retrain_provider_models(timeout=None):
     """
     Automated task to retrain provider models that need updating.
     Run this daily via Celery Beat.
+    Each provider is retrained by its own retrain_provider subtask, run as a
+    Celery group across the workers, with PROVIDER_MODEL_RETRAIN_TIMEOUT as
+    its soft time limit; summarize_retraining logs the outcome once every
+    subtask has finished.
+    In global mode the single global model is retrained instead.
     """
     logger.info("Starting automated model retraining check")
     
-    providers = User.objects.filter(role='PROVIDER')
+    provider_ids = list(User.objects.filter(role='PROVIDER').values_list('id', flat=True))
     
-    retrained_count = 0
-    skipped_count = 0
-    failed_count = 0
+    if model_mode() == 'global':
+        # One model serves every provider; retrain it on everyone's history
+        return retrain_global_model(provider_ids)
     
-    for provider in providers:
-        try:
-            needs_retrain, reason = check_retraining_needed(provider.id)
-            
-            if needs_retrain:
-                logger.info(f"Retraining model for provider {provider.username}: {reason}")
-                metadata = retrain_provider_model(provider.id, auto_retrain=True)
-                logger.info(f"Successfully retrained model for {provider.username}")
-                retrained_count += 1
-            else:
-                logger.info(f"Skipping {provider.username}: {reason}")
-                skipped_count += 1
-        
-        except ValueError as e:
-            logger.warning(f"Cannot retrain {provider.username}: {e}")
-            skipped_count += 1
-        except Exception as e:
-            logger.error(f"Error retraining {provider.username}: {e}")
-            failed_count += 1
+    if not provider_ids:
+        return summarize_retraining([], time.time())
+    
+    if timeout is None:
+        timeout = getattr(settings, 'PROVIDER_MODEL_RETRAIN_TIMEOUT', None)
+    limits = {'soft_time_limit': timeout, 'time_limit': timeout + RETRAIN_HARD_LIMIT_GRACE} if timeout else {}
+    subtasks = [retrain_provider.s(provider_id, only_needed=True).set(**limits) for provider_id in provider_ids]
+    result = chord(subtasks)(summarize_retraining.s(time.time()))
+    logger.info(f"Queued retraining of {len(subtasks)} providers")
+    return {'queued': len(subtasks), 'summary_task_id': result.id}
+
+
+@shared_task
+def retrain_global_model(provider_ids=None):
+    """
+    Retrain the global model on every provider's history.
+    Queued by the retrain view in global mode, since training takes minutes.
+    """
+    try:
+        model = train_global_model(provider_ids)
+        summary = {
+            'mode': 'global',
+            'providers': model.stats['providers'],
+            'n_samples': model.stats['total_samples'],
+            'model_score': model.stats['model_score'],
+            'timestamp': timezone.now().isoformat(),
+        }
+        logger.info(f"Global model retrained: {summary}")
+        return summary
+    finally:
+        cache.delete(GLOBAL_RETRAIN_QUEUED_KEY)
+
+
+@shared_task
+def retrain_provider(provider_id, only_needed=True):
+    """One provider of auto_retrain_provider_models; the forest trains on this worker's single core."""
+    return retrain_one(provider_id, only_needed=only_needed, n_jobs=1)
+
+
+@shared_task
+def summarize_retraining(results, started_at):
+    """Chord callback of auto_retrain_provider_models: log each provider's result and the totals."""
+    summary = summarize(results, workers=len(results), elapsed_seconds=time.time() - started_at)
+    summary['timestamp'] = timezone.now().isoformat()
     
-    summary = {
-        'timestamp': timezone.now().isoformat(),
-        'total_providers': providers.count(),
-        'retrained': retrained_count,
-        'skipped': skipped_count,
-        'failed': failed_count
-    }
+    for result in summary.pop('results'):
+        if result['status'] == 'retrained':
+            logger.info(f"Successfully retrained model for provider {result['provider_id']}")
+        elif result['status'] == 'skipped':
+            logger.info(f"Skipping provider {result['provider_id']}: {result['reason']}")
+        else:
+            logger.error(f"Error retraining provider {result['provider_id']}: {result['reason']}")
     
     logger.info(f"Automated retraining completed: {summary}")
     return summary
@@ -66,3 +109,15 @@ def retrain_single_provider(provider_id):
     except Exception as e:
         logger.error(f"Error retraining provider {provider_id}: {e}")
         return {'success': False, 'error': str(e)}
+
+
+@shared_task
+def generate_attendance_forecasts():
+    """
+    Precompute next week's attendance forecasts and dish rankings for
+    every provider with a trained model.
+    Run nightly via Celery Beat, after auto_retrain_provider_models.
+    """
+    summary = generate_all_forecasts()
+    summary['timestamp'] = timezone.now().isoformat()
+    return summary
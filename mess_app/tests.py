@@ -1,3 +1,1428 @@
-from django.test import TestCase
+import gc
+import json
+import mmap
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import weakref
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from datetime import timedelta
+
+import numpy as np
+from billiard.exceptions import SoftTimeLimitExceeded
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from accounts.models import StudentProfile, User
+from provider.models import DailyMenu, MenuItem, MessHoliday, MessPlan
+from student.models import ActiveSubscription, Attendance, AttendanceSummary, StudentHoliday
+from student.services import rebuild_attendance_summary
+
+from .ml import dqn_recommender, model_file, provider_model
+from .ml.compact_forest import CompactForest
+from .ml.drift import RunningStats, detect_drift, update_drift_monitor
+from .ml.encoding import FeatureEncoder
+from .ml.evaluation import evaluate_global_model
+from .ml.model_file import read_model_file
+from .ml.model_registry import ModelRegistry
+from .ml.provider_model import (
+    GlobalDishModel, GlobalProviderModel, ProviderDishModel, check_retraining_needed, get_provider_model,
+    provider_features, provider_vector, train_global_model,
+)
+from .ml import retraining
+from .ml.retraining import retrain_providers
+from .ml.tuning import DEFAULT_FOREST_PARAMS, rolling_origin_folds, search_forest_params
+from .models import AttendanceForecast, DriftMonitor, ModelPerformance, PredictionLog, prediction_accuracy
+from .services import compute_accuracy_stats, generate_all_forecasts, generate_forecasts, get_accuracy_stats
+
+
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def make_training_frame(n=60):
+    """Deterministic attendance history good enough to fit a provider model."""
+    rows = []
+    for i in range(n):
+        day = DAYS[i % 7]
+        dish_type = 'nonveg' if i % 3 == 0 else 'veg'
+        meal = 'Lunch' if i % 2 == 0 else 'Dinner'
+        holiday = 'Yes' if i % 11 == 0 else 'None'
+        attended = 40 + (i % 7) * 3 + (15 if dish_type == 'nonveg' else 0) - (20 if holiday == 'Yes' else 0)
+        rows.append({
+            'day_of_week': day,
+            'dish_name': f'Dish {i % 5}',
+            'dish_type': dish_type,
+            'holiday': holiday,
+            'meal_type': meal,
+            'attended_students': attended,
+        })
+    return pd.DataFrame(rows)
+
+
+class ModelDirMixin:
+    """Point provider model artifacts at a temporary directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.model_root = Path(tempfile.mkdtemp())
+        patcher = mock.patch.object(provider_model, 'MODEL_ROOT', self.model_root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.model_root, ignore_errors=True)
+        provider_model.model_registry.clear()
+        self.addCleanup(provider_model.model_registry.clear)
+        provider_model.global_model_registry.clear()
+        self.addCleanup(provider_model.global_model_registry.clear)
+
+    def train(self, provider_id, n=60):
+        model = ProviderDishModel(provider_id)
+        model.train(make_training_frame(n))
+        return model
+
+
+class ModelRegistryTests(ModelDirMixin, SimpleTestCase):
+
+    def test_hit_after_first_load(self):
+        self.train(1)
+        registry = ModelRegistry(loader=ProviderDishModel, max_entries=4)
+
+        first = registry.get(1)
+        second = registry.get(1)
+
+        self.assertIs(first, second)
+        self.assertIsNotNone(first.rf_model)
+        self.assertEqual(registry.stats()['hits'], 1)
+        self.assertEqual(registry.stats()['misses'], 1)
+
+    def test_lru_eviction_by_count(self):
+        for provider_id in (1, 2, 3):
+            self.train(provider_id, n=25)
+        registry = ModelRegistry(loader=ProviderDishModel, max_entries=2)
+
+        registry.get(1)
+        registry.get(2)
+        registry.get(1)
+        registry.get(3)
+
+        self.assertIn(1, registry)
+        self.assertNotIn(2, registry)
+        self.assertEqual(registry.stats()['evictions'], 1)
+
+    def test_eviction_by_memory_budget(self):
+        for provider_id in (1, 2):
+            self.train(provider_id, n=25)
+        size = ProviderDishModel(1).artifact_size()
+        registry = ModelRegistry(loader=ProviderDishModel, max_entries=10, max_bytes=int(size * 1.5))
+
+        registry.get(1)
+        registry.get(2)
+
+        self.assertEqual(len(registry), 1)
+        self.assertIn(2, registry)
+
+    def test_retrain_invalidates_cached_model(self):
+        self.train(1, n=25)
+        cached = provider_model.get_provider_model(1)
+
+        self.train(1, n=60)
+        reloaded = provider_model.get_provider_model(1)
+
+        self.assertIsNot(cached, reloaded)
+        self.assertEqual(reloaded.stats['total_samples'], 60)
+
+    def test_untrained_provider_is_not_created_on_disk(self):
+        model = provider_model.get_provider_model(99)
+
+        self.assertIsNone(model.rf_model)
+        self.assertFalse((self.model_root / 'provider_99').exists())
+
+
+class BatchPredictionTests(ModelDirMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.provider = User.objects.create_user(username='mess', password='x', role=User.Role.PROVIDER)
+        self.model = self.train(self.provider.id)
+
+    def test_predict_many_matches_single_predictions(self):
+        rows = [
+            (day, dish_type, holiday, meal)
+            for day in DAYS
+            for dish_type in ('veg', 'nonveg')
+            for holiday in ('None', 'Yes')
+            for meal in ('Lunch', 'Dinner')
+        ]
+
+        self.assertEqual(self.model.predict_many(rows), [self.model.predict(*row) for row in rows])
+
+    def test_predict_many_handles_empty_and_unknown_categories(self):
+        self.assertEqual(self.model.predict_many([]), [])
+        (predicted,) = self.model.predict_many([('Funday', 'vegan', 'Maybe', 'Brunch')])
+        self.assertGreaterEqual(predicted, self.model.stats['min_attendance'])
+        self.assertLessEqual(predicted, self.model.stats['max_attendance'])
+
+    def test_recommendations_are_ranked_from_one_batch(self):
+        for i, dish_type in enumerate(['veg', 'nonveg', 'veg', 'nonveg']):
+            MenuItem.objects.create(provider=self.provider, dish_name=f'Dish {i}', dish_type=dish_type)
+
+        with mock.patch.object(self.model, 'predict_many', wraps=self.model.predict_many) as predict_many:
+            recommendations = self.model.get_recommendations('Mon', 'Lunch')
+
+        predict_many.assert_called_once()
+        self.assertEqual(len(recommendations), 3)
+        for recommendation in recommendations:
+            self.assertLessEqual(recommendation['lower'], recommendation['predicted_attendance'])
+            self.assertGreaterEqual(recommendation['upper'], recommendation['predicted_attendance'])
+        scores = [r['predicted_attendance'] for r in recommendations]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(scores[0], self.model.predict('Mon', 'nonveg', 'None', 'Lunch'))
+
+
+class PredictionGridTests(ModelDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = self.train(1)
+
+    def test_grid_artifact_covers_every_category_combination(self):
+        artifact = read_model_file(self.model.model_file)[1]['grid']
+
+        axes = artifact['axes']
+        self.assertEqual(axes['day'], sorted(DAYS))
+        expected = len(axes['day']) * len(axes['type']) * len(axes['holiday']) * len(axes['meal'])
+        self.assertEqual(len(artifact['values']), expected)
+
+    def test_grid_matches_forest_and_skips_it_at_request_time(self):
+        rows = list(self.model.prediction_grid)
+        expected = self.model._predict_forest(rows)
+
+        loaded = ProviderDishModel(1)
+        with mock.patch.object(loaded.rf_model, 'predict') as forest_predict:
+            self.assertEqual(loaded.predict_many(rows), expected)
+        forest_predict.assert_not_called()
+
+    def test_unseen_category_falls_back_to_forest(self):
+        with mock.patch.object(self.model.rf_model, 'predict', wraps=self.model.rf_model.predict) as forest_predict:
+            self.model.predict_many([('Mon', 'veg', 'None', 'Lunch'), ('Mon', 'jain', 'None', 'Lunch')])
+
+        forest_predict.assert_called_once()
+        self.assertEqual(forest_predict.call_args[0][0].shape[0], 1)
+
+    def test_legacy_pickles_are_loaded_and_replaced_on_save(self):
+        df = make_training_frame()
+        encoders, X = provider_model.fit_feature_encoders(df)
+        scaler = StandardScaler()
+        forest = RandomForestRegressor(n_estimators=10, random_state=0)
+        forest.fit(X, scaler.fit_transform(df[['attended_students']]).ravel())
+        legacy_dir = ProviderDishModel.get_model_dir(2)
+        legacy_dir.mkdir()
+        for name, artifact in [('rf_model.pkl', forest), ('encoders.pkl', encoders), ('scaler.pkl', scaler),
+                               ('stats.pkl', provider_model.describe_history(df))]:
+            with open(legacy_dir / name, 'wb') as f:
+                pickle.dump(artifact, f)
+
+        legacy = ProviderDishModel(2)
+
+        self.assertIsInstance(legacy.rf_model, CompactForest)
+        self.assertEqual(len(legacy.prediction_grid), len(self.model.prediction_grid))
+        rows = list(legacy.prediction_grid)
+        expected = scaler.inverse_transform(forest.predict(legacy._encode(rows)).reshape(-1, 1)).ravel()
+        # float32 leaf values may round a forest mean of exactly .5 the other way
+        np.testing.assert_allclose(legacy.predict_many(rows), expected, atol=0.5 + 1e-4)
+
+        legacy._save_model()
+        self.assertEqual(sorted(p.name for p in legacy_dir.iterdir()), ['model.bin'])
+        self.assertEqual(ProviderDishModel(2).predict_many(rows), legacy.predict_many(rows))
+
+
+
+class PredictionIntervalTests(ModelDirMixin, SimpleTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.model = self.train(1)
+        self.rows = [('Mon', 'veg', 'None', 'Lunch'), ('Sat', 'nonveg', 'Yes', 'Dinner'), ('Funday', 'vegan', 'None', 'Brunch')]
+
+    def test_per_tree_predictions_average_to_forest(self):
+        per_tree = self.model._per_tree_predictions(self.rows)
+        X = self.model._encode(self.rows)
+        expected = self.model.scaler.inverse_transform(self.model.rf_model.predict(X).reshape(-1, 1)).ravel()
+
+        self.assertEqual(per_tree.shape, (3, self.model.rf_model.n_estimators))
+        np.testing.assert_allclose(per_tree.mean(axis=1), expected)
+
+    def test_intervals_bracket_point_predictions(self):
+        intervals = self.model.predict_intervals(self.rows)
+        wider = self.model.predict_intervals(self.rows, coverage=0.98)
+
+        self.assertEqual([i['predicted'] for i in intervals], self.model.predict_many(self.rows))
+        for interval, wide in zip(intervals, wider):
+            self.assertLessEqual(interval['lower'], interval['predicted'])
+            self.assertLessEqual(interval['predicted'], interval['upper'])
+            self.assertLessEqual(wide['lower'], interval['lower'])
+            self.assertGreaterEqual(wide['upper'], interval['upper'])
+
+    def test_grid_intervals_are_saved_and_served_without_the_forest(self):
+        rows = list(self.model.interval_grid)
+        expected = self.model._forest_intervals(rows, self.model.interval_coverage)
+
+        loaded = ProviderDishModel(1)
+        with mock.patch.object(loaded.rf_model, 'apply') as forest_apply:
+            intervals = loaded.predict_intervals(rows)
+        forest_apply.assert_not_called()
+        self.assertEqual([(i['lower'], i['upper']) for i in intervals], [
+            (min(lower, i['predicted']), max(upper, i['predicted'])) for i, (lower, upper) in zip(intervals, expected)
+        ])
+
+        with self.settings(PROVIDER_PREDICTION_INTERVAL_COVERAGE=0.5):
+            self.assertEqual(ProviderDishModel(1).interval_coverage, 0.5)
+
+    def test_untrained_model_has_no_bounds(self):
+        (interval,) = ProviderDishModel(99).predict_intervals(self.rows[:1])
+
+        self.assertEqual(interval['predicted'], 50)
+        self.assertIsNone(interval['lower'])
+        self.assertIsNone(interval['upper'])
+
+
+def buffer_owner(array):
+    """The object whose memory a NumPy view ultimately reads."""
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return array.obj if isinstance(array, memoryview) else array
+
+
+class CompactModelTests(ModelDirMixin, SimpleTestCase):
+
+    def test_compact_forest_matches_sklearn(self):
+        rng = np.random.default_rng(0)
+        X = np.hstack([provider_model.fit_feature_encoders(make_training_frame(200))[1], rng.normal(size=(200, 1))])
+        y = X[:, -1] * 3 + X[:, 0] + rng.normal(size=200)
+        forest = RandomForestRegressor(n_estimators=20, max_depth=6, random_state=0).fit(X, y)
+
+        compact = CompactForest.from_sklearn(forest)
+
+        self.assertEqual((compact.left.dtype, compact.feature.dtype, compact.value.dtype),
+                         (np.uint16, np.uint8, np.float32))
+        # Rows sitting exactly on split thresholds take sklearn's branch
+        X_test = X.copy()
+        continuous = forest.estimators_[0].tree_.feature == X.shape[1] - 1
+        thresholds = forest.estimators_[0].tree_.threshold[continuous].astype(np.float32)
+        X_test[:len(thresholds), -1] = thresholds
+        np.testing.assert_array_equal(compact.apply(X_test) - compact.roots.astype(np.intp), forest.apply(X_test))
+        np.testing.assert_allclose(compact.predict(X_test), forest.predict(X_test), rtol=1e-6)
+
+    def test_one_versioned_memory_mapped_file(self):
+        model = self.train(1)
+        rows = list(model.prediction_grid)[:5]
+
+        self.assertEqual([p.name for p in model.model_dir.iterdir()], ['model.bin'])
+        self.assertEqual(model.artifact_size(), model.model_file.stat().st_size)
+        arrays, meta, mapping = read_model_file(model.model_file)
+        self.assertIs(buffer_owner(arrays['value']), mapping)
+        self.assertIsInstance(mapping, mmap.mmap)
+        self.assertFalse(arrays['value'].flags.writeable)
+        self.assertEqual(meta['stats']['total_samples'], 60)
+
+        loaded = ProviderDishModel(1)
+        self.assertEqual(loaded.predict_many(rows), model.predict_many(rows))
+        self.assertEqual(loaded._forest_intervals(rows, 0.5), model._forest_intervals(rows, 0.5))
+        with self.settings(PROVIDER_MODEL_MMAP=False):
+            copied = ProviderDishModel(1)
+        self.assertIsInstance(buffer_owner(copied.rf_model.value), bytes)
+        self.assertEqual(copied._predict_forest(rows), model._predict_forest(rows))
+
+    def test_evicted_model_keeps_predicting_until_released(self):
+        for provider_id in (1, 2):
+            self.train(provider_id, n=25)
+        registry = ModelRegistry(loader=ProviderDishModel, max_entries=1)
+        rows = [('Mon', 'veg', 'None', 'Lunch'), ('Sat', 'nonveg', 'Yes', 'Dinner')]
+
+        held = registry.get(1)
+        before = (held.predict_many(rows), held._predict_forest(rows))
+        mapping = weakref.ref(held._mapping)
+        registry.get(2)
+
+        self.assertNotIn(1, registry)
+        self.assertEqual((held.predict_many(rows), held._predict_forest(rows)), before)
+        # The map goes away with the last reference to the model
+        del held
+        gc.collect()
+        self.assertIsNone(mapping())
+
+    def test_concurrent_cold_loads_keep_the_first_model(self):
+        self.train(1, n=25)
+        registry = ModelRegistry(loader=ProviderDishModel, max_entries=4)
+        version = ProviderDishModel.artifact_version(1)
+        first, second = ProviderDishModel(1), ProviderDishModel(1)
+
+        self.assertIs(registry.put(1, first, version), first)
+        self.assertIs(registry.put(1, second, version), first)
+        self.assertIs(registry.get(1), first)
+        self.assertIsNotNone(first.rf_model)
+        self.assertFalse(second._mapping.closed)
+
+    def test_map_outlives_close_while_arrays_are_in_use(self):
+        self.train(1)
+        model = ProviderDishModel(1)
+        mapping, value = model._mapping, model.rf_model.value
+
+        model.close()
+
+        self.assertFalse(mapping.closed)
+        np.testing.assert_array_equal(value, ProviderDishModel(1).rf_model.value)
+
+    def test_mmap_is_off_by_default_on_windows(self):
+        with self.settings(), mock.patch.object(provider_model.os, 'name', 'nt'):
+            del settings.PROVIDER_MODEL_MMAP
+            self.assertFalse(provider_model.use_mmap())
+
+    def test_retrain_leaves_mapped_models_readable(self):
+        self.train(1, n=25)
+        loaded = ProviderDishModel(1)
+        rows = [('Mon', 'veg', 'None', 'Lunch'), ('Sat', 'nonveg', 'None', 'Dinner')]
+        before = loaded._predict_forest(rows)
+
+        self.train(1, n=60)
+
+        self.assertEqual(loaded._predict_forest(rows), before)
+        self.assertEqual(ProviderDishModel(1).stats['total_samples'], 60)
+
+    def test_unknown_format_version_is_rejected(self):
+        model = self.train(1)
+        data = bytearray(model.model_file.read_bytes())
+        data[8:12] = (model_file.FORMAT_VERSION + 1).to_bytes(4, 'little')
+        model.model_file.write_bytes(bytes(data))
+
+        with self.assertRaisesRegex(ValueError, 'format'):
+            read_model_file(model.model_file)
+        self.assertIsNone(ProviderDishModel(1).rf_model)
+
+
+class FeatureEncoderTests(ModelDirMixin, SimpleTestCase):
+
+    def sklearn_encode(self, model, rows):
+        """The original DataFrame-per-feature encoding the compiled encoder replaces."""
+        parts = []
+        for key, values in zip(provider_model.FEATURE_KEYS, zip(*rows)):
+            encoder = model.encoders[key]
+            parts.append(encoder.transform(pd.DataFrame({encoder.feature_names_in_[0]: list(values)})))
+        return np.hstack(parts)
+
+    def test_matches_sklearn_encoders_bit_for_bit(self):
+        model = self.train(1)
+        rows = [
+            ('Mon', 'veg', 'None', 'Lunch'),
+            ('Sun', 'nonveg', 'Yes', 'Dinner'),
+            ('Funday', 'veg', 'None', 'Lunch'),
+            ('Tue', 'jain', 'Maybe', 'Breakfast'),
+        ]
+
+        expected = self.sklearn_encode(model, rows)
+        encoded = model.feature_encoder.transform(rows)
+
+        self.assertEqual(encoded.dtype, expected.dtype)
+        np.testing.assert_array_equal(encoded, expected)
+        for i, row in enumerate(rows):
+            np.testing.assert_array_equal(model.feature_encoder.transform_one(row), expected[i:i + 1])
+
+    def test_reuses_output_buffer(self):
+        model = self.train(1)
+        out = np.full((1, model.feature_encoder.width), 7.0)
+
+        result = model.feature_encoder.transform_one(('Mon', 'veg', 'None', 'Lunch'), out=out)
+
+        self.assertIs(result, out)
+        self.assertEqual(out.sum(), 4)
+
+    def test_model_encodes_into_a_growing_buffer(self):
+        model = self.train(1)
+        rows = [('Mon', 'veg', 'None', 'Lunch'), ('Tue', 'nonveg', 'Yes', 'Dinner')]
+
+        first = model._encode(rows[:1])
+        np.testing.assert_array_equal(first, self.sklearn_encode(model, rows[:1]))
+        both = model._encode(rows)
+        np.testing.assert_array_equal(both, self.sklearn_encode(model, rows))
+        # A smaller call reuses the grown buffer
+        self.assertTrue(np.shares_memory(model._encode(rows[:1]), both))
+
+    def test_missing_values_are_a_category(self):
+        from sklearn.preprocessing import OneHotEncoder
+
+        encoder = OneHotEncoder(sparse_output=False, handle_unknown='ignore')
+        frame = pd.DataFrame({'holiday': ['Yes', np.nan, 'No']}, dtype=object)
+        expected = encoder.fit_transform(frame)
+
+        encoded = FeatureEncoder([encoder]).transform([(v,) for v in frame['holiday']])
+
+        np.testing.assert_array_equal(encoded, expected)
+
+    def test_compiled_on_load(self):
+        self.train(1)
+
+        loaded = ProviderDishModel(1)
+
+        self.assertEqual(loaded.feature_encoder.width, loaded.rf_model.n_features_in_)
+
+
+def create_plan(provider, meal_type='BOTH', coupons=60):
+    return MessPlan.objects.create(
+        provider=provider, plan_name='Monthly', plan_type='MONTHLY', meal_type=meal_type,
+        service_type='DINING', mess_type='BOTH', coupons=coupons, price=3000,
+    )
+
+
+def create_student(username, plan, coupons=60):
+    student = User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='x', role=User.Role.STUDENT
+    )
+    profile = StudentProfile.objects.create(user=student)
+    ActiveSubscription.objects.create(
+        student_profile=profile, student=student, mess_plan=plan, provider=plan.provider,
+        remaining_coupons=coupons, total_coupons=coupons,
+    )
+    return student
+
+
+class AttendanceHistoryMixin(ModelDirMixin):
+    """A provider with three students, two dishes and a helper to fill past days."""
+
+    def setUp(self):
+        super().setUp()
+        self.provider = User.objects.create_user(username='mess', password='x', role=User.Role.PROVIDER)
+        self.plan = create_plan(self.provider)
+        self.students = [create_student(f'student{i}', self.plan) for i in range(3)]
+        self.paneer = MenuItem.objects.create(provider=self.provider, dish_name='Paneer', dish_type='veg')
+        self.biryani = MenuItem.objects.create(provider=self.provider, dish_name='Biryani', dish_type='nonveg')
+        self.today = timezone.now().date()
+
+    def add_days(self, days):
+        for offset in range(days):
+            date = self.today - timedelta(days=offset)
+            for meal in ('LUNCH', 'DINNER'):
+                for student in self.students[:1 + offset % 3]:
+                    Attendance.objects.create(
+                        student=student, provider=self.provider, mess_plan=self.plan,
+                        date=date, meal_type=meal, status=Attendance.Status.PRESENT,
+                    )
+                menu = DailyMenu.objects.create(provider=self.provider, date=date, meal_type=meal)
+                menu.menu_items.set([self.biryani, self.paneer])
+        rebuild_attendance_summary(self.provider.id)
+
+
+class HistoricalDataTests(AttendanceHistoryMixin, TestCase):
+
+    def test_query_count_is_constant(self):
+        model = ProviderDishModel(self.provider.id)
+        self.add_days(5)
+        with self.assertNumQueries(3):
+            model.get_historical_data_from_db()
+
+        for offset in range(5, 40):
+            date = self.today - timedelta(days=offset)
+            Attendance.objects.create(
+                student=self.students[0], provider=self.provider, mess_plan=self.plan,
+                date=date, meal_type='LUNCH', status=Attendance.Status.PRESENT,
+            )
+            MessHoliday.objects.create(provider=self.provider, date=date, meal_type='DINNER')
+        rebuild_attendance_summary(self.provider.id)
+        with self.assertNumQueries(3):
+            df = model.get_historical_data_from_db()
+        self.assertEqual(len(df), 5 * 2 + 35)
+
+    def test_rows_carry_main_dish_holiday_and_counts(self):
+        self.add_days(3)
+        yesterday = self.today - timedelta(days=1)
+        MessHoliday.objects.create(provider=self.provider, date=yesterday, meal_type='BOTH')
+
+        df = ProviderDishModel(self.provider.id).get_historical_data_from_db()
+
+        first = df.iloc[0]
+        self.assertEqual(first['dish_name'], 'Paneer')
+        self.assertEqual(first['dish_type'], 'veg')
+        self.assertEqual(list(df['attended_students']), [3, 3, 2, 2, 1, 1])
+        self.assertEqual(list(df['holiday']), ['None', 'None', 'Yes', 'Yes', 'None', 'None'])
+        self.assertEqual(set(df['meal_type']), {'Lunch', 'Dinner'})
+
+    def test_window_length_is_configurable(self):
+        self.add_days(10)
+        model = ProviderDishModel(self.provider.id)
+
+        self.assertEqual(len(model.get_historical_data_from_db(days=3)), 8)
+        self.assertEqual(model.count_historical_records(days=3), 8)
+        with self.settings(PROVIDER_MODEL_HISTORY_DAYS=1):
+            self.assertEqual(model.count_historical_records(), 4)
+
+
+class RetrainingTests(AttendanceHistoryMixin, TestCase):
+
+    def test_check_retraining_needed(self):
+        self.assertEqual(check_retraining_needed(self.provider.id), (True, "No trained model"))
+
+        self.add_days(12)
+        provider_model.retrain_provider_model(self.provider.id)
+        needed, reason = check_retraining_needed(self.provider.id)
+        self.assertFalse(needed, reason)
+
+        with self.settings(PROVIDER_MODEL_MAX_AGE_DAYS=0):
+            self.assertTrue(check_retraining_needed(self.provider.id)[0])
+
+    def test_retrain_records_performance(self):
+        self.add_days(12)
+
+        metadata = provider_model.retrain_provider_model(self.provider.id, auto_retrain=True)
+
+        self.assertEqual(metadata['provider_id'], self.provider.id)
+        self.assertEqual(metadata['n_samples'], 24)
+        self.assertTrue(metadata['auto_retrain'])
+        self.assertEqual(ModelPerformance.objects.get(provider=self.provider).training_samples, 24)
+
+    def test_retrain_providers_summary(self):
+        self.add_days(12)
+        idle = User.objects.create_user(username='idle', email='idle@example.com', password='x', role=User.Role.PROVIDER)
+        seen = []
+
+        summary = retrain_providers([self.provider.id, idle.id], workers=1, on_result=seen.append)
+
+        self.assertEqual(summary['total_providers'], 2)
+        self.assertEqual(summary['retrained'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['failed'], 0)
+        self.assertEqual([r['provider_id'] for r in seen], [self.provider.id, idle.id])
+
+        summary = retrain_providers([self.provider.id], workers=1, only_needed=True)
+        self.assertEqual(summary['skipped'], 1)
+
+    def test_retrain_view_records_forest_params(self):
+        from . import views
+
+        self.add_days(12)
+        request = RequestFactory().post('/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = self.provider
+        request._messages = mock.MagicMock()
+
+        with mock.patch.object(views, 'retrain_provider_model', wraps=views.retrain_provider_model) as retrain:
+            response = views.retrain_model_view(request, self.provider.id)
+
+        retrain.assert_called_once_with(self.provider.id)
+        self.assertEqual(json.loads(response.content)['stats']['n_samples'], 24)
+        performance = ModelPerformance.objects.get(provider=self.provider)
+        self.assertEqual(performance.forest_params, provider_model.get_provider_model(self.provider.id).stats['forest_params'])
+
+    def test_daemonic_process_retrains_inline(self):
+        # A Celery prefork worker is daemonic and may not start a process pool
+        self.add_days(12)
+        with mock.patch('multiprocessing.current_process') as current_process, \
+                mock.patch.object(retraining, '_run_in_child') as run_in_child:
+            current_process.return_value.daemon = True
+            summary = retrain_providers([self.provider.id, self.provider.id], workers=4)
+
+        run_in_child.assert_not_called()
+        self.assertEqual(summary['workers'], 1)
+        self.assertEqual(summary['retrained'], 2)
+
+    def test_soft_time_limit_is_reported_as_timeout(self):
+        self.add_days(12)
+        with mock.patch.object(provider_model, 'retrain_provider_model', side_effect=SoftTimeLimitExceeded()):
+            result = retraining.retrain_one(self.provider.id)
+
+        self.assertEqual(result['status'], 'timeout')
+        self.assertEqual(retraining.summarize([result], 1, 0.5)['timed_out'], 1)
+
+
+def _slow_retrain(provider_id, only_needed=False, n_jobs=-1):
+    """Stand-in for retrain_one whose provider 2 never finishes in time."""
+    if provider_id == 2:
+        time.sleep(30)
+    return {'provider_id': provider_id, 'status': 'skipped', 'reason': 'stub'}
+
+
+class ParallelRetrainingTests(SimpleTestCase):
+
+    def test_stuck_provider_is_terminated_and_counted_as_failed(self):
+        started = time.monotonic()
+        with mock.patch.object(retraining, 'retrain_one', _slow_retrain):
+            summary = retrain_providers([1, 2, 3], workers=2, timeout=1)
+
+        self.assertLess(time.monotonic() - started, 10)
+        statuses = {r['provider_id']: r['status'] for r in summary['results']}
+        self.assertEqual(statuses, {1: 'skipped', 2: 'timeout', 3: 'skipped'})
+        self.assertEqual(summary['failed'], 1)
+        self.assertEqual(summary['timed_out'], 1)
+
+
+SMALL_GRID = {'n_estimators': [10, 20], 'max_depth': [3, None], 'min_samples_split': [2]}
+
+
+class DriftMonitorTests(AttendanceHistoryMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_days(14)
+        provider_model.retrain_provider_model(self.provider.id, n_jobs=1)
+
+    def replay_history(self):
+        """Pretend the model was trained two weeks ago, so the history counts as new meals."""
+        monitor = update_drift_monitor(self.provider.id)
+        monitor.processed_through = self.today - timedelta(days=15)
+        monitor.save()
+
+    def test_running_stats_match_numpy(self):
+        values = [3, 7, 7, 19, 24, 1]
+        stats = RunningStats()
+        for value in values:
+            stats.push(value)
+
+        self.assertEqual(stats.count, 6)
+        self.assertAlmostEqual(stats.mean, np.mean(values))
+        self.assertAlmostEqual(stats.variance, np.var(values, ddof=1))
+        self.assertEqual(RunningStats.from_list(stats.to_list()).m2, stats.m2)
+
+    def test_detect_drift_ranks_segments(self):
+        segments = {
+            'Mon|LUNCH|veg': {'baseline': [10, 40.0, 90.0], 'attendance': [5, 40.5, 20.0], 'residual': [5, 0.5, 20.0]},
+            'Tue|LUNCH|veg': {'baseline': [10, 40.0, 90.0], 'attendance': [5, 60.0, 20.0], 'residual': [5, 1.0, 20.0]},
+            'Wed|LUNCH|nonveg': {'attendance': [5, 30.0, 4.0], 'residual': [5, -2.0, 4.0]},
+            'Thu|LUNCH|veg': {'baseline': [10, 40.0, 90.0], 'attendance': [2, 90.0, 0.0], 'residual': [2, 50.0, 0.0]},
+        }
+
+        drifted = detect_drift(segments, min_samples=4, threshold=3.0)
+
+        self.assertEqual([(key, kind) for key, _, kind in drifted], [('Wed|LUNCH|nonveg', 'unseen'), ('Tue|LUNCH|veg', 'shift')])
+
+    def test_monitor_folds_in_new_meals_once(self):
+        self.replay_history()
+
+        with self.assertNumQueries(5):
+            monitor = update_drift_monitor(self.provider.id)
+        counts = sum(segment['attendance'][0] for segment in monitor.segments.values())
+        self.assertEqual(counts, 13 * 2)
+        self.assertEqual(monitor.processed_through, self.today - timedelta(days=1))
+
+        update_drift_monitor(self.provider.id)
+        monitor.refresh_from_db()
+        self.assertEqual(sum(segment['attendance'][0] for segment in monitor.segments.values()), 13 * 2)
+
+    def test_no_retraining_without_drift(self):
+        self.replay_history()
+        with self.settings(PROVIDER_DRIFT_MIN_SAMPLES=2):
+            needed, reason = check_retraining_needed(self.provider.id)
+        self.assertFalse(needed, reason)
+        self.assertIn('26 meals monitored', reason)
+
+    def test_retraining_needed_after_attendance_shift(self):
+        self.replay_history()
+        AttendanceSummary.objects.filter(provider=self.provider, date__lt=self.today).update(present_count=F('present_count') + 20)
+        with self.settings(PROVIDER_DRIFT_MIN_SAMPLES=2):
+            needed, reason = check_retraining_needed(self.provider.id)
+        self.assertTrue(needed)
+        # Every segment with two new meals (Saturday has only one) drifted
+        self.assertTrue(reason.startswith('12 drifted segment(s)'), reason)
+
+    def test_retrain_restarts_monitor_from_new_baseline(self):
+        self.replay_history()
+        update_drift_monitor(self.provider.id)
+
+        provider_model.retrain_provider_model(self.provider.id, n_jobs=1)
+        monitor = update_drift_monitor(self.provider.id)
+
+        self.assertEqual(monitor.processed_through, self.today)
+        self.assertTrue(all('attendance' not in segment for segment in monitor.segments.values()))
+        self.assertEqual(
+            sum(segment['baseline'][0] for segment in monitor.segments.values()),
+            ProviderDishModel(self.provider.id).stats['total_samples'],
+        )
+
+
+class TuningTests(AttendanceHistoryMixin, TestCase):
+
+    def test_folds_only_validate_on_later_rows(self):
+        folds = rolling_origin_folds(50, 4)
+
+        self.assertEqual(len(folds), 4)
+        for train_idx, test_idx in folds:
+            self.assertLess(train_idx.max(), test_idx.min())
+            self.assertEqual(train_idx.min(), 0)
+        self.assertEqual([len(train) for train, _ in folds], sorted(len(train) for train, _ in folds))
+        self.assertEqual(folds[-1][1].max(), 49)
+
+    def test_search_ranks_every_candidate(self):
+        df = make_training_frame(60)
+        X = ProviderDishModel(1)._fit_encoders(df)
+
+        result = search_forest_params(X, df['attended_students'].values, param_grid=SMALL_GRID, n_folds=3, n_jobs=2)
+
+        self.assertEqual(result['n_candidates'], 4)
+        self.assertEqual(result['n_folds'], 3)
+        self.assertEqual(result['best_params'], result['results'][0]['params'])
+        self.assertEqual([r['mae'] for r in result['results']], sorted(r['mae'] for r in result['results']))
+        json.dumps(result)
+
+    def test_tune_saves_choice_with_artifacts(self):
+        model = ProviderDishModel(1)
+        tuning = model.tune(make_training_frame(60), param_grid=SMALL_GRID, n_folds=3, n_jobs=1)
+
+        self.assertEqual(model.rf_model.n_estimators, tuning['best_params']['n_estimators'])
+        reloaded = ProviderDishModel(1)
+        self.assertEqual(reloaded.stats['forest_params'], tuning['best_params'])
+        with open(reloaded.tuning_path) as f:
+            self.assertEqual(json.load(f)['best_params'], tuning['best_params'])
+
+        # Untuned training goes back to the defaults and drops the stale summary
+        reloaded.train(make_training_frame(60))
+        self.assertEqual(ProviderDishModel(1).stats['forest_params'], DEFAULT_FOREST_PARAMS)
+        self.assertFalse(reloaded.tuning_path.exists())
+
+    def test_retrain_records_backtest_and_keeps_tuned_params(self):
+        self.add_days(15)
+
+        with self.settings(PROVIDER_MODEL_PARAM_GRID=SMALL_GRID, PROVIDER_MODEL_TUNING_FOLDS=3):
+            metadata = provider_model.retrain_provider_model(self.provider.id, n_jobs=1, tune=True)
+
+        tuned = ModelPerformance.objects.get(provider=self.provider)
+        self.assertEqual(tuned.forest_params, metadata['forest_params'])
+        self.assertEqual(tuned.validation_folds, 3)
+        self.assertEqual(tuned.validation_mae, metadata['validation']['mae'])
+        self.assertIsNotNone(tuned.validation_rmse)
+
+        provider_model.retrain_provider_model(self.provider.id)
+        latest = ModelPerformance.objects.latest('id')
+        self.assertEqual(latest.forest_params, metadata['forest_params'])
+        self.assertIsNone(latest.validation_mae)
+
+
+class UpdatePredictionActualsTests(AttendanceHistoryMixin, TestCase):
+
+    def log(self, days_ago, meal_type='Lunch', predicted=3):
+        return PredictionLog.objects.create(
+            provider=self.provider, date=self.today - timedelta(days=days_ago), meal_type=meal_type,
+            dish_name='Paneer', dish_type='veg', predicted_attendance=predicted,
+        )
+
+    def test_fills_pending_logs_in_chunks(self):
+        self.add_days(4)
+        logs = [self.log(1), self.log(1, 'DINNER', predicted=1), self.log(2), self.log(3, predicted=4)]
+        today = self.log(0)
+        no_data = self.log(20)
+
+        updated = provider_model.update_prediction_actuals(batch_size=2)
+
+        self.assertEqual(updated, 4)
+        for log in logs:
+            log.refresh_from_db()
+            self.assertEqual(log.accuracy_percentage, prediction_accuracy(log.predicted_attendance, log.actual_attendance))
+        self.assertEqual([log.actual_attendance for log in logs], [2, 2, 3, 1])
+        self.assertEqual(logs[0].accuracy_percentage, 50.0)
+        self.assertEqual(logs[3].accuracy_percentage, 0)
+        for log in (today, no_data):
+            log.refresh_from_db()
+            self.assertIsNone(log.actual_attendance)
+
+        self.assertEqual(provider_model.update_prediction_actuals(), 0)
+
+    def test_calculate_accuracy_uses_shared_helper(self):
+        log = self.log(1, predicted=45)
+        log.actual_attendance = 50
+
+        self.assertEqual(log.calculate_accuracy(), prediction_accuracy(45, 50))
+        self.assertEqual(log.accuracy_percentage, 90.0)
+
+
+class AccuracyStatsTests(TestCase):
+
+    def setUp(self):
+        self.provider = User.objects.create_user(
+            username='mess', email='mess@example.com', password='x', role=User.Role.PROVIDER
+        )
+        self.today = timezone.now().date()
+        self.addCleanup(cache.clear)
+        # (days ago, meal, predicted, actual)
+        for days_ago, meal, predicted, actual in [
+            (1, 'Lunch', 40, 50),
+            (2, 'DINNER', 30, 30),
+            (9, 'LUNCH', 20, 10),
+            (40, 'Dinner', 5, 0),
+        ]:
+            PredictionLog.objects.create(
+                provider=self.provider, date=self.today - timedelta(days=days_ago), meal_type=meal,
+                dish_name='Paneer', dish_type='veg', predicted_attendance=predicted,
+                actual_attendance=actual, accuracy_percentage=prediction_accuracy(predicted, actual),
+            )
+        PredictionLog.objects.create(
+            provider=self.provider, date=self.today, meal_type='Lunch',
+            dish_name='Paneer', dish_type='veg', predicted_attendance=99,
+        )
+
+    def test_aggregates_match_python(self):
+        with self.assertNumQueries(3):
+            stats = compute_accuracy_stats(self.provider.id, today=self.today)
+
+        overall = stats['overall']
+        self.assertEqual(overall['count'], 4)
+        self.assertEqual(overall['mean_accuracy'], round((80 + 100 + 0 + 0) / 4, 2))
+        self.assertEqual(overall['mae'], round((10 + 0 + 10 + 5) / 4, 2))
+        self.assertEqual(overall['mape'], round((20 + 0 + 100) / 3, 2))
+        self.assertEqual(stats['last_7_days']['count'], 2)
+        self.assertEqual(stats['last_7_days']['mae'], 5.0)
+        self.assertEqual(stats['last_30_days']['count'], 3)
+
+        by_meal = {row['meal_type']: row for row in stats['by_meal']}
+        self.assertEqual(by_meal['LUNCH']['count'], 2)
+        self.assertEqual(by_meal['DINNER']['mape'], 0.0)
+        weekdays = {row['weekday']: row['count'] for row in stats['by_weekday']}
+        self.assertEqual(sum(weekdays.values()), 4)
+        self.assertEqual(weekdays[(self.today - timedelta(days=1)).strftime('%a')], 1)
+
+    def test_cached_until_actuals_are_updated(self):
+        first = get_accuracy_stats(self.provider.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_accuracy_stats(self.provider.id), first)
+
+        PredictionLog.objects.filter(actual_attendance__isnull=True).update(date=self.today - timedelta(days=3))
+        AttendanceSummary.objects.create(
+            provider=self.provider, date=self.today - timedelta(days=3), meal_type='LUNCH', present_count=99
+        )
+        provider_model.update_prediction_actuals(provider_id=self.provider.id)
+
+        self.assertEqual(get_accuracy_stats(self.provider.id)['overall']['count'], 5)
+
+    def test_analytics_dashboard_uses_cached_stats(self):
+        from . import views
+
+        request = RequestFactory().get('/')
+        request.user = self.provider
+        get_accuracy_stats(self.provider.id)
+
+        with mock.patch('mess_app.services.compute_accuracy_stats') as compute, \
+                mock.patch.object(views, 'render') as render:
+            views.analytics_dashboard(request, self.provider.id)
+
+        compute.assert_not_called()
+        context = render.call_args[0][2]
+        self.assertEqual(context['avg_accuracy'], 45.0)
+        self.assertEqual(context['accuracy_stats']['overall']['count'], 4)
+
+
+class ForecastTests(AttendanceHistoryMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_days(15)
+        provider_model.train_provider_model(self.provider.id, n_jobs=1)
+        self.day = lambda offset: self.today + timedelta(days=offset)
+
+    def forecast(self, offset, meal_type):
+        return AttendanceForecast.objects.get(provider=self.provider, date=self.day(offset), meal_type=meal_type)
+
+    def test_week_honours_holidays_leave_and_planned_menus(self):
+        MessHoliday.objects.create(provider=self.provider, date=self.day(1), meal_type='LUNCH')
+        StudentHoliday.objects.create(student=self.students[0], mess_plan=self.plan, date=self.day(2), meal_type='both')
+        menu = DailyMenu.objects.create(provider=self.provider, date=self.day(3), meal_type='DINNER')
+        menu.menu_items.set([self.paneer])
+
+        with self.assertNumQueries(10):
+            forecasts = generate_forecasts(self.provider.id, start=self.today)
+
+        self.assertEqual(len(forecasts), 14)
+        closed = self.forecast(1, 'Lunch')
+        self.assertTrue(closed.is_mess_holiday)
+        self.assertEqual(closed.predicted_attendance, 0)
+        self.assertFalse(self.forecast(1, 'Dinner').is_mess_holiday)
+
+        for meal_type in ('Lunch', 'Dinner'):
+            on_leave = self.forecast(2, meal_type)
+            self.assertEqual(on_leave.students_on_leave, 1)
+            self.assertEqual(on_leave.expected_students, 2)
+            self.assertLessEqual(on_leave.predicted_attendance, 2)
+        self.assertEqual(self.forecast(0, 'Lunch').expected_students, 3)
+
+        planned = self.forecast(3, 'Dinner')
+        self.assertEqual((planned.dish_name, planned.dish_type), ('Paneer', 'veg'))
+        top = self.forecast(4, 'Lunch')
+        self.assertEqual(len(top.recommendations), 2)
+        self.assertEqual(top.dish_name, top.recommendations[0]['dish_name'])
+        self.assertEqual(
+            top.predicted_attendance, min(top.recommendations[0]['predicted_attendance'], top.expected_students)
+        )
+        self.assertLessEqual(top.predicted_lower, top.predicted_attendance)
+        self.assertLessEqual(top.predicted_upper, top.expected_students)
+
+        logs = PredictionLog.objects.filter(provider=self.provider, date__gte=self.today)
+        self.assertEqual(logs.count(), 13)
+        self.assertEqual(logs.get(date=self.day(3), meal_type='Dinner').dish_name, 'Paneer')
+
+    def test_leave_caps_headcount_but_not_the_ranking(self):
+        for student in self.students:
+            StudentHoliday.objects.create(student=student, mess_plan=self.plan, date=self.day(2), meal_type='LUNCH')
+
+        generate_forecasts(self.provider.id, start=self.today)
+
+        everyone_away = self.forecast(2, 'Lunch')
+        self.assertEqual(everyone_away.predicted_attendance, 0)
+        # Same numbers as the live recommendations recommend_dish falls back to
+        live = provider_model.get_recommendations_for_provider(
+            self.provider.id, self.day(2).strftime('%a'), 'Lunch', 'None'
+        )
+        self.assertGreater(live[0]['predicted_attendance'], 0)
+        self.assertEqual(
+            {(r['dish_name'], r['predicted_attendance']) for r in everyone_away.recommendations},
+            {(r['dish_name'], r['predicted_attendance']) for r in live[:2]},
+        )
+
+    def test_rerun_replaces_pending_rows(self):
+        generate_forecasts(self.provider.id, start=self.today)
+        MessHoliday.objects.create(provider=self.provider, date=self.day(5), meal_type='BOTH')
+
+        generate_forecasts(self.provider.id, start=self.today)
+
+        self.assertEqual(AttendanceForecast.objects.filter(provider=self.provider).count(), 14)
+        self.assertTrue(self.forecast(5, 'Dinner').is_mess_holiday)
+        self.assertEqual(PredictionLog.objects.filter(provider=self.provider).count(), 12)
+
+    def test_rerun_updates_only_this_providers_logs(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='x', role=User.Role.PROVIDER)
+        theirs = PredictionLog.objects.create(
+            provider=other, date=self.day(1), meal_type='Lunch', dish_name='Dal', dish_type='veg', predicted_attendance=5,
+        )
+        generate_forecasts(self.provider.id, start=self.today)
+        log = PredictionLog.objects.get(provider=self.provider, date=self.day(2), meal_type='Lunch')
+
+        generate_forecasts(self.provider.id, start=self.today)
+
+        self.assertTrue(PredictionLog.objects.filter(pk=log.pk).exists())
+        self.assertEqual(PredictionLog.objects.filter(provider=self.provider).count(), 14)
+        self.assertTrue(PredictionLog.objects.filter(pk=theirs.pk).exists())
+
+    def test_all_providers_skips_untrained(self):
+        User.objects.create_user(username='idle', email='idle@example.com', password='x', role=User.Role.PROVIDER)
+
+        summary = generate_all_forecasts()
+
+        self.assertEqual(summary['providers'], 1)
+        self.assertEqual(summary['skipped'], 1)
+        self.assertEqual(summary['forecasts'], 14)
+
+    def test_recommend_page_reads_forecast(self):
+        from . import views
+
+        generate_forecasts(self.provider.id)
+        expected = AttendanceForecast.objects.filter(provider=self.provider, meal_type='Dinner').first()
+        request = RequestFactory().post('/', {
+            'day': expected.date.strftime('%a'), 'meal_time': 'Dinner', 'holiday': 'None',
+        })
+        request.user = self.provider
+        request._messages = mock.MagicMock()
+
+        with mock.patch.object(views, 'get_recommendations_for_provider') as live, \
+                mock.patch.object(views, 'render') as render:
+            views.recommend_dish(request, self.provider.id)
+
+        live.assert_not_called()
+        context = render.call_args[0][2]
+        self.assertEqual(context['forecast'], expected)
+        self.assertEqual(context['recommendations'], expected.recommendations)
+
+
+class GlobalModelTests(AttendanceHistoryMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.add_days(14)
+        # A new provider with six meals: too few for a model of its own
+        self.newcomer = User.objects.create_user(
+            username='newcomer', email='newcomer@example.com', password='x', role=User.Role.PROVIDER
+        )
+        plan = MessPlan.objects.create(
+            provider=self.newcomer, plan_name='Lunch', plan_type='MONTHLY', meal_type='LUNCH',
+            service_type='TIFFIN', mess_type='VEG', coupons=30, price=1500,
+        )
+        MessPlan.objects.create(
+            provider=self.newcomer, plan_name='Dinner', plan_type='MONTHLY', meal_type='DINNER',
+            service_type='TIFFIN', mess_type='VEG', coupons=30, price=1500,
+        )
+        create_student('newcomer_student', plan)
+        for offset in range(3):
+            for meal in ('LUNCH', 'DINNER'):
+                Attendance.objects.create(
+                    student=self.students[0], provider=self.newcomer, mess_plan=plan,
+                    date=self.today - timedelta(days=offset), meal_type=meal, status=Attendance.Status.PRESENT,
+                )
+        rebuild_attendance_summary(self.newcomer.id)
+
+    def test_provider_features(self):
+        idle = User.objects.create_user(username='idle', email='idle@example.com', password='x', role=User.Role.PROVIDER)
+
+        with self.assertNumQueries(1):
+            features = provider_features([self.provider.id, self.newcomer.id, idle.id])
+
+        self.assertEqual(features[self.provider.id], {
+            'active_subscribers': 3, 'plan_mix': {'LUNCH': 0.0, 'DINNER': 0.0, 'BOTH': 1.0}, 'mess_type': 'BOTH',
+        })
+        self.assertEqual(features[self.newcomer.id]['active_subscribers'], 1)
+        self.assertEqual(features[self.newcomer.id]['plan_mix'], {'LUNCH': 1.0, 'DINNER': 0.0, 'BOTH': 0.0})
+        self.assertEqual(features[self.newcomer.id]['mess_type'], 'VEG')
+        self.assertEqual(features[idle.id]['active_subscribers'], 0)
+        self.assertIsNone(features[idle.id]['mess_type'])
+        np.testing.assert_array_equal(provider_vector(features[self.provider.id]), [3, 0, 0, 1, 0, 0, 1])
+
+    def test_one_artifact_serves_every_provider(self):
+        model = train_global_model(n_jobs=1)
+
+        self.assertEqual([p.name for p in self.model_root.iterdir()], ['global'])
+        self.assertEqual(model.stats['total_samples'], 28 + 6)
+        with self.settings(PROVIDER_MODEL_MODE='global'):
+            newcomer = get_provider_model(self.newcomer.id)
+            provider = get_provider_model(self.provider.id)
+            self.assertIs(get_provider_model(self.newcomer.id), newcomer)
+
+        self.assertIsInstance(newcomer, GlobalProviderModel)
+        self.assertIs(newcomer.rf_model, provider.rf_model)
+        self.assertEqual(newcomer.stats['total_samples'], 6)
+        self.assertEqual(newcomer.stats['max_attendance'], 3)
+        rows = [('Mon', 'nonveg', 'None', 'Lunch'), ('Tue', 'veg', 'None', 'Dinner')]
+        self.assertEqual(newcomer.predict_many(rows), newcomer._predict_forest(rows))
+        # Provider features separate the two providers' predictions
+        self.assertNotEqual(
+            newcomer._encode(rows).tolist(), provider._encode(rows).tolist()
+        )
+        for interval in provider.predict_intervals(rows):
+            self.assertLessEqual(interval['lower'], interval['predicted'])
+            self.assertGreaterEqual(interval['upper'], interval['predicted'])
+
+    def test_views_reload_after_global_retrain(self):
+        train_global_model(n_jobs=1)
+        with self.settings(PROVIDER_MODEL_MODE='global'):
+            before = get_provider_model(self.provider.id)
+            # Views only predict; training goes through the global model
+            self.assertNotIsInstance(before, ProviderDishModel)
+            self.assertFalse(hasattr(before, 'train'))
+
+            train_global_model(n_jobs=1)
+            after = get_provider_model(self.provider.id)
+
+        self.assertIsNot(after, before)
+        self.assertIsNot(after.global_model, before.global_model)
+
+    def test_retrain_view_queues_global_model(self):
+        from . import views
+
+        def post():
+            request = RequestFactory().post('/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            request.user = self.newcomer
+            request._messages = mock.MagicMock()
+            return views.retrain_model_view(request, self.newcomer.id)
+
+        # Only the task's queueing is replaced; training happens on a Celery worker
+        task = mock.MagicMock()
+        tasks = mock.MagicMock(
+            GLOBAL_RETRAIN_QUEUED_KEY='test-global-retrain', GLOBAL_RETRAIN_QUEUED_TIMEOUT=60,
+            retrain_global_model=task,
+        )
+        cache.delete('test-global-retrain')
+        with self.settings(PROVIDER_MODEL_MODE='global'), \
+                mock.patch.dict(sys.modules, {'mess_app.tasks': tasks}), \
+                mock.patch.object(views, 'retrain_provider_model') as per_provider:
+            first, second = post(), post()
+
+        per_provider.assert_not_called()
+        task.delay.assert_called_once_with()
+        self.assertEqual(first.status_code, 202)
+        self.assertTrue(json.loads(first.content)['queued'])
+        self.assertIn('already in progress', json.loads(second.content)['message'])
+        self.assertIsNone(GlobalDishModel.artifact_version())
+        cache.delete('test-global-retrain')
+
+    def test_forecasts_for_providers_without_own_model(self):
+        train_global_model(n_jobs=1)
+
+        self.assertEqual(generate_all_forecasts()['skipped'], 2)
+        with self.settings(PROVIDER_MODEL_MODE='global'):
+            summary = generate_all_forecasts()
+
+        self.assertEqual(summary['providers'], 2)
+        self.assertEqual(AttendanceForecast.objects.filter(provider=self.newcomer).count(), 14)
+
+
+class GlobalModelEvaluationTests(ModelDirMixin, SimpleTestCase):
+
+    def test_compares_models_on_held_out_meals(self):
+        frames = {1: make_training_frame(60), 2: make_training_frame(40), 3: make_training_frame(10)}
+        features = {
+            provider_id: {'active_subscribers': 10 * provider_id, 'plan_mix': {'BOTH': 1.0}, 'mess_type': 'BOTH'}
+            for provider_id in frames
+        }
+
+        with mock.patch.object(provider_model.model_registry, 'invalidate') as invalidate, \
+                mock.patch.object(provider_model.global_model_registry, 'clear') as clear:
+            report = evaluate_global_model(frames, features, n_jobs=1, repeat=1)
+
+        # Models trained in temporary directories leave the serving caches alone
+        invalidate.assert_not_called()
+        clear.assert_not_called()
+        self.assertEqual(report['providers'], 3)
+        self.assertEqual(report['test_rows'], 12 + 8 + 2)
+        # Provider 3 has 8 training meals: only the global model covers it
+        self.assertEqual(report['covered_providers'], 2)
+        self.assertEqual(report['covered_rows'], 20)
+        for kind in ('provider', 'global'):
+            self.assertGreater(report[kind]['disk_bytes'], 0)
+            self.assertGreater(report[kind]['loaded_bytes'], 0)
+            self.assertGreaterEqual(report[kind]['metrics']['mae'], 0)
+        self.assertIsNotNone(report['global']['all_metrics'])
+        # Serving artifacts are untouched
+        self.assertEqual(list(self.model_root.iterdir()), [])
+        self.assertIsNone(GlobalDishModel.artifact_version())
+
+
+class DQNRecommenderTests(SimpleTestCase):
+
+    def setUp(self):
+        self.artifact_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.artifact_dir, ignore_errors=True)
+
+    def test_import_does_no_work(self):
+        code = "import sys, mess_app.ml.dqn_model; print(sorted({'torch', 'sklearn', 'pandas'} & set(sys.modules)))"
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True, text=True, check=True,
+        )
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_fits_from_csv_once_then_loads_artifacts(self):
+        fitted = dqn_recommender.DQNRecommender(artifact_dir=self.artifact_dir)
+        self.assertIsNone(fitted.rf_model)
+        fitted.load()
+        self.assertTrue((self.artifact_dir / 'rf_model.pkl').exists())
+
+        with mock.patch.object(dqn_recommender, 'fit_preprocessing') as fit:
+            loaded = dqn_recommender.DQNRecommender(artifact_dir=self.artifact_dir).load()
+        fit.assert_not_called()
+
+        for dish_name, _ in dqn_recommender.ORIGINAL_TRAINING_DISHES:
+            self.assertEqual(
+                loaded.predict_attendance_for_dish('Mon', 'None', 'Lunch', dish_name, []),
+                fitted.predict_attendance_for_dish('Mon', 'None', 'Lunch', dish_name, []),
+            )
+        self.assertEqual(loaded.model_loaded, dqn_recommender.MODEL_PATH.exists())
+
+
+class DQNBatchInferenceTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.recommender = dqn_recommender.DQNRecommender().load()
+
+    def test_batched_q_values_match_single_states(self):
+        batched = self.recommender.q_values('Tue', 'None', 'Dinner')
+
+        for (_, dish_type), q in zip(self.recommender.dishes, batched):
+            self.assertAlmostEqual(q, self.recommender.q_value('Tue', 'None', 'Dinner', dish_type), places=5)
+
+    def test_week_in_one_call_matches_per_context_recommendations(self):
+        provider_dishes = [('Paneer', 'veg'), ('Biryani', 'nonveg')]
+
+        # A near-zero temperature makes the softmax pick the best dish deterministically
+        week = self.recommender.predict_week(provider_dishes, temperature=1e-6)
+
+        self.assertEqual(len(week), 14)
+        for (day, meal), result in week.items():
+            single = self.recommender.predict_best_dish(day, 'None', meal, provider_dishes, temperature=1e-6)
+            # States only depend on the dish type, so same-type dishes tie; compare everything else
+            self.assertEqual(result[1:], single[1:])
+            name, dish_type, meal_time, attendance = result
+            self.assertEqual(meal_time, meal)
+            self.assertEqual(attendance, self.recommender.predict_attendance_for_dish(day, 'None', meal, name, provider_dishes))
+
+    def test_forward_pass_and_forest_run_once_per_batch(self):
+        contexts = [('Mon', 'None', 'Lunch'), ('Sat', 'Yes', 'Dinner'), ('Sun', 'None', 'Lunch')]
+        network = self.recommender.q_network
+
+        with mock.patch.object(network, 'forward', wraps=network.forward) as forward, \
+                mock.patch.object(self.recommender.rf_model, 'predict', wraps=self.recommender.rf_model.predict) as forest:
+            results = self.recommender.predict_best_dishes(contexts, [])
+
+        self.assertEqual(len(results), 3)
+        forward.assert_called_once()
+        self.assertEqual(forward.call_args[0][0].shape[0], 3 * len(self.recommender.dishes))
+        forest.assert_called_once()
+
+    def test_state_buffer_is_one_growing_matrix(self):
+        recommender = dqn_recommender.DQNRecommender().load()
+
+        small, _ = recommender._state_buffer(2)
+        large, large_tensor = recommender._state_buffer(5)
+        again, _ = recommender._state_buffer(3)
+
+        self.assertEqual(small.shape[0], 2)
+        self.assertEqual(large.shape[0], 5)
+        self.assertFalse(np.shares_memory(small, large))
+        self.assertTrue(np.shares_memory(again, large))
+        if large_tensor is not None:
+            self.assertEqual(large_tensor.data_ptr(), large.ctypes.data)
+
+
+class DQNTrainingTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .ml import train_dqn_model
+        cls.trainer = train_dqn_model
+        _, X, y = train_dqn_model.load_training_data()
+        cls.X, cls.y = X[:100], y[:100]
+
+    def train(self, episodes=4):
+        self.trainer.seed_everything(7)
+        return self.trainer.train(self.X, self.y, episodes=episodes, batch_size=8, verbose=False)
+
+    def test_seeded_runs_are_reproducible(self):
+        first, transitions = self.train()
+        second, _ = self.train()
+
+        self.assertEqual(transitions, 8 * (4 * 20 - 8))
+        for a, b in zip(first.q_network.parameters(), second.q_network.parameters()):
+            self.assertTrue(a.equal(b))
+
+    def test_one_optimizer_step_per_minibatch(self):
+        agent, _ = self.train(episodes=1)
+        batch = agent.memory.sample(8)
+
+        with mock.patch.object(agent.optimizer, 'step', wraps=agent.optimizer.step) as step:
+            loss = agent.learn(batch)
+
+        step.assert_called_once()
+        self.assertGreaterEqual(loss, 0)
+
+    def test_command_line_options(self):
+        args = self.trainer.parse_args(['--episodes', '5', '--batch-size', '16', '--threads', '2', '--seed', '3'])
+
+        self.assertEqual((args.episodes, args.batch_size, args.threads, args.seed), (5, 16, 2, 3))
+        self.assertFalse(args.benchmark)
+
+
+class ReplayMemoryTests(SimpleTestCase):
+
+    def setUp(self):
+        from .ml.dqn_network import ReplayMemory
+        self.memory = ReplayMemory(capacity=4, state_dim=3)
+
+    def push(self, *values):
+        for value in values:
+            self.memory.push(np.full(3, value), value % 8, float(value), np.full(3, value + 1), value % 2 == 0)
+
+    def test_ring_buffer_overwrites_oldest(self):
+        self.push(0, 1, 2, 3, 4, 5)
+
+        self.assertEqual(len(self.memory), 4)
+        self.assertEqual(sorted(self.memory.rewards.tolist()), [2.0, 3.0, 4.0, 5.0])
+
+    def test_sample_returns_aligned_tensors(self):
+        self.push(0, 1, 2)
+        np.random.seed(0)
+
+        states, actions, rewards, next_states, dones = self.memory.sample(16)
+
+        self.assertEqual(tuple(states.shape), (16, 3))
+        self.assertEqual(str(states.dtype), 'torch.float32')
+        self.assertEqual(str(actions.dtype), 'torch.int64')
+        self.assertTrue(set(rewards.tolist()) <= {0.0, 1.0, 2.0})
+        np.testing.assert_array_equal(states[:, 0].numpy(), rewards.numpy())
+        np.testing.assert_array_equal(next_states[:, 0].numpy(), rewards.numpy() + 1)
+        np.testing.assert_array_equal(dones.numpy(), (rewards.numpy() % 2 == 0).astype(np.float32))
+
+    def test_save_and_resume(self):
+        from .ml.dqn_network import ReplayMemory
+
+        self.push(0, 1, 2, 3, 4, 5)
+        path = Path(tempfile.mkdtemp()) / 'memory.npz'
+        self.addCleanup(shutil.rmtree, path.parent, ignore_errors=True)
+        self.memory.save(path)
+
+        resumed = ReplayMemory(capacity=3, state_dim=3)
+        resumed.load(path)
+
+        self.assertEqual(len(resumed), 3)
+        self.assertEqual(sorted(resumed.rewards.tolist()), [3.0, 4.0, 5.0])
+        resumed.push(np.zeros(3), 0, 6.0, np.zeros(3), False)
+        self.assertEqual(sorted(resumed.rewards.tolist()), [4.0, 5.0, 6.0])
+
+    def test_load_wraps_like_push(self):
+        from .ml.dqn_network import ReplayMemory
+
+        self.push(0, 1, 2)
+        path = Path(tempfile.mkdtemp()) / 'memory.npz'
+        self.addCleanup(shutil.rmtree, path.parent, ignore_errors=True)
+        self.memory.save(path)
+
+        loaded, pushed = ReplayMemory(capacity=4, state_dim=3), ReplayMemory(capacity=4, state_dim=3)
+        for memory in (loaded, pushed):
+            memory.push(np.full(3, 9), 1, 9.0, np.full(3, 10), False)
+            memory.push(np.full(3, 8), 0, 8.0, np.full(3, 9), True)
+        loaded.load(path)
+        for value in (0, 1, 2):
+            pushed.push(np.full(3, value), value % 8, float(value), np.full(3, value + 1), value % 2 == 0)
+
+        self.assertEqual((loaded.position, loaded.size), (pushed.position, pushed.size))
+        for name in ('states', 'actions', 'rewards', 'next_states', 'dones'):
+            np.testing.assert_array_equal(getattr(loaded, name), getattr(pushed, name))
+
+
+class NumpyQNetworkTests(SimpleTestCase):
+
+    def test_matches_torch_model(self):
+        numpy_backend = dqn_recommender.DQNRecommender(backend='numpy').load()
+        torch_backend = dqn_recommender.DQNRecommender(backend='torch').load()
+        self.assertFalse(numpy_backend.uses_torch)
+        self.assertTrue(torch_backend.uses_torch)
+
+        states = [
+            (day, dish_type, holiday, meal)
+            for day in dqn_recommender.WEEK_DAYS
+            for dish_type in ('veg', 'nonveg')
+            for holiday in ('None', 'Semester break')
+            for meal in ('Lunch', 'Dinner')
+        ]
+        np.testing.assert_allclose(
+            numpy_backend.q_values_for_states(states), torch_backend.q_values_for_states(states), rtol=1e-5, atol=1e-6
+        )
+
+    def test_export_round_trip_and_staleness(self):
+        import torch
+        from .ml.dqn_network import QNetwork
+        from .ml.qnetwork_numpy import NumpyQNetwork
+
+        tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        network = QNetwork(15, 8)
+        torch.save({'q_network_state_dict': network.state_dict(), 'target_network_state_dict': network.state_dict()},
+                   tmp / 'model.pth')
+        network.export_numpy(tmp / 'qnetwork.npz', source=tmp / 'model.pth')
+
+        x = np.random.RandomState(0).rand(5, 15).astype(np.float32)
+        with torch.no_grad():
+            expected = network(torch.from_numpy(x)).numpy()
+        np.testing.assert_allclose(NumpyQNetwork.load(tmp / 'qnetwork.npz')(x), expected, rtol=1e-5, atol=1e-6)
+
+        shutil.copy(dqn_recommender.ARTIFACT_DIR / 'encoders.pkl', tmp)
+        shutil.copy(dqn_recommender.ARTIFACT_DIR / 'scaler.pkl', tmp)
+        shutil.copy(dqn_recommender.ARTIFACT_DIR / 'rf_model.pkl', tmp)
+        fresh = dqn_recommender.DQNRecommender(artifact_dir=tmp, model_path=tmp / 'model.pth').load()
+        self.assertFalse(fresh.uses_torch)
+
+        # Retraining rewrites the checkpoint; the old export must not be used any more
+        torch.save({'q_network_state_dict': QNetwork(15, 8).state_dict(),
+                    'target_network_state_dict': network.state_dict()}, tmp / 'model.pth')
+        stale = dqn_recommender.DQNRecommender(artifact_dir=tmp, model_path=tmp / 'model.pth').load()
+        self.assertTrue(stale.uses_torch)
@@ -1,17 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.cache import cache
 from django.http import JsonResponse
 from django.utils import timezone
 from datetime import timedelta
 from .ml.provider_model import (
-    ProviderDishModel,
+    get_provider_model,
+    model_mode,
+    model_registry,
+    retrain_provider_model,
     train_provider_model,
-    predict_for_provider,
+    predict_interval_for_provider,
     get_recommendations_for_provider,
     convert_to_json_safe
 )
 from .models import PredictionLog, ModelPerformance
+from .services import find_forecast, get_accuracy_stats, get_upcoming_forecasts
 from accounts.models import User
 from provider.models import MenuItem
 from student.models import Attendance
@@ -34,57 +39,39 @@ def retrain_model_view(request, provider_id):
         try:
             logger.info(f"Starting model retraining for provider {provider_id}")
             
-            # Check if we have data
-            model = ProviderDishModel(provider_id)
-            df = model.get_historical_data_from_db()
-            
-            logger.info(f"Retrieved {len(df)} records from database")
-            
-            if df.empty:
-                raise ValueError("No attendance data found. Start tracking attendance first.")
-            
-            if len(df) < 20:
-                raise ValueError(f"Need at least 20 attendance records. Currently have {len(df)}.")
-            
-            # Check data quality
-            if 'attended_students' not in df.columns:
-                raise ValueError("Data missing 'attended_students' column")
-            
-            logger.info(f"Data columns: {df.columns.tolist()}")
-            logger.info(f"Data shape: {df.shape}")
-            logger.info(f"Sample data:\n{df.head()}")
+            if model_mode() == 'global':
+                # One model serves every provider and takes minutes to train,
+                # so hand it to a Celery worker rather than block the request
+                from .tasks import GLOBAL_RETRAIN_QUEUED_KEY, GLOBAL_RETRAIN_QUEUED_TIMEOUT, retrain_global_model
+                
+                if cache.add(GLOBAL_RETRAIN_QUEUED_KEY, True, GLOBAL_RETRAIN_QUEUED_TIMEOUT):
+                    retrain_global_model.delay()
+                    message = "Retraining of the shared model has been queued."
+                else:
+                    message = "Retraining of the shared model is already in progress."
+                messages.info(request, message)
+                
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return JsonResponse({'success': True, 'queued': True, 'message': message}, status=202)
+                return redirect('analytics', provider_id=provider_id)
             
-            # Train the model
-            logger.info("Starting model training...")
-            model.train(df)
+            # Trains a fresh instance (cached models are shared), reusing the
+            # tuned forest settings, and records ModelPerformance
+            metadata = convert_to_json_safe(retrain_provider_model(provider_id))
             logger.info("Model training completed successfully")
             
-            # Save performance metrics
-            try:
-                ModelPerformance.objects.create(
-                    provider=provider,
-                    training_samples=model.stats['total_samples'],
-                    model_score=model.stats.get('model_score')
-                )
-                logger.info("Performance metrics saved")
-            except Exception as e:
-                logger.warning(f"Could not save performance metrics: {e}")
-            
-            # Convert stats to JSON-safe format
-            safe_stats = convert_to_json_safe(model.stats)
-            
             messages.success(
                 request,
                 f"✓ Model retrained successfully! "
-                f"Trained on {safe_stats['total_samples']} records. "
-                f"Average attendance: {safe_stats['avg_attendance']:.1f} students."
+                f"Trained on {metadata['n_samples']} records. "
+                f"Average attendance: {metadata['avg_attendance']:.1f} students."
             )
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': True,
                     'message': 'Model retrained successfully',
-                    'stats': safe_stats
+                    'stats': metadata
                 })
             
             return redirect('analytics', provider_id=provider_id)
@@ -121,14 +108,13 @@ def retrain_model_view(request, provider_id):
     
     # GET request
     try:
-        model = ProviderDishModel(provider_id)
-        df = model.get_historical_data_from_db()
+        model = get_provider_model(provider_id)
         
         context = {
             'provider': provider,
             'has_model': model.rf_model is not None,
             'current_stats': convert_to_json_safe(model.stats) if model.rf_model else None,
-            'available_records': len(df),
+            'available_records': model.count_historical_records(),
             'min_records_needed': 20,
         }
         
@@ -149,8 +135,7 @@ def predict_dish(request, provider_id):
         return redirect('home')
     
     try:
-        model = ProviderDishModel(provider_id)
-        df = model.get_historical_data_from_db()
+        model = get_provider_model(provider_id)
         
         provider_menu_items = MenuItem.objects.filter(provider_id=provider_id).order_by('dish_name')
         
@@ -172,7 +157,7 @@ def predict_dish(request, provider_id):
             'dish_types': dish_types,
             'has_model': model.rf_model is not None,
             'model_stats': convert_to_json_safe(model.stats),
-            'available_records': len(df),
+            'available_records': model.count_historical_records(),
         }
         
         if request.method == "POST":
@@ -184,20 +169,29 @@ def predict_dish(request, provider_id):
                 
                 dish_type = dish_types.get(selected_dish, 'veg')
                 
-                predicted_attendance = predict_for_provider(
+                prediction = predict_interval_for_provider(
                     provider_id, day, dish_type, holiday, meal_time
                 )
+                predicted_attendance = prediction['predicted']
                 
                 context.update({
                     'selected_dish': selected_dish,
                     'predicted_attendance': predicted_attendance,
+                    'prediction_interval': prediction,
                     'selected_day': day,
                     'selected_holiday': holiday,
                     'selected_meal_time': meal_time,
                     'prediction_made': True,
                 })
                 
-                messages.success(request, f"Prediction: {predicted_attendance} students expected")
+                if prediction['lower'] is not None:
+                    messages.success(
+                        request,
+                        f"Prediction: {predicted_attendance} students expected "
+                        f"(likely {prediction['lower']}–{prediction['upper']})"
+                    )
+                else:
+                    messages.success(request, f"Prediction: {predicted_attendance} students expected")
                 
             except Exception as e:
                 logger.error(f"Prediction error: {e}", exc_info=True)
@@ -221,7 +215,7 @@ def recommend_dish(request, provider_id):
         return redirect('home')
     
     try:
-        model = ProviderDishModel(provider_id)
+        model = get_provider_model(provider_id)
         
         context = {
             'provider': provider,
@@ -237,13 +231,19 @@ def recommend_dish(request, provider_id):
                 holiday = request.POST.get('holiday', 'None').capitalize()
                 meal_time = request.POST.get('meal_time')
                 
-                # Get recommendations
-                recommendations = get_recommendations_for_provider(
-                    provider_id, day, meal_time, holiday
-                )
+                # Serve the nightly forecast for the next such meal; run the
+                # model only for holidays or meals outside the forecast window
+                forecast = find_forecast(provider_id, day, meal_time) if holiday == 'None' else None
+                if forecast is not None and forecast.recommendations:
+                    recommendations = forecast.recommendations
+                else:
+                    recommendations = get_recommendations_for_provider(
+                        provider_id, day, meal_time, holiday
+                    )
                 
                 context.update({
                     'recommendations': recommendations,
+                    'forecast': forecast,
                     'selected_day': day,
                     'selected_holiday': holiday,
                     'selected_meal_time': meal_time,
@@ -279,7 +279,7 @@ def analytics_dashboard(request, provider_id):
         return redirect('home')
     
     try:
-        model = ProviderDishModel(provider_id)
+        model = get_provider_model(provider_id)
         
         # Get recent predictions
         recent_predictions = PredictionLog.objects.filter(
@@ -291,17 +291,11 @@ def analytics_dashboard(request, provider_id):
             provider=provider
         ).order_by('-training_date')[:5]
         
-        # Calculate accuracy metrics
-        predictions_with_actuals = PredictionLog.objects.filter(
-            provider=provider,
-            actual_attendance__isnull=False
-        )
+        # Accuracy metrics are aggregated in the database and cached
+        accuracy_stats = get_accuracy_stats(provider_id)
         
-        avg_accuracy = None
-        if predictions_with_actuals.exists():
-            accuracies = [p.accuracy_percentage for p in predictions_with_actuals if p.accuracy_percentage]
-            if accuracies:
-                avg_accuracy = sum(accuracies) / len(accuracies)
+        # Precomputed by the nightly forecast task
+        forecasts = get_upcoming_forecasts(provider_id)
         
         context = {
             'provider': provider,
@@ -309,7 +303,9 @@ def analytics_dashboard(request, provider_id):
             'model_stats': convert_to_json_safe(model.stats),
             'recent_predictions': recent_predictions,
             'performance_history': performance_history,
-            'avg_accuracy': round(avg_accuracy, 2) if avg_accuracy else None,
+            'avg_accuracy': accuracy_stats['overall']['mean_accuracy'],
+            'accuracy_stats': accuracy_stats,
+            'forecasts': forecasts,
         }
         
         return render(request, 'mess_app/analytics.html', context)
@@ -330,7 +326,7 @@ def debug_data(request, provider_id):
     try:
         from provider.models import DailyMenu, MessHoliday
         
-        model = ProviderDishModel(provider_id)
+        model = get_provider_model(provider_id)
         df = model.get_historical_data_from_db()
         
         # Check attendance records
@@ -354,6 +350,7 @@ def debug_data(request, provider_id):
             'data_columns': df.columns.tolist() if not df.empty else [],
             'sample_data': df.head(5).to_dict('records') if not df.empty else [],
             'data_types': {col: str(dtype) for col, dtype in df.dtypes.items()} if not df.empty else {},
+            'model_registry': model_registry.stats(),
         }
         
         return JsonResponse(debug_info, safe=False)
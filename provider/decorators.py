@@ -1,4 +1,7 @@
+from functools import wraps
+
 from django.contrib import messages
+from django.http import JsonResponse
 from django.shortcuts import redirect
 
 def provider_required(function):
@@ -16,4 +19,33 @@ def provider_required(function):
             messages.error(request, "Access Denied: This page is for providers only.")
             return redirect('home')  # Or your main landing page URL name
     
-    return wrap
\ No newline at end of file
+    return wrap
+
+
+def scan_device_required(function):
+    """
+    JSON counterpart of login_required + provider_required for endpoints
+    called by scanning devices. Authenticates an `Authorization: Bearer
+    <token>` header against ScanDevice and runs the view as the device's
+    provider; answers 401/403 with JSON instead of redirecting. Session
+    cookies are ignored, which is what lets such views be csrf_exempt.
+    """
+    from student.models import ScanDevice
+
+    @wraps(function)
+    def wrap(request, *args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token.strip():
+            return JsonResponse({'error': 'A device token is required.'}, status=401)
+        device = ScanDevice.objects.select_related('provider').filter(
+            token_hash=ScanDevice.hash_token(token.strip()), is_active=True
+        ).first()
+        if device is None:
+            return JsonResponse({'error': 'Invalid device token.'}, status=401)
+        if device.provider.role != 'PROVIDER' or not device.provider.is_active:
+            return JsonResponse({'error': 'Only providers can upload scans.'}, status=403)
+        request.user = device.provider
+        request.scan_device = device
+        return function(request, *args, **kwargs)
+
+    return wrap
@@ -1,71 +1,99 @@
 # provider/services.py
 
-from django.db import transaction
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Exists, F, OuterRef, Value, When
 from django.utils import timezone
 from accounts.models import User
 from student.models import ActiveSubscription, StudentHoliday, Attendance
+from student.scan_buffer import flush_pending_scans
+from student.services import record_attendance_counts
 from provider.models import MessHoliday
 
+logger = logging.getLogger(__name__)
+
+ABSENT_MARKING_ATTEMPTS = 3
+
 def mark_absent_students(provider, date, meal_type):
     """
-    Finds all subscribed students for a meal, checks who is missing,
-    and marks them absent, consuming a coupon.
+    Marks every subscriber of the meal who has no attendance record for it
+    and is not on leave as absent, consuming a coupon and deactivating
+    subscriptions that run out. Returns the number of students marked.
+
+    The absent set is computed in one query and written with one bulk
+    insert and one coupon UPDATE, so the cost barely grows with the number
+    of subscribers. Only the subscriptions whose ABSENT row this call
+    inserted are charged: if a scan or a concurrent run writes one of the
+    records between the query and the insert, the insert fails on the
+    unique constraint, the transaction rolls back and the absent set is
+    computed again.
     """
+    provider_id = getattr(provider, 'pk', provider)
+    # Buffered scans of this process must land before anyone counts as missing
+    flush_pending_scans()
+
     # 1. Check if the mess itself was on holiday. If so, do nothing.
-    if MessHoliday.objects.filter(provider=provider, date=date, meal_type__in=[meal_type, 'BOTH']).exists():
-        print("Mess is on holiday:", provider, date, meal_type)
+    if MessHoliday.objects.filter(provider_id=provider_id, date=date, meal_type__in=[meal_type, 'BOTH']).exists():
+        logger.info("Mess %s is on holiday for %s on %s; no absences marked", provider_id, meal_type, date)
         return 0
 
-    # 2. Find all students who should have attended
-    # This covers students with LUNCH, DINNER, or BOTH plan types correctly
-    subscribed_students = ActiveSubscription.objects.filter(
-        mess_plan__provider=provider,
+    # 2. Subscribers of this meal without a record for it and not on leave
+    absent = ActiveSubscription.objects.filter(
+        mess_plan__provider_id=provider_id,
         is_active=True,
         mess_plan__meal_type__in=[meal_type, 'BOTH']
-    ).values_list('student_id', flat=True)
-    # print("Subscribed students:", subscribed_students)
+    ).exclude(
+        student_id__in=Attendance.objects.filter(
+            provider_id=provider_id, date=date, meal_type=meal_type
+        ).values('student_id')
+    ).exclude(
+        Exists(StudentHoliday.objects.filter(
+            student_id=OuterRef('student_id'), mess_plan_id=OuterRef('mess_plan_id'),
+            date=date, meal_type__in=[meal_type, 'BOTH', 'both']
+        ))
+    ).order_by('id')
 
-    # 3. Find students who are exempt (already marked present or on leave)
-    exempt_students = Attendance.objects.filter(
-        provider=provider,
-        date=date,
-        meal_type=meal_type
-    ).values_list('student_id', flat=True)
-    # print("Exempt students (already marked):", exempt_students)
-    # 4. Find the students who are absent (subscribed but not exempt)
-    absent_student_ids = set(subscribed_students) - set(exempt_students)
-    # print("Absent student IDs:", absent_student_ids)
-    if not absent_student_ids:
-        print("No absent students found:", provider, date, meal_type)
-        return 0
+    for attempt in range(1, ABSENT_MARKING_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                # One record per (student, plan), the key Attendance is unique on
+                candidates = {}
+                for subscription_id, student_id, mess_plan_id in absent.values_list('id', 'student_id', 'mess_plan_id'):
+                    candidates.setdefault((student_id, mess_plan_id), subscription_id)
+                if not candidates:
+                    return 0
+                Attendance.objects.bulk_create([
+                    Attendance(
+                        student_id=student_id, provider_id=provider_id, mess_plan_id=mess_plan_id,
+                        date=date, meal_type=meal_type, status=Attendance.Status.ABSENT
+                    )
+                    for student_id, mess_plan_id in candidates
+                ])
 
-    # 5. Get the active subscriptions for the absent students
-    subscriptions_to_update = ActiveSubscription.objects.filter(
-        student_id__in=absent_student_ids,
-        mess_plan__provider=provider,
-        is_active=True
-    )
-    # print("Subscriptions to update:", subscriptions_to_update)
-    with transaction.atomic():
-        for sub in subscriptions_to_update:
-            # Create an 'ABSENT' record
-            Attendance.objects.create(
-                student_id=sub.student_id,
-                provider_id=provider,
-                mess_plan_id=sub.mess_plan.id,
-                date=date,
-                meal_type=meal_type,
-                status=Attendance.Status.ABSENT
+                # 3. Every candidate's record was inserted above; charge exactly those subscriptions
+                coupons_used = ActiveSubscription.objects.filter(
+                    id__in=candidates.values(),
+                    remaining_coupons__gt=0,
+                ).update(
+                    remaining_coupons=F('remaining_coupons') - 1,
+                    is_active=Case(When(remaining_coupons__lte=1, then=Value(False)), default=Value(True)),
+                )
+                record_attendance_counts(provider_id, date, meal_type, {Attendance.Status.ABSENT: len(candidates)})
+            break
+        except IntegrityError as exc:
+            if attempt == ABSENT_MARKING_ATTEMPTS:
+                raise
+            logger.warning(
+                "Absent marking for provider %s, %s on %s raced with another write (%s); retrying",
+                provider_id, meal_type, date, exc
             )
-            print(f"Marked absent: Student ID {sub.student_id} provider {provider} for mess plan id {sub.mess_plan.id} on {date} for {meal_type}")
-            # Consume a coupon
-            if sub.remaining_coupons > 0:
-                sub.remaining_coupons -= 1
-                if sub.remaining_coupons == 0:
-                    sub.is_active = False
-                sub.save(update_fields=['remaining_coupons', 'is_active'])
-    
-    return len(absent_student_ids)
+
+    logger.info(
+        "Marked %d students absent for provider %s, %s on %s (%d coupons used)",
+        len(candidates), provider_id, meal_type, date, coupons_used
+    )
+    return len(candidates)
 
 def mark_student_personal_holiday(provider,date, meal_type):
     """
@@ -78,24 +106,27 @@ def mark_student_personal_holiday(provider,date, meal_type):
         meal_type__in=[meal_type, 'both']
     ).select_related('student', 'mess_plan')
 
-    for holiday in student_holidays:
-        # Check if an attendance record already exists
-        if not Attendance.objects.filter(
-            student=holiday.student,
-            provider=provider,
-            date=date,
-            meal_type=meal_type
-        ).exists():
-            # Create a 'MESS_HOLIDAY' attendance record
-            Attendance.objects.create(
+    with transaction.atomic():
+        marked = 0
+        for holiday in student_holidays:
+            # Check if an attendance record already exists
+            if not Attendance.objects.filter(
                 student=holiday.student,
                 provider=provider,
-                mess_plan=holiday.mess_plan,
                 date=date,
-                meal_type=meal_type,
-                status=Attendance.Status.PERSONAL_HOLIDAY
-            )
-            # print(f"Marked mess holiday: Student ID {holiday.student.id} provider {provider} for mess plan id {holiday.mess_plan.id} on {date} for {meal_type}")
+                meal_type=meal_type
+            ).exists():
+                # Create a 'MESS_HOLIDAY' attendance record
+                Attendance.objects.create(
+                    student=holiday.student,
+                    provider=provider,
+                    mess_plan=holiday.mess_plan,
+                    date=date,
+                    meal_type=meal_type,
+                    status=Attendance.Status.PERSONAL_HOLIDAY
+                )
+                marked += 1
+        record_attendance_counts(provider, date, meal_type, {Attendance.Status.PERSONAL_HOLIDAY: marked})
     return student_holidays.count()
 
 def mark_student_mess_holiday(provider, date, meal_type):
@@ -110,23 +141,26 @@ def mark_student_mess_holiday(provider, date, meal_type):
         is_active=True,
         mess_plan__meal_type__in=[meal_type, 'BOTH']
     ).select_related('student', 'mess_plan')
-    print("Active subscriptions found:",active_subs)
-    for sub in active_subs:
-        # Check if an attendance record already exists
-        if not Attendance.objects.filter(
-            student=sub.student.id,
-            provider=provider,
-            date=date,
-            meal_type=meal_type
-        ).exists():
-            # Create a 'MESS_HOLIDAY' attendance record
-            Attendance.objects.create(
-                student=sub.student,
+    with transaction.atomic():
+        marked = 0
+        for sub in active_subs:
+            # Check if an attendance record already exists
+            if not Attendance.objects.filter(
+                student=sub.student.id,
                 provider=provider,
-                mess_plan=sub.mess_plan,
                 date=date,
-                meal_type=meal_type,
-                status=Attendance.Status.MESS_HOLIDAY
-            )
-            print(f"Marked mess holiday: Student ID {sub.student.id} provider {provider} for mess plan id {sub.mess_plan.id} on {date} for {meal_type}")
+                meal_type=meal_type
+            ).exists():
+                # Create a 'MESS_HOLIDAY' attendance record
+                Attendance.objects.create(
+                    student=sub.student,
+                    provider=provider,
+                    mess_plan=sub.mess_plan,
+                    date=date,
+                    meal_type=meal_type,
+                    status=Attendance.Status.MESS_HOLIDAY
+                )
+                marked += 1
+        record_attendance_counts(provider.id, date, meal_type, {Attendance.Status.MESS_HOLIDAY: marked})
+    logger.debug("Marked %s students on mess holiday for %s %s on %s", marked, provider.id, meal_type, date)
     return active_subs.count()
\ No newline at end of file
@@ -28,6 +28,7 @@ urlpatterns = [
     path('qr-code/', views.provider_qr_page, name='provider_qr_page'),
     path('mess/start/<str:meal_type>', views.start_mess, name='start_mess'),
     path('mess/stop/<str:meal_type>/', views.stop_mess, name='stop_mess'),
+    path('scans/batch/', views.upload_scan_batch, name='upload_scan_batch'),
     path('students/<int:student_id>/', views.provider_student_detail_view, name='provider_student_detail'),
 
     path('schedule/', views.DailyMenuListView.as_view(), name='daily_menu_list'),
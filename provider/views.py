@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from accounts.models import *
 from django.contrib import messages
@@ -16,9 +17,11 @@ from datetime import datetime
 import qrcode
 import io
 import base64
-from .decorators import provider_required
+from .decorators import provider_required, scan_device_required
 from .services import *
 from .forms import *
+from django.conf import settings
+from student.services import IdempotencyKeyReused, invalidate_active_meal, process_scan_batch
 
 
 @login_required
@@ -124,6 +127,7 @@ def provider_home(request):
         lunch_status.is_active = False
         lunch_status.stopped_at = timezone.now()
         lunch_status.save()
+        invalidate_active_meal(request.user.unique_id)
         mark_absent_students(provider=request.user.id, date=today, meal_type='LUNCH')
         mark_student_personal_holiday(provider=request.user.id, date=today, meal_type='LUNCH')
         messages.info(request, "The lunch service has been automatically closed.")
@@ -132,6 +136,7 @@ def provider_home(request):
         dinner_status.is_active = False
         dinner_status.stopped_at = timezone.now()
         dinner_status.save()
+        invalidate_active_meal(request.user.unique_id)
         mark_absent_students(provider=request.user.id, date=today, meal_type='DINNER')
         mark_student_mess_holiday(provider=request.user.id, date=today, meal_type='DINNER')
         messages.info(request, "The dinner service has been automatically closed.")
@@ -819,6 +824,7 @@ def start_mess(request, meal_type):
         mess_status.started_at = timezone.now()
         mess_status.menu_today.set(MenuItem.objects.filter(id__in=menu_item_ids))
         mess_status.save()
+        invalidate_active_meal(request.user.unique_id)
         messages.success(request, f"{meal_type.title()} mess started successfully!")
         _send_notifications_to_subscribed_students(
             provider=request.user,
@@ -831,6 +837,48 @@ def start_mess(request, meal_type):
     
     return redirect('provider_home')
 
+@csrf_exempt  # authenticated by the device token header, never by a session cookie
+@require_POST
+@scan_device_required
+def upload_scan_batch(request):
+    """
+    JSON endpoint for provider devices that collected scans while offline,
+    authenticated with a ScanDevice token (Authorization: Bearer <token>).
+    Body: {"idempotency_key": "...", "scans": [{"student": "<unique_id>",
+    "scanned_at": "<ISO 8601>", "meal_type": "LUNCH"}, ...]}; the key may
+    also come in an Idempotency-Key header. Retrying with the same key
+    returns the first upload's results without charging coupons again.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Request body must be JSON.'}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+
+    key = request.headers.get('Idempotency-Key') or payload.get('idempotency_key')
+    scans = payload.get('scans')
+    if not isinstance(key, str) or not key or len(key) > 100:
+        return JsonResponse({'error': 'An idempotency_key of at most 100 characters is required.'}, status=400)
+    if not isinstance(scans, list) or not scans:
+        return JsonResponse({'error': 'scans must be a non-empty list.'}, status=400)
+    max_scans = getattr(settings, 'SCAN_BATCH_MAX_SCANS', 2000)
+    if len(scans) > max_scans:
+        return JsonResponse({'error': f'At most {max_scans} scans per batch.'}, status=413)
+
+    try:
+        results, replayed = process_scan_batch(request.user, key, scans)
+    except IdempotencyKeyReused:
+        return JsonResponse({'error': 'This idempotency_key was already used for a different batch.'}, status=409)
+    accepted = sum(result['ok'] for result in results)
+    return JsonResponse({
+        'idempotency_key': key,
+        'replayed': replayed,
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results,
+    })
+
 # We will create the auto-absent logic in a separate services file later
 from .services import mark_absent_students 
 
@@ -852,6 +900,7 @@ def stop_mess(request, meal_type):
         mess_status.is_active = False
         mess_status.stopped_at = timezone.now()
         mess_status.save()
+        invalidate_active_meal(request.user.unique_id)
 
         print(request.user,today,meal_type_upper," inside if")
         # --- TRIGGER AUTO-ABSENT LOGIC (Corrected Call) ---
@@ -943,7 +992,7 @@ class DailyMenuDeleteView(LoginRequiredMixin, ProviderRequiredMixin, DeleteView)
 from django.shortcuts import render
 from django.views.generic import View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.db.models import Count, Q
+from django.db.models import Count, Q, Sum
 from django.utils import timezone
 from datetime import timedelta
 import calendar
@@ -986,11 +1035,10 @@ class ProviderDashboardView(LoginRequiredMixin, UserPassesTestMixin, View):
         expected_attendance_today = total_active_students - students_on_holiday_today
 
         # Yesterday's meals consumed
-        meals_consumed_yesterday = Attendance.objects.filter(
+        meals_consumed_yesterday = AttendanceSummary.objects.filter(
             provider=provider, 
-            date=yesterday, 
-            status=Attendance.Status.PRESENT
-        ).count()
+            date=yesterday
+        ).aggregate(total=Sum('present_count'))['total'] or 0
         
         key_metrics = {
             'total_active_students': total_active_students,
@@ -1003,14 +1051,12 @@ class ProviderDashboardView(LoginRequiredMixin, UserPassesTestMixin, View):
         total_weeks = 4
         
         # FIX FOR VALUE ERROR: Escaping the '%' sign for SQLite's strftime using '%%'
-        attendance_by_day = Attendance.objects.filter(
+        attendance_by_day = AttendanceSummary.objects.filter(
             provider=provider,
             date__gte=four_weeks_ago,
-            status=Attendance.Status.PRESENT,
-            # meal_type__in=['lunch', 'dinner']
         ).extra({'day_of_week': "strftime('%%w', date)"}).values('day_of_week', 'meal_type').annotate(
-            total_present=Count('id')
-        )
+            total_present=Sum('present_count')
+        ).order_by()
         
         # Mapping for SQLite's strftime('%%w'): 0=Sunday, 1=Monday, ..., 6=Saturday
         days_of_week_map = {
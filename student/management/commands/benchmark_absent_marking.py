@@ -0,0 +1,37 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from provider.services import mark_absent_students
+from student.management.commands.benchmark_scans import create_fixture
+from student.models import ActiveSubscription
+
+
+class Command(BaseCommand):
+    help = 'Measure mark_absent_students wall time and queries for growing numbers of subscribers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[50, 500, 5000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'  {"subscribers":>11} {"marked":>7} {"queries":>8} {"wall time":>11}')
+        for n_subscribers in options['subscribers']:
+            tag = uuid.uuid4().hex[:8]
+            provider, _ = create_fixture(tag, n_subscribers)
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    marked = mark_absent_students(provider=provider.id, date=timezone.now().date(), meal_type='LUNCH')
+                    elapsed = time.perf_counter() - start
+
+                self.stdout.write(f'  {n_subscribers:>11} {marked:>7} {len(queries):>8} {elapsed * 1000:>8.1f} ms')
+                # Every subscriber had one coupon left
+                if ActiveSubscription.objects.filter(provider=provider, is_active=True).exists() or marked != n_subscribers:
+                    self.stdout.write(self.style.ERROR(f'    {n_subscribers - marked} subscribers were not charged'))
+            finally:
+                User.objects.filter(username__startswith=f'bench-{tag}-').delete()
@@ -0,0 +1,121 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import StudentProfile, User
+from provider.models import MessPlan, MessStatus
+from student.models import ActiveSubscription, Attendance
+from student.scan_buffer import close_scan_buffer
+from student.services import mark_student_attendance
+
+
+def create_fixture(tag, n_students):
+    """
+    A throwaway provider with one BOTH plan, lunch running and `n_students`
+    subscribers with one coupon each; its users are named bench-<tag>-*.
+    """
+    provider = User.objects.create_user(
+        username=f'bench-{tag}-mess', email=f'bench-{tag}-mess@example.com', password=None, role=User.Role.PROVIDER
+    )
+    plan = MessPlan.objects.create(
+        provider=provider, plan_name='Benchmark', plan_type='MONTHLY', meal_type='BOTH',
+        service_type='DINING', mess_type='BOTH', coupons=1, price=0,
+    )
+    students = User.objects.bulk_create([
+        User(
+            username=f'bench-{tag}-{i}', email=f'bench-{tag}-{i}@example.com', role=User.Role.STUDENT,
+            unique_id=f'B{tag}{i:06d}',
+        )
+        for i in range(n_students)
+    ])
+    profiles = StudentProfile.objects.bulk_create([StudentProfile(user=student) for student in students])
+    ActiveSubscription.objects.bulk_create([
+        ActiveSubscription(
+            student_profile=profile, student=student, mess_plan=plan, provider=provider,
+            remaining_coupons=1, total_coupons=1,
+        )
+        for student, profile in zip(students, profiles)
+    ])
+    MessStatus.objects.create(provider=provider, date=timezone.now().date(), meal_type='LUNCH', is_active=True)
+    return provider, students
+
+
+class Command(BaseCommand):
+    help = 'Measure QR scan throughput and latency, per ingestion mode, against a throwaway provider with an active lunch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent scanners (1: sequential)')
+        parser.add_argument('--duplicates', type=int, default=2, help='Scans per student; extra scans are rejected')
+        parser.add_argument('--mode', choices=['sync', 'buffered', 'both'], default='both',
+                            help='Ingestion mode to measure (see SCAN_INGESTION_MODE)')
+
+    def handle(self, *args, **options):
+        modes = ['sync', 'buffered'] if options['mode'] == 'both' else [options['mode']]
+        n_scans = (options['students'] - 2) * options['duplicates']
+        self.stdout.write(
+            f'{n_scans} scans ({options["students"] - 2} students x {options["duplicates"]}) '
+            f'on {options["threads"]} threads'
+        )
+        self.stdout.write(
+            f'  {"mode":<9} {"scans/s":>8} {"mean":>10} {"p50":>10} {"p99":>10} {"queries":>8} '
+            f'{"accepted":>9} {"written in":>11}'
+        )
+        for mode in modes:
+            with override_settings(SCAN_INGESTION_MODE=mode):
+                self.run(mode, options)
+
+    def run(self, mode, options):
+        tag = uuid.uuid4().hex[:8]
+        provider, students = create_fixture(tag, options['students'])
+        close_scan_buffer()
+        try:
+            # The meal's first scan also creates its summary row (or loads the
+            # buffered mode's roster); count a steady-state one
+            mark_student_attendance(students[0], provider.unique_id)
+            with CaptureQueriesContext(connection) as queries:
+                mark_student_attendance(students[1], provider.unique_id)
+            scans = students[2:] * options['duplicates']
+
+            def scan(student):
+                try:
+                    start = time.perf_counter()
+                    success = mark_student_attendance(student, provider.unique_id)[0]
+                    return success, time.perf_counter() - start
+                finally:
+                    connection.close()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                results = list(pool.map(scan, scans))
+            answered = time.perf_counter() - started
+            # Buffered scans are durable once the buffer has drained
+            close_scan_buffer()
+            written = time.perf_counter() - started
+
+            latencies = np.array([seconds for _, seconds in results])
+            accepted = sum(success for success, _ in results)
+            self.stdout.write(
+                f'  {mode:<9} {len(scans) / answered:>8.0f} {self.ms(latencies.mean()):>10} '
+                f'{self.ms(np.percentile(latencies, 50)):>10} {self.ms(np.percentile(latencies, 99)):>10} '
+                f'{len(queries):>8} {accepted:>9} {self.ms(written):>11}'
+            )
+
+            spent = options['students'] - sum(
+                ActiveSubscription.objects.filter(provider=provider).values_list('remaining_coupons', flat=True)
+            )
+            if not spent == Attendance.objects.filter(provider=provider).count() == accepted + 2:
+                self.stdout.write(self.style.ERROR(f'    {spent} coupons spent for {accepted + 2} accepted scans'))
+        finally:
+            close_scan_buffer()
+            User.objects.filter(username__startswith=f'bench-{tag}-').delete()
+
+    def ms(self, seconds):
+        return f'{seconds * 1000:.2f} ms'
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from student.models import ScanDevice
+
+
+class Command(BaseCommand):
+    help = "Register a scanning device for a provider and print its upload token (shown only once)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider', type=str, help='Username of the provider')
+        parser.add_argument('name', type=str, help='Label for the device, e.g. "Counter 1"')
+
+    def handle(self, *args, **options):
+        try:
+            provider = User.objects.get(username=options['provider'], role=User.Role.PROVIDER)
+        except User.DoesNotExist:
+            raise CommandError(f"No provider named {options['provider']!r}.")
+
+        device, token = ScanDevice.issue(provider, options['name'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Registered {device}. Device token:"))
+        self.stdout.write(token)
@@ -0,0 +1,26 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from student.services import rebuild_attendance_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-meal AttendanceSummary rollup from raw attendance records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', type=int, help='Only rebuild rows for this provider id')
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days (default: full history)')
+
+    def handle(self, *args, **options):
+        start_date = None
+        if options['days']:
+            start_date = timezone.localdate() - timedelta(days=options['days'])
+
+        written = rebuild_attendance_summary(
+            provider_id=options['provider'],
+            start_date=start_date,
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Rebuilt {written} attendance summary rows.")
+        )
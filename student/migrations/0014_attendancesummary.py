@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import Upper
+
+
+def backfill_attendance_summary(apps, schema_editor):
+    Attendance = apps.get_model('student', 'Attendance')
+    AttendanceSummary = apps.get_model('student', 'AttendanceSummary')
+
+    rows = Attendance.objects.values('provider_id', 'date', meal=Upper('meal_type')).annotate(
+        present=Count('id', filter=Q(status='PRESENT')),
+        absent=Count('id', filter=Q(status='ABSENT')),
+        personal_holiday=Count('id', filter=Q(status='PERSONAL_HOLIDAY')),
+        mess_holiday=Count('id', filter=Q(status='MESS_HOLIDAY')),
+    ).order_by()
+    AttendanceSummary.objects.bulk_create(
+        [
+            AttendanceSummary(
+                provider_id=row['provider_id'],
+                date=row['date'],
+                meal_type=row['meal'],
+                present_count=row['present'],
+                absent_count=row['absent'],
+                personal_holiday_count=row['personal_holiday'],
+                mess_holiday_count=row['mess_holiday'],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0013_notification_subject'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal_type', models.CharField(max_length=10)),
+                ('present_count', models.PositiveIntegerField(default=0)),
+                ('absent_count', models.PositiveIntegerField(default=0)),
+                ('personal_holiday_count', models.PositiveIntegerField(default=0)),
+                ('mess_holiday_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.ForeignKey(limit_choices_to={'role': 'PROVIDER'}, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date', 'meal_type'],
+                'unique_together': {('provider', 'date', 'meal_type')},
+            },
+        ),
+        migrations.RunPython(backfill_attendance_summary, migrations.RunPython.noop),
+    ]
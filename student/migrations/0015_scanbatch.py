@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student', '0014_attendancesummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=100)),
+                ('payload_hash', models.CharField(max_length=64)),
+                ('results', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('provider', models.ForeignKey(limit_choices_to={'role': 'PROVIDER'}, on_delete=django.db.models.deletion.CASCADE, related_name='scan_batches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('provider', 'idempotency_key')},
+            },
+        ),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.db import models
 from django.conf import settings
 from accounts.models import StudentProfile
@@ -107,3 +110,96 @@ class Attendance(models.Model):
         status = "Present" if self.is_present else "Absent"
         return f"{self.student.username} - {self.mess_plan.plan_name} - {self.date} ({self.meal_type}) - {status}"
 
+
+
+class AttendanceSummary(models.Model):
+    """
+    Per-meal attendance counts for a provider, kept in step with Attendance.
+
+    Rows are updated in the same transaction that writes Attendance records
+    (see student.services.record_attendance_counts), so analytics and model
+    training can read one row per meal instead of scanning attendance.
+    """
+    STATUS_FIELDS = {
+        Attendance.Status.PRESENT: 'present_count',
+        Attendance.Status.ABSENT: 'absent_count',
+        Attendance.Status.PERSONAL_HOLIDAY: 'personal_holiday_count',
+        Attendance.Status.MESS_HOLIDAY: 'mess_holiday_count',
+    }
+
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        limit_choices_to={'role': 'PROVIDER'},
+        related_name="attendance_summaries"
+    )
+    date = models.DateField()
+    meal_type = models.CharField(max_length=10)  # LUNCH / DINNER
+    present_count = models.PositiveIntegerField(default=0)
+    absent_count = models.PositiveIntegerField(default=0)
+    personal_holiday_count = models.PositiveIntegerField(default=0)
+    mess_holiday_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('provider', 'date', 'meal_type')
+        ordering = ['date', 'meal_type']
+
+    def __str__(self):
+        return f"{self.provider.username} - {self.date} ({self.meal_type}) - {self.present_count} present"
+
+
+class ScanBatch(models.Model):
+    """
+    A batch of offline scans uploaded by a provider device, keyed by the
+    device's idempotency key. A retried upload returns the stored results
+    instead of charging coupons again (see student.services.process_scan_batch).
+    """
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        limit_choices_to={'role': 'PROVIDER'},
+        related_name="scan_batches"
+    )
+    idempotency_key = models.CharField(max_length=100)
+    payload_hash = models.CharField(max_length=64)  # sha256 of the scans, to catch a key reused for another batch
+    results = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('provider', 'idempotency_key')
+
+    def __str__(self):
+        return f"{self.provider.username} - {self.idempotency_key} ({len(self.results)} scans)"
+
+
+class ScanDevice(models.Model):
+    """
+    A provider's scanning device. It authenticates batch uploads with a
+    bearer token (see provider.decorators.scan_device_required); only the
+    token's sha256 is stored, the token itself is shown once by issue().
+    """
+    provider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        limit_choices_to={'role': 'PROVIDER'},
+        related_name="scan_devices"
+    )
+    name = models.CharField(max_length=100)
+    token_hash = models.CharField(max_length=64, unique=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, provider, name):
+        """Register a device for the provider; returns (device, token)."""
+        token = secrets.token_urlsafe(32)
+        device = cls.objects.create(provider=provider, name=name, token_hash=cls.hash_token(token))
+        return device, token
+
+    def __str__(self):
+        return f"{self.provider.username} - {self.name}"
@@ -0,0 +1,288 @@
+"""
+Write-behind ingestion of QR scans for meal-start bursts.
+
+With SCAN_INGESTION_MODE = 'buffered', mark_student_attendance answers a
+scan from memory: the provider and running meal come from the active-meal
+cache, and the student's subscription, remaining coupons and whether they
+already scanned come from a per-meal roster loaded once per process. The
+accepted scan is queued and the student gets a provisional result at once.
+A background thread writes the queue every SCAN_BUFFER_FLUSH_MS, or as soon
+as SCAN_BUFFER_MAX_SCANS are waiting, in one transaction: a bulk insert of
+the attendance rows, one coupon UPDATE with a CASE per subscription and the
+summary update.
+
+Durability: a provisional scan is durable only once its flush commits.
+Scans still queued when the process is killed (crash, SIGKILL, OOM) are
+lost; a normal interpreter exit flushes them. Rosters and queues are per
+process, so the database stays the judge: a flush re-checks attendance and
+coupons, and scans it rejects (a duplicate written elsewhere, coupons spent
+meanwhile, or absences marked before the flush) are dropped and the
+student is notified. Stopping a meal flushes the queue of the process that
+handles it before absences are marked.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+
+from .models import ActiveSubscription, Attendance, Notification
+
+logger = logging.getLogger(__name__)
+
+FLUSH_ATTEMPTS = 3
+NO_COUPONS = "You have no remaining coupons for this plan."
+
+Scan = namedtuple('Scan', 'student_id provider_id subscription_id mess_plan_id date meal_type')
+
+
+class _Roster:
+    """Subscriptions of one provider's running meal, keyed by student id."""
+
+    def __init__(self, subscriptions, marked):
+        # student id -> [subscription id, mess plan id, remaining coupons]
+        self.subscriptions = subscriptions
+        self.marked = marked
+
+
+def ingestion_mode():
+    return getattr(settings, 'SCAN_INGESTION_MODE', 'sync')
+
+
+def _already_marked(meal_type):
+    return f"You have already marked your attendance for today's {meal_type.lower()}."
+
+
+def load_roster(provider_id, date, meal_type):
+    """Two queries: active subscriptions covering the meal, and students who already have a record for it."""
+    subscriptions = ActiveSubscription.objects.filter(
+        mess_plan__provider_id=provider_id, is_active=True, mess_plan__meal_type__in=[meal_type, 'BOTH']
+    )
+    rows = {}
+    duplicated = set()
+    for student_id, subscription_id, mess_plan_id, remaining in subscriptions.values_list(
+        'student_profile__user_id', 'id', 'mess_plan_id', 'remaining_coupons'
+    ):
+        if student_id in rows:
+            duplicated.add(student_id)
+        rows[student_id] = [subscription_id, mess_plan_id, remaining]
+    # Students with several matching subscriptions get the synchronous path's error
+    for student_id in duplicated:
+        del rows[student_id]
+    marked = set(Attendance.objects.filter(
+        student_id__in=subscriptions.values('student_profile__user_id'), date=date, meal_type=meal_type
+    ).values_list('student_id', flat=True))
+    return _Roster(rows, marked)
+
+
+def write_scans(scans):
+    """
+    Write `scans` in one transaction and return the rejected ones as
+    (scan, reason) pairs.
+
+    Attendance and coupons are read first. A concurrent writer can still
+    change them before the insert; the unique constraint on Attendance or
+    the non-negative check on remaining_coupons then raises IntegrityError
+    and the caller retries with a fresh read.
+    """
+    from .services import record_attendance_counts, spend_coupons
+
+    with transaction.atomic():
+        existing = set(Attendance.objects.filter(
+            student_id__in={scan.student_id for scan in scans},
+            date__in={scan.date for scan in scans},
+            meal_type__in={scan.meal_type for scan in scans},
+        ).values_list('student_id', 'date', 'meal_type'))
+        coupons = dict(ActiveSubscription.objects.filter(
+            id__in={scan.subscription_id for scan in scans}, is_active=True
+        ).values_list('id', 'remaining_coupons'))
+
+        accepted, rejected = [], []
+        for scan in scans:
+            key = (scan.student_id, scan.date, scan.meal_type)
+            if key in existing:
+                rejected.append((scan, _already_marked(scan.meal_type)))
+            elif coupons.get(scan.subscription_id, 0) <= 0:
+                rejected.append((scan, NO_COUPONS))
+            else:
+                existing.add(key)
+                coupons[scan.subscription_id] -= 1
+                accepted.append(scan)
+
+        Attendance.objects.bulk_create([
+            Attendance(
+                student_id=scan.student_id, provider_id=scan.provider_id, mess_plan_id=scan.mess_plan_id,
+                date=scan.date, meal_type=scan.meal_type, status=Attendance.Status.PRESENT,
+            )
+            for scan in accepted
+        ])
+
+        spend_coupons(Counter(scan.subscription_id for scan in accepted))
+        meals = Counter((scan.provider_id, scan.date, scan.meal_type) for scan in accepted)
+        for (provider_id, date, meal_type), count in meals.items():
+            record_attendance_counts(provider_id, date, meal_type, {Attendance.Status.PRESENT: count})
+    return rejected
+
+
+class ScanBuffer:
+    """
+    In-process queue of validated scans, written by a background thread
+    every `flush_interval` seconds or once `max_scans` are waiting. With
+    background=False nothing is written until flush() is called.
+    """
+
+    def __init__(self, flush_interval=0.2, max_scans=200, background=True):
+        self.flush_interval = flush_interval
+        self.max_scans = max_scans
+        self.background = background
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._rosters = {}
+        self._thread = None
+        self._closed = False
+
+    def submit(self, student_id, provider_id, date, meal_type):
+        """
+        Provisional (success, message) for a scan, or None when the student
+        is not on the meal's roster and the scan should be validated against
+        the database instead.
+        """
+        key = (provider_id, date, meal_type)
+        with self._lock:
+            roster = self._rosters.get(key)
+        if roster is None:
+            roster = load_roster(provider_id, date, meal_type)
+            with self._lock:
+                for other in [k for k in self._rosters if k[1] != date]:
+                    del self._rosters[other]
+                roster = self._rosters.setdefault(key, roster)
+
+        with self._lock:
+            if self._closed:
+                return None
+            entry = roster.subscriptions.get(student_id)
+            if entry is None:
+                return None
+            if student_id in roster.marked:
+                return False, _already_marked(meal_type)
+            subscription_id, mess_plan_id, remaining = entry
+            if remaining <= 0:
+                return False, NO_COUPONS
+            entry[2] -= 1
+            roster.marked.add(student_id)
+            self._pending.append(Scan(student_id, provider_id, subscription_id, mess_plan_id, date, meal_type))
+            if self.background:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='scan-buffer', daemon=True)
+                    self._thread.start()
+                if len(self._pending) >= self.max_scans:
+                    self._wakeup.notify()
+        return True, f"Scan received for {meal_type.lower()}. Your attendance will be confirmed in a moment."
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write every queued scan; returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                scans, self._pending = self._pending, []
+            if not scans:
+                return 0
+            rejected = self._write(scans)
+            if rejected:
+                self._reject(rejected)
+            return len(scans) - len(rejected)
+
+    def close(self):
+        """Stop the background thread after a final flush."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            self._wakeup.notify()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _run(self):
+        try:
+            while True:
+                with self._lock:
+                    self._wakeup.wait_for(
+                        lambda: self._closed or len(self._pending) >= self.max_scans, timeout=self.flush_interval
+                    )
+                    closed = self._closed
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("Scan buffer flush failed")
+                if closed:
+                    return
+        finally:
+            connection.close()
+
+    def _write(self, scans):
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                return write_scans(scans)
+            except (IntegrityError, OperationalError) as exc:
+                logger.warning("Scan flush attempt %d of %d scans failed: %s", attempt, len(scans), exc)
+        # Keep one bad scan from sinking the batch
+        rejected = []
+        for scan in scans:
+            try:
+                rejected.extend(write_scans([scan]))
+            except (IntegrityError, OperationalError):
+                logger.exception("Dropping scan %s", scan)
+                rejected.append((scan, "Your scan could not be saved. Please scan again."))
+        return rejected
+
+    def _reject(self, rejected):
+        logger.info("Scan flush rejected %d scans", len(rejected))
+        with self._lock:
+            # The rosters disagreed with the database; reload them on the next scan
+            for scan, _ in rejected:
+                self._rosters.pop((scan.provider_id, scan.date, scan.meal_type), None)
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=scan.student_id,
+                subject="Attendance not recorded",
+                message=f"Your {scan.meal_type.lower()} scan on {scan.date} was not recorded. {reason}",
+            )
+            for scan, reason in rejected
+        ])
+
+
+_scan_buffer = None
+_scan_buffer_lock = threading.Lock()
+
+
+def get_scan_buffer():
+    global _scan_buffer
+    with _scan_buffer_lock:
+        if _scan_buffer is None:
+            _scan_buffer = ScanBuffer(
+                flush_interval=getattr(settings, 'SCAN_BUFFER_FLUSH_MS', 200) / 1000,
+                max_scans=getattr(settings, 'SCAN_BUFFER_MAX_SCANS', 200),
+            )
+        return _scan_buffer
+
+
+def flush_pending_scans():
+    """Write this process's queued scans now, e.g. before a meal's absences are marked."""
+    if _scan_buffer is not None:
+        _scan_buffer.flush()
+
+
+@atexit.register
+def close_scan_buffer():
+    global _scan_buffer
+    with _scan_buffer_lock:
+        buffer, _scan_buffer = _scan_buffer, None
+    if buffer is not None:
+        buffer.close()
@@ -1,67 +1,383 @@
 # student/services.py
 
-from django.db import transaction
+import datetime
+import hashlib
+import json
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Upper
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from accounts.models import User
-from provider.models import MessStatus
-from .models import ActiveSubscription, Attendance
+from provider.models import MessHoliday, MessStatus
+from .models import ActiveSubscription, Attendance, AttendanceSummary, ScanBatch
+from .scan_buffer import get_scan_buffer, ingestion_mode
 from django.shortcuts import get_object_or_404 # It's good practice to import this
 
+
+ACTIVE_MEAL_CACHE_KEY = 'student:active_meal:{provider_unique_id}:{date}'
+
+
+SCAN_BATCH_MEALS = ('LUNCH', 'DINNER')
+SCAN_BATCH_ATTEMPTS = 3
+
+
+class _NoCoupons(Exception):
+    pass
+
+
+class IdempotencyKeyReused(Exception):
+    """An upload reused the idempotency key of a different batch."""
+
+
+def get_active_meal(provider_unique_id):
+    """
+    (provider_id, meal_type) behind a provider QR code today: provider_id is
+    None for an unknown code and meal_type is None while no meal is running.
+
+    Cached, as it only changes when the provider starts or stops a meal;
+    those views call invalidate_active_meal.
+    """
+    today = timezone.now().date()
+    key = ACTIVE_MEAL_CACHE_KEY.format(provider_unique_id=provider_unique_id, date=today)
+    active_meal = cache.get(key)
+    if active_meal is None:
+        running = MessStatus.objects.filter(provider=OuterRef('pk'), date=today, is_active=True)
+        active_meal = User.objects.filter(unique_id=provider_unique_id, role='PROVIDER').annotate(
+            meal_type=Subquery(running.values('meal_type')[:1])
+        ).values_list('id', 'meal_type').first() or (None, None)
+        cache.set(key, active_meal, getattr(settings, 'SCAN_ACTIVE_MEAL_CACHE_TIMEOUT', 60))
+    return active_meal
+
+
+def invalidate_active_meal(provider_unique_id):
+    today = timezone.now().date()
+    cache.delete(ACTIVE_MEAL_CACHE_KEY.format(provider_unique_id=provider_unique_id, date=today))
+
+
 def mark_student_attendance(student, provider_unique_id):
     """
     Handles all validation and logic for a student scanning a QR code.
     Returns (success_boolean, message_string).
+
+    A successful scan costs four statements: the student's matching
+    subscription together with an already-marked check, then, in one
+    transaction, the Attendance insert, a conditional coupon decrement and
+    the summary update. The provider and its running meal come from
+    get_active_meal's cache. With SCAN_INGESTION_MODE = 'buffered' a scan
+    is answered provisionally without queries and written in a batch.
+    Concurrent scans are safe without locks: the unique_together constraint
+    on Attendance rejects a duplicate insert, and the decrement only
+    applies while coupons remain, deactivating the subscription when it
+    spends the last one.
     """
-    try:
-        provider = User.objects.get(unique_id=provider_unique_id, role='PROVIDER')
-    except User.DoesNotExist:
-        return False, "Invalid provider QR code."
+    today = timezone.now().date()
 
     # 1. Check if the mess is active
-    try:
-        mess_status = MessStatus.objects.get(
-            provider=provider,
-            date=timezone.now().date(),
-            is_active=True
-        )
-        current_meal = mess_status.meal_type
-    except MessStatus.DoesNotExist:
+    provider_id, current_meal = get_active_meal(provider_unique_id)
+    if provider_id is None:
+        return False, "Invalid provider QR code."
+    if current_meal is None:
         return False, "This mess is not currently active for any meal."
-    try:
-        # --- THIS IS THE CORRECTED LINE ---
-        active_sub = ActiveSubscription.objects.get(
-            student_profile__user=student, # Changed from 'student=student'
-            mess_plan__provider=provider,
+
+    if ingestion_mode() == 'buffered':
+        # Validated in memory and written later in a batch (see scan_buffer)
+        result = get_scan_buffer().submit(student.id, provider_id, today, current_meal)
+        if result is not None:
+            return result
+
+    # 2. Find the subscription covering this meal, and whether the meal is already marked
+    subscriptions = list(
+        ActiveSubscription.objects.filter(
+            student_profile__user=student,
+            mess_plan__provider_id=provider_id,
             is_active=True,
             mess_plan__meal_type__in=[current_meal, 'BOTH']
-        )
-    except ActiveSubscription.DoesNotExist:
+        ).annotate(
+            already_marked=Exists(Attendance.objects.filter(student=student, date=today, meal_type=current_meal))
+        ).values_list('id', 'mess_plan_id', 'remaining_coupons', 'already_marked')[:2]
+    )
+    if not subscriptions:
         return False, f"You do not have an active subscription for {current_meal.lower()} with this provider."
-    except ActiveSubscription.MultipleObjectsReturned:
+    if len(subscriptions) > 1:
         return False, "Error: You have multiple active subscriptions with this provider. Please contact support."
+    subscription_id, mess_plan_id, remaining_coupons, already_marked = subscriptions[0]
 
     # 3. Check if they have any coupons left
-    if active_sub.remaining_coupons <= 0:
+    if remaining_coupons <= 0:
         return False, "You have no remaining coupons for this plan."
 
     # 4. Check if they have already marked attendance for this meal today
-    if Attendance.objects.filter(student=student, date=timezone.now().date(), meal_type=current_meal).exists():
+    if already_marked:
+        return False, f"You have already marked your attendance for today's {current_meal.lower()}."
+
+    # 5. All checks passed. Mark attendance; a concurrent scan may still win either race.
+    try:
+        with transaction.atomic():
+            Attendance.objects.create(
+                student=student,
+                provider_id=provider_id,
+                mess_plan_id=mess_plan_id,
+                date=today,
+                meal_type=current_meal,
+                status=Attendance.Status.PRESENT
+            )
+            spent = ActiveSubscription.objects.filter(
+                id=subscription_id, is_active=True, remaining_coupons__gt=0
+            ).update(
+                remaining_coupons=F('remaining_coupons') - 1,
+                # SET expressions see the old value: the last coupon deactivates the plan
+                is_active=Case(When(remaining_coupons__lte=1, then=Value(False)), default=Value(True)),
+            )
+            if not spent:
+                raise _NoCoupons()
+            record_attendance_counts(provider_id, today, current_meal, {Attendance.Status.PRESENT: 1})
+    except IntegrityError:
         return False, f"You have already marked your attendance for today's {current_meal.lower()}."
+    except _NoCoupons:
+        return False, "You have no remaining coupons for this plan."
+
+    return True, f"Success! Attendance marked for {current_meal.lower()}. One coupon has been used."
+
+
+def record_attendance_counts(provider, date, meal_type, counts):
+    """
+    Add newly written attendance to the provider's daily summary row.
+    `provider` may be a User or an id; `counts` maps Attendance.Status
+    values to the number of rows created.
+    Call this inside the same transaction that creates the Attendance rows.
+    """
+    provider_id = getattr(provider, 'pk', provider)
+    updates = {
+        AttendanceSummary.STATUS_FIELDS[status]: F(AttendanceSummary.STATUS_FIELDS[status]) + count
+        for status, count in counts.items() if count
+    }
+    if not updates:
+        return
+
+    summary = AttendanceSummary.objects.filter(provider_id=provider_id, date=date, meal_type=meal_type.upper())
+    if summary.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            AttendanceSummary.objects.create(
+                provider_id=provider_id,
+                date=date,
+                meal_type=meal_type.upper(),
+                **{AttendanceSummary.STATUS_FIELDS[status]: count for status, count in counts.items()}
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        summary.update(**updates)
+
+
+def spend_coupons(spent):
+    """
+    Take spent[subscription_id] coupons from each subscription in one
+    UPDATE, deactivating those that reach zero. Raises IntegrityError if a
+    subscription is no longer active or has fewer coupons left (the column
+    may not go negative), so that the caller's transaction rolls back.
+    """
+    if not spent:
+        return
+    decrement = Case(*[When(id=sid, then=Value(n)) for sid, n in spent.items()], default=Value(0))
+    updated = ActiveSubscription.objects.filter(id__in=spent, is_active=True).update(
+        remaining_coupons=F('remaining_coupons') - decrement,
+        is_active=Case(When(remaining_coupons__lte=decrement, then=Value(False)), default=Value(True)),
+    )
+    if updated != len(spent):
+        raise IntegrityError("A subscription was deactivated while its coupons were being spent")
+
+
+def rebuild_attendance_summary(provider_id=None, start_date=None, end_date=None):
+    """
+    Recompute summary rows from the Attendance table.
+    Used for backfills and to repair drift after bulk imports.
+    Returns the number of summary rows written.
+    """
+    attendance = Attendance.objects.all()
+    summaries = AttendanceSummary.objects.all()
+    if provider_id is not None:
+        attendance = attendance.filter(provider_id=provider_id)
+        summaries = summaries.filter(provider_id=provider_id)
+    if start_date is not None:
+        attendance = attendance.filter(date__gte=start_date)
+        summaries = summaries.filter(date__gte=start_date)
+    if end_date is not None:
+        attendance = attendance.filter(date__lte=end_date)
+        summaries = summaries.filter(date__lte=end_date)
+
+    aggregates = {
+        field: Count('id', filter=Q(status=status))
+        for status, field in AttendanceSummary.STATUS_FIELDS.items()
+    }
+    rows = attendance.values('provider_id', 'date', meal=Upper('meal_type')).annotate(**aggregates).order_by()
 
-    # 5. All checks passed. Mark attendance.
     with transaction.atomic():
-        Attendance.objects.create(
-            student=student,
-            provider=provider,
-            mess_plan=active_sub.mess_plan,
-            date=timezone.now().date(),
-            meal_type=current_meal,
-            status=Attendance.Status.PRESENT
+        summaries.delete()
+        created = AttendanceSummary.objects.bulk_create(
+            [
+                AttendanceSummary(
+                    provider_id=row['provider_id'],
+                    date=row['date'],
+                    meal_type=row['meal'],
+                    **{field: row[field] for field in aggregates}
+                )
+                for row in rows
+            ],
+            batch_size=500,
         )
-        active_sub.remaining_coupons -= 1
-        active_sub.save(update_fields=['remaining_coupons'])
-        if active_sub.remaining_coupons == 0:
-            active_sub.is_active = False
+    return len(created)
+
+
+def process_scan_batch(provider, idempotency_key, scans):
+    """
+    Record scans collected offline by a provider device, each a dict with
+    'student' (unique_id), 'scanned_at' (ISO 8601) and 'meal_type', in one
+    transaction. Returns (results, replayed): one result dict per scan, in
+    order, and whether they come from an earlier upload with the same key.
+    Raises IdempotencyKeyReused if the key belonged to different scans.
+
+    Validation is set-based, so a batch costs the same number of queries
+    whatever its size. A scan for a meal already recorded as ABSENT (it was
+    closed before the device came back online) turns the record into
+    PRESENT without charging again: the absence already used the coupon.
+    """
+    payload_hash = hashlib.sha256(json.dumps(scans, sort_keys=True, default=str).encode()).hexdigest()
+    for attempt in range(1, SCAN_BATCH_ATTEMPTS + 1):
+        stored = ScanBatch.objects.filter(
+            provider=provider, idempotency_key=idempotency_key
+        ).values_list('payload_hash', 'results').first()
+        if stored is not None:
+            if stored[0] != payload_hash:
+                raise IdempotencyKeyReused(idempotency_key)
+            return stored[1], True
+        try:
+            with transaction.atomic():
+                results = _record_scans(provider.id, scans)
+                ScanBatch.objects.create(
+                    provider=provider, idempotency_key=idempotency_key, payload_hash=payload_hash, results=results
+                )
+            return results, False
+        except IntegrityError:
+            # The same upload committed first, or attendance changed under this one
+            if attempt == SCAN_BATCH_ATTEMPTS:
+                raise
+
+
+def _scan_result(code, message, ok=False):
+    return {'ok': ok, 'code': code, 'message': message}
+
+
+def _parse_scan(scan, today):
+    """(student unique_id, date, meal_type) of one uploaded scan, or an error result."""
+    if not isinstance(scan, dict):
+        return _scan_result('invalid', "Each scan needs student, scanned_at and meal_type.")
+    student = scan.get('student')
+    meal_type = str(scan.get('meal_type') or '').upper()
+    try:
+        scanned_at = parse_datetime(str(scan.get('scanned_at') or ''))
+    except ValueError:
+        scanned_at = None
+    if not student or scanned_at is None or meal_type not in SCAN_BATCH_MEALS:
+        return _scan_result('invalid', "Each scan needs student, scanned_at and meal_type.")
+    if timezone.is_naive(scanned_at):
+        scanned_at = timezone.make_aware(scanned_at)
+    # The mess day the scan belongs to, in TIME_ZONE
+    date = timezone.localdate(scanned_at)
+    if date > today:
+        return _scan_result('invalid', "Scan time is in the future.")
+    max_age = getattr(settings, 'SCAN_BATCH_MAX_AGE', 1)
+    if date < today - datetime.timedelta(days=max_age):
+        return _scan_result('invalid', f"Scans older than {max_age} day(s) can't be uploaded.")
+    return str(student), date, meal_type
+
+
+def _record_scans(provider_id, scans):
+    """Validate and write one batch; the caller holds the transaction."""
+    today = timezone.localdate()
+    results = [None] * len(scans)
+    parsed = []
+    for index, scan in enumerate(scans):
+        scan = _parse_scan(scan, today)
+        if isinstance(scan, dict):
+            results[index] = scan
+        else:
+            parsed.append((index, *scan))
+
+    # One query each for students, holidays, subscriptions and existing records
+    students = dict(User.objects.filter(
+        unique_id__in={uid for _, uid, _, _ in parsed}, role=User.Role.STUDENT
+    ).values_list('unique_id', 'id'))
+    dates = {date for _, _, date, _ in parsed}
+    holidays = set(MessHoliday.objects.filter(provider_id=provider_id, date__in=dates).values_list('date', 'meal_type'))
+    subscriptions = defaultdict(list)
+    for student_id, *subscription in ActiveSubscription.objects.filter(
+        student_profile__user_id__in=students.values(), mess_plan__provider_id=provider_id, is_active=True
+    ).values_list('student_profile__user_id', 'id', 'mess_plan_id', 'remaining_coupons', 'mess_plan__meal_type'):
+        subscriptions[student_id].append(subscription)
+    existing = {
+        (student_id, date, meal_type): (record_id, status)
+        for record_id, student_id, date, meal_type, status in Attendance.objects.filter(
+            student_id__in=students.values(), date__in=dates, meal_type__in=SCAN_BATCH_MEALS
+        ).values_list('id', 'student_id', 'date', 'meal_type', 'status')
+    }
 
+    coupons = {sid: remaining for subs in subscriptions.values() for sid, _, remaining, _ in subs}
+    new_records, corrected, recorded = [], [], set()
+    spent, counts = Counter(), defaultdict(Counter)
+    for index, uid, date, meal_type in parsed:
+        student_id = students.get(uid)
+        matching = [sub for sub in subscriptions.get(student_id, []) if sub[3] in (meal_type, 'BOTH')]
+        key = (student_id, date, meal_type)
+        record = existing.get(key)
+        if student_id is None:
+            results[index] = _scan_result('unknown_student', "Unknown student QR code.")
+        elif (date, meal_type) in holidays or (date, 'BOTH') in holidays:
+            results[index] = _scan_result('mess_holiday', f"{meal_type.title()} on {date} was a mess holiday.")
+        elif not matching:
+            results[index] = _scan_result(
+                'no_subscription', f"No active subscription for {meal_type.lower()} with this provider."
+            )
+        elif len(matching) > 1:
+            results[index] = _scan_result(
+                'multiple_subscriptions', "Multiple active subscriptions with this provider. Please contact support."
+            )
+        elif key in recorded or (record is not None and record[1] != Attendance.Status.ABSENT):
+            results[index] = _scan_result(
+                'already_marked', f"Attendance for {meal_type.lower()} on {date} is already marked."
+            )
+        elif record is not None:
+            corrected.append(record[0])
+            recorded.add(key)
+            counts[(date, meal_type)].update({Attendance.Status.PRESENT: 1, Attendance.Status.ABSENT: -1})
+            results[index] = _scan_result(
+                'absence_corrected', "Absence changed to present; no extra coupon used.", ok=True
+            )
+        elif coupons[matching[0][0]] <= 0:
+            results[index] = _scan_result('no_coupons', "No remaining coupons for this plan.")
+        else:
+            subscription_id, mess_plan_id = matching[0][:2]
+            coupons[subscription_id] -= 1
+            spent[subscription_id] += 1
+            recorded.add(key)
+            counts[(date, meal_type)][Attendance.Status.PRESENT] += 1
+            new_records.append(Attendance(
+                student_id=student_id, provider_id=provider_id, mess_plan_id=mess_plan_id,
+                date=date, meal_type=meal_type, status=Attendance.Status.PRESENT,
+            ))
+            results[index] = _scan_result('marked', "Attendance marked. One coupon has been used.", ok=True)
 
-    return True, f"Success! Attendance marked for {current_meal.lower()}. One coupon has been used."
\ No newline at end of file
+    Attendance.objects.bulk_create(new_records)
+    if corrected and Attendance.objects.filter(
+        id__in=corrected, status=Attendance.Status.ABSENT
+    ).update(status=Attendance.Status.PRESENT) != len(corrected):
+        raise IntegrityError("An absence changed while the batch was written")
+    spend_coupons(spent)
+    for (date, meal_type), meal_counts in counts.items():
+        record_attendance_counts(provider_id, date, meal_type, meal_counts)
+    return [{'index': index, **result} for index, result in enumerate(results)]
@@ -1,3 +1,496 @@
-from django.test import TestCase
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.db.models import Value
+from django.contrib.auth.models import AnonymousUser
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import StudentProfile, User
+from provider import views as provider_views
+from provider.models import MenuItem, MessHoliday, MessPlan, MessStatus
+from provider.services import mark_absent_students, mark_student_mess_holiday
+from .models import ActiveSubscription, Attendance, AttendanceSummary, Notification, ScanDevice, StudentHoliday
+from .scan_buffer import ScanBuffer
+from .services import get_active_meal, invalidate_active_meal, mark_student_attendance, rebuild_attendance_summary
+
+
+class MessFixtureMixin:
+    """A provider with one BOTH plan, a few subscribed students and lunch running today."""
+
+    students_count = 3
+    coupons = 30
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+        self.today = timezone.now().date()
+        self.provider = User.objects.create_user(
+            username='mess', email='mess@example.com', password='x', role=User.Role.PROVIDER
+        )
+        self.plan = MessPlan.objects.create(
+            provider=self.provider, plan_name='Monthly', plan_type='MONTHLY', meal_type='BOTH',
+            service_type='DINING', mess_type='BOTH', coupons=self.coupons, price=3000,
+        )
+        self.students = [self.create_student(f'student{i}') for i in range(self.students_count)]
+        self.lunch = MessStatus.objects.create(
+            provider=self.provider, date=self.today, meal_type='LUNCH', is_active=True
+        )
+
+    def create_student(self, username, coupons=None):
+        coupons = self.coupons if coupons is None else coupons
+        # No password: hashing dominates fixture time and tests never log in
+        student = User.objects.create_user(
+            username=username, email=f'{username}@example.com', password=None, role=User.Role.STUDENT
+        )
+        profile = StudentProfile.objects.create(user=student)
+        ActiveSubscription.objects.create(
+            student_profile=profile, student=student, mess_plan=self.plan, provider=self.provider,
+            remaining_coupons=coupons, total_coupons=max(coupons, 1),
+        )
+        return student
+
+
+class AttendanceSummaryTests(MessFixtureMixin, TestCase):
+
+    def summary(self, meal_type):
+        return AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type=meal_type)
+
+    def snapshot(self):
+        return list(AttendanceSummary.objects.order_by('meal_type').values(
+            'meal_type', 'present_count', 'absent_count', 'personal_holiday_count', 'mess_holiday_count'
+        ))
+
+    def test_scans_and_absent_marking_update_the_rollup(self):
+        success, _ = mark_student_attendance(self.students[0], self.provider.unique_id)
+        self.assertTrue(success)
+        self.assertEqual(self.summary('LUNCH').present_count, 1)
+
+        mark_absent_students(provider=self.provider.id, date=self.today, meal_type='LUNCH')
+
+        lunch = self.summary('LUNCH')
+        self.assertEqual((lunch.present_count, lunch.absent_count), (1, 2))
+
+    def test_mess_holiday_marking_updates_the_rollup(self):
+        mark_student_mess_holiday(provider=self.provider.id, date=self.today, meal_type='DINNER')
+
+        self.assertEqual(self.summary('DINNER').mess_holiday_count, 3)
+
+    def test_rebuild_matches_incremental_counts(self):
+        mark_student_attendance(self.students[0], self.provider.unique_id)
+        mark_absent_students(provider=self.provider.id, date=self.today, meal_type='LUNCH')
+        mark_student_mess_holiday(provider=self.provider.id, date=self.today, meal_type='DINNER')
+        incremental = self.snapshot()
+
+        written = rebuild_attendance_summary(provider_id=self.provider.id)
+
+        self.assertEqual(written, 2)
+        self.assertEqual(self.snapshot(), incremental)
+
+
+class AbsentMarkingTests(MessFixtureMixin, TestCase):
+
+    def mark(self, meal_type='LUNCH'):
+        return mark_absent_students(provider=self.provider.id, date=self.today, meal_type=meal_type)
+
+    def test_marks_and_charges_only_missing_students(self):
+        last = self.create_student('last', coupons=1)
+        mark_student_attendance(self.students[0], self.provider.unique_id)
+        StudentHoliday.objects.create(student=self.students[1], mess_plan=self.plan, date=self.today, meal_type='LUNCH')
+
+        self.assertEqual(self.mark(), 2)
+
+        statuses = dict(Attendance.objects.values_list('student_id', 'status'))
+        self.assertEqual(statuses, {
+            self.students[0].id: Attendance.Status.PRESENT,
+            self.students[2].id: Attendance.Status.ABSENT,
+            last.id: Attendance.Status.ABSENT,
+        })
+        subscriptions = {sub.student_id: sub for sub in ActiveSubscription.objects.all()}
+        self.assertEqual(subscriptions[self.students[1].id].remaining_coupons, self.coupons)
+        self.assertEqual(subscriptions[self.students[2].id].remaining_coupons, self.coupons - 1)
+        self.assertEqual((subscriptions[last.id].remaining_coupons, subscriptions[last.id].is_active), (0, False))
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual((summary.present_count, summary.absent_count), (1, 2))
+
+        self.assertEqual(self.mark(), 0)
+
+    def test_running_twice_charges_once(self):
+        self.assertEqual(self.mark(), len(self.students))
+        self.assertEqual(self.mark(), 0)
+
+        self.assertEqual(set(ActiveSubscription.objects.values_list('remaining_coupons', flat=True)), {self.coupons - 1})
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.absent_count, len(self.students))
+
+    def test_conflicting_insert_is_retried_without_double_charging(self):
+        # A scan or another run wrote one of the records after the absent set was read
+        bulk_create = Attendance.objects.bulk_create
+        calls = []
+
+        def racing_bulk_create(rows, **kwargs):
+            calls.append(len(rows))
+            if len(calls) == 1:
+                raise IntegrityError("UNIQUE constraint failed")
+            return bulk_create(rows, **kwargs)
+
+        with mock.patch.object(Attendance.objects, 'bulk_create', side_effect=racing_bulk_create):
+            self.assertEqual(self.mark(), len(self.students))
+
+        self.assertEqual(calls, [len(self.students)] * 2)
+        self.assertEqual(set(ActiveSubscription.objects.values_list('remaining_coupons', flat=True)), {self.coupons - 1})
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.absent_count, len(self.students))
+
+    def test_queries_do_not_grow_with_subscribers(self):
+        with CaptureQueriesContext(connection) as few:
+            self.mark('LUNCH')
+        for i in range(20):
+            self.create_student(f'extra{i}')
+        with CaptureQueriesContext(connection) as many:
+            self.assertEqual(self.mark('DINNER'), 23)
+
+        self.assertEqual(len(few), len(many))
+
+    def test_mess_holiday_marks_nobody(self):
+        MessHoliday.objects.create(provider=self.provider, date=self.today, meal_type='BOTH')
+
+        self.assertEqual(self.mark(), 0)
+        self.assertFalse(Attendance.objects.exists())
+
+
+class ScanTests(MessFixtureMixin, TestCase):
+
+    def scan(self, student):
+        return mark_student_attendance(student, self.provider.unique_id)
+
+    def subscription(self, student):
+        return ActiveSubscription.objects.get(student=student)
+
+    def test_successful_scan_query_count(self):
+        self.scan(self.students[1])
+
+        with self.assertNumQueries(6):
+            success, message = self.scan(self.students[0])
+
+        self.assertTrue(success, message)
+        self.assertEqual(self.subscription(self.students[0]).remaining_coupons, self.coupons - 1)
+
+    def test_rejections(self):
+        self.assertEqual(mark_student_attendance(self.students[0], 'nope'), (False, "Invalid provider QR code."))
+        outsider = User.objects.create_user(
+            username='outsider', email='outsider@example.com', password='x', role=User.Role.STUDENT
+        )
+        self.assertIn("do not have an active subscription", self.scan(outsider)[1])
+
+        self.assertTrue(self.scan(self.students[0])[0])
+        self.assertEqual(self.scan(self.students[0]), (False, "You have already marked your attendance for today's lunch."))
+
+        self.lunch.is_active = False
+        self.lunch.save()
+        invalidate_active_meal(self.provider.unique_id)
+        self.assertEqual(self.scan(self.students[1]), (False, "This mess is not currently active for any meal."))
+        self.assertEqual(self.subscription(self.students[0]).remaining_coupons, self.coupons - 1)
+
+    def test_last_coupon_deactivates_subscription(self):
+        student = self.create_student('last', coupons=1)
+
+        self.assertTrue(self.scan(student)[0])
+
+        subscription = self.subscription(student)
+        self.assertEqual((subscription.remaining_coupons, subscription.is_active), (0, False))
+        self.lunch.is_active = False
+        self.lunch.save()
+        MessStatus.objects.create(provider=self.provider, date=self.today, meal_type='DINNER', is_active=True)
+        invalidate_active_meal(self.provider.unique_id)
+        self.assertIn("do not have an active subscription", self.scan(student)[1])
+
+    def test_lost_insert_race_spends_nothing(self):
+        # A concurrent scan inserted the row after this one's already-marked check
+        Attendance.objects.create(
+            student=self.students[0], provider=self.provider, mess_plan=self.plan,
+            date=self.today, meal_type='LUNCH', status=Attendance.Status.PRESENT,
+        )
+        with mock.patch('student.services.Exists', return_value=Value(False)):
+            success, message = self.scan(self.students[0])
+
+        self.assertFalse(success)
+        self.assertIn("already marked", message)
+        self.assertEqual(self.subscription(self.students[0]).remaining_coupons, self.coupons)
+        self.assertFalse(AttendanceSummary.objects.exists())
+
+
+class ActiveMealCacheTests(MessFixtureMixin, TestCase):
+
+    def provider_request(self, **data):
+        request = RequestFactory().post('/', data)
+        request.user = self.provider
+        request._messages = mock.MagicMock()
+        return request
+
+    def test_lookups_are_cached(self):
+        self.assertEqual(get_active_meal(self.provider.unique_id), (self.provider.id, 'LUNCH'))
+        self.assertEqual(get_active_meal('nope'), (None, None))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_active_meal(self.provider.unique_id), (self.provider.id, 'LUNCH'))
+            self.assertEqual(get_active_meal('nope'), (None, None))
+
+    def test_start_and_stop_invalidate(self):
+        dish = MenuItem.objects.create(provider=self.provider, dish_name='Thali')
+        self.assertEqual(get_active_meal(self.provider.unique_id), (self.provider.id, 'LUNCH'))
+
+        provider_views.stop_mess(self.provider_request(), 'lunch')
+        self.assertEqual(get_active_meal(self.provider.unique_id), (self.provider.id, None))
+
+        provider_views.start_mess(self.provider_request(menu_items=[dish.id]), 'dinner')
+        self.assertEqual(get_active_meal(self.provider.unique_id), (self.provider.id, 'DINNER'))
+
+
+@override_settings(SCAN_INGESTION_MODE='buffered')
+class BufferedScanTests(MessFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.buffer = ScanBuffer(background=False)
+        patcher = mock.patch('student.services.get_scan_buffer', return_value=self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def scan(self, student):
+        return mark_student_attendance(student, self.provider.unique_id)
+
+    def coupons_left(self):
+        return dict(ActiveSubscription.objects.values_list('student_id', 'remaining_coupons'))
+
+    def test_scans_are_provisional_until_flushed(self):
+        self.assertTrue(self.scan(self.students[0])[0])
+        with self.assertNumQueries(0):
+            self.assertTrue(self.scan(self.students[1])[0])
+            self.assertEqual(
+                self.scan(self.students[0]), (False, "You have already marked your attendance for today's lunch.")
+            )
+        self.assertFalse(Attendance.objects.exists())
+
+        self.assertEqual(self.buffer.flush(), 2)
+
+        self.assertEqual(Attendance.objects.filter(status=Attendance.Status.PRESENT).count(), 2)
+        left = self.coupons_left()
+        self.assertEqual([left[s.id] for s in self.students], [self.coupons - 1, self.coupons - 1, self.coupons])
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.present_count, 2)
+
+    def test_flush_rejects_scans_the_database_disagrees_with(self):
+        last = self.create_student('last', coupons=1)
+        for student in (self.students[0], self.students[1], last):
+            self.assertTrue(self.scan(student)[0])
+        # Written meanwhile by another process
+        Attendance.objects.create(
+            student=self.students[0], provider=self.provider, mess_plan=self.plan,
+            date=self.today, meal_type='LUNCH', status=Attendance.Status.PRESENT,
+        )
+
+        self.assertEqual(self.buffer.flush(), 2)
+
+        left = self.coupons_left()
+        self.assertEqual(left[self.students[0].id], self.coupons)
+        self.assertEqual(left[self.students[1].id], self.coupons - 1)
+        self.assertFalse(ActiveSubscription.objects.get(student=last).is_active)
+        notice = Notification.objects.get()
+        self.assertEqual(notice.recipient, self.students[0])
+        self.assertIn("already marked", notice.message)
+
+    def test_students_off_the_roster_are_checked_synchronously(self):
+        self.assertTrue(self.scan(self.students[0])[0])
+        late = self.create_student('late')
+
+        self.assertEqual(self.scan(late), (True, "Success! Attendance marked for lunch. One coupon has been used."))
+        self.assertEqual(self.buffer.pending(), 1)
+
+    def test_marking_absences_flushes_first(self):
+        self.scan(self.students[0])
+        with mock.patch('student.scan_buffer._scan_buffer', self.buffer):
+            mark_absent_students(provider=self.provider.id, date=self.today, meal_type='LUNCH')
+
+        statuses = dict(Attendance.objects.values_list('student_id', 'status'))
+        self.assertEqual(statuses[self.students[0].id], Attendance.Status.PRESENT)
+        self.assertEqual(statuses[self.students[1].id], Attendance.Status.ABSENT)
+
+
+class BatchScanTests(MessFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Uploaded scans are dated in local time
+        self.today = timezone.localdate()
+        self.device, self.token = ScanDevice.issue(self.provider, 'Counter 1')
+
+    def upload(self, scans, key='device-1', token=None):
+        request = RequestFactory().post(
+            '/', json.dumps({'idempotency_key': key, 'scans': scans}), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token or self.token}',
+        )
+        request.user = AnonymousUser()
+        response = provider_views.upload_scan_batch(request)
+        return response.status_code, json.loads(response.content)
+
+    def scan(self, student, meal_type='LUNCH', scanned_at=None):
+        unique_id = student if isinstance(student, str) else student.unique_id
+        return {'student': unique_id, 'scanned_at': (scanned_at or timezone.now()).isoformat(), 'meal_type': meal_type}
+
+    def coupons_left(self):
+        return dict(ActiveSubscription.objects.values_list('student_id', 'remaining_coupons'))
+
+    def test_per_item_results(self):
+        status, body = self.upload([
+            self.scan(self.students[0]),
+            self.scan(self.students[1]),
+            self.scan(self.students[0]),
+            self.scan('STU-NOPE'),
+            self.scan(self.students[2], meal_type='BREAKFAST'),
+            self.scan(self.students[2], scanned_at=timezone.now() + timedelta(days=2)),
+        ])
+
+        self.assertEqual(status, 200)
+        self.assertEqual((body['accepted'], body['rejected'], body['replayed']), (2, 4, False))
+        self.assertEqual(
+            [result['code'] for result in body['results']],
+            ['marked', 'marked', 'already_marked', 'unknown_student', 'invalid', 'invalid'],
+        )
+        left = self.coupons_left()
+        self.assertEqual([left[s.id] for s in self.students], [self.coupons - 1, self.coupons - 1, self.coupons])
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.present_count, 2)
+
+    def test_retried_upload_is_not_charged_again(self):
+        scans = [self.scan(student) for student in self.students]
+        first = self.upload(scans)
+
+        # The device lookup and the stored batch
+        with self.assertNumQueries(2):
+            status, body = self.upload(scans)
+
+        self.assertEqual(status, 200)
+        self.assertTrue(body['replayed'])
+        self.assertEqual(body['results'], first[1]['results'])
+        self.assertEqual(set(self.coupons_left().values()), {self.coupons - 1})
+        self.assertEqual(self.upload(scans[:1])[0], 409)
+
+    def test_late_scan_corrects_an_absence(self):
+        mark_absent_students(provider=self.provider.id, date=self.today, meal_type='LUNCH')
+
+        status, body = self.upload([self.scan(self.students[0])])
+
+        self.assertEqual(body['results'][0]['code'], 'absence_corrected')
+        self.assertEqual(Attendance.objects.get(student=self.students[0]).status, Attendance.Status.PRESENT)
+        self.assertEqual(self.coupons_left()[self.students[0].id], self.coupons - 1)
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual((summary.present_count, summary.absent_count), (1, 2))
+
+    def test_scans_are_dated_in_local_time(self):
+        # Five past midnight yesterday, local time, is still the day before in UTC
+        yesterday = self.today - timedelta(days=1)
+        just_after_midnight = timezone.make_aware(datetime.combine(yesterday, time(0, 5)))
+
+        status, body = self.upload([self.scan(self.students[0], scanned_at=just_after_midnight)])
+
+        self.assertEqual(body['results'][0]['code'], 'marked')
+        self.assertEqual(Attendance.objects.get(student=self.students[0]).date, yesterday)
+
+    def test_stale_scans_are_rejected(self):
+        now = timezone.now()
+        status, body = self.upload([
+            self.scan(self.students[0], scanned_at=now - timedelta(days=1)),
+            self.scan(self.students[1], scanned_at=now - timedelta(days=3)),
+        ])
+
+        self.assertEqual([result['code'] for result in body['results']], ['marked', 'invalid'])
+        self.assertEqual(self.coupons_left()[self.students[1].id], self.coupons)
+        with self.settings(SCAN_BATCH_MAX_AGE=3):
+            status, body = self.upload([self.scan(self.students[1], scanned_at=now - timedelta(days=3))], key='older')
+        self.assertEqual(body['results'][0]['code'], 'marked')
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as one:
+            self.upload([self.scan(self.students[0])], key='one')
+        with CaptureQueriesContext(connection) as many:
+            self.upload([self.scan(student, 'DINNER') for student in self.students], key='many')
+
+        self.assertEqual(len(one), len(many))
+
+    def test_only_provider_devices_upload(self):
+        self.assertEqual(self.upload([self.scan(self.students[1])], token='not-a-token')[0], 401)
+        self.device.is_active = False
+        self.device.save()
+        self.assertEqual(self.upload([self.scan(self.students[1])])[0], 401)
+
+        # A device registered to an account that is no longer a provider
+        _, token = ScanDevice.issue(self.students[0], 'Stolen')
+        self.assertEqual(self.upload([self.scan(self.students[1])], token=token)[0], 403)
+
+    def test_device_token_replaces_session_and_csrf(self):
+        body = json.dumps({'idempotency_key': 'csrf', 'scans': [self.scan(self.students[0])]})
+
+        # A logged-in provider without a device token gets JSON, not a login redirect
+        request = RequestFactory().post('/', body, content_type='application/json')
+        request.user = self.provider
+        response = provider_views.upload_scan_batch(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+        client = Client(enforce_csrf_checks=True)
+        url = reverse('upload_scan_batch')
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 401)
+        response = client.post(url, body, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['accepted'], 1)
+
+
+class ConcurrentScanTests(MessFixtureMixin, TransactionTestCase):
+
+    students_count = 40
+    coupons = 1
+
+    def scan(self, student):
+        try:
+            return mark_student_attendance(student, self.provider.unique_id)[0]
+        finally:
+            connection.close()
+
+    def test_parallel_duplicate_scans_spend_one_coupon_each(self):
+        scans = self.students * 5
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(self.scan, scans))
+
+        self.assertEqual(sum(results), len(self.students))
+        self.assertEqual(Attendance.objects.count(), len(self.students))
+        self.assertEqual(
+            list(ActiveSubscription.objects.values_list('remaining_coupons', 'is_active').distinct()), [(0, False)]
+        )
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.present_count, len(self.students))
+
+    def test_parallel_buffered_scans_spend_one_coupon_each(self):
+        buffer = ScanBuffer(flush_interval=0.05, max_scans=16)
+        scans = self.students * 5
+
+        with override_settings(SCAN_INGESTION_MODE='buffered'), \
+                mock.patch('student.services.get_scan_buffer', return_value=buffer):
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                results = list(pool.map(self.scan, scans))
+            buffer.close()
+
+        self.assertEqual(sum(results), len(self.students))
+        self.assertEqual(Attendance.objects.count(), len(self.students))
+        self.assertEqual(
+            list(ActiveSubscription.objects.values_list('remaining_coupons', 'is_active').distinct()), [(0, False)]
+        )
+        summary = AttendanceSummary.objects.get(provider=self.provider, date=self.today, meal_type='LUNCH')
+        self.assertEqual(summary.present_count, len(self.students))